@@ -0,0 +1,279 @@
+"""Replay captured traffic against the current code with a deterministic model.
+
+Traffic is captured by services/traffic_capture.py (set CAPTURE_DIR on the
+server). The replay runs main:app under uvicorn pointed at a stub model that
+answers each upstream call with the reply, usage and latency recorded for
+it, sends the captured requests one at a time in capture order, and captures
+the replay itself to measure per-route latency, stage times and tokens.
+Two code versions replaying the same capture see the same model; what
+differs is what the code sends and how long it takes.
+
+    cd python-backend
+    python -m bench.replay captures/ --out before.json
+    # switch versions (git checkout, or run from another worktree)
+    python -m bench.replay captures/ --out after.json
+    python -m bench.replay --compare before.json after.json
+
+Upstream calls are matched to recordings by system prompt and messages; when
+the new code changed the system prompt (or just the date in it) the messages
+alone are tried, then the system prompt alone. Calls with no recording get
+the canned stub reply and are counted as unmatched in the report.
+
+Routes that verify an access token (/api/advise, /api/similar) run against a
+local query-executor stand-in, which takes the token as the user id. Captures
+redact the token but keep the verified user's user-<hash>, and that is
+sent as the token, so replayed requests act as the same (pseudonymous) user.
+The stand-in defaults to an empty SQLite database with the incidents, tasks
+and assets tables, so lookups return no rows; pass --executor to point at a
+seeded one. Requests captured without a verified user are sent as
+"replay-user" and counted as unmapped in the report.
+"""
+import os
+import glob
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timezone
+
+import httpx
+
+from bench.run import _git_rev, _percentile, _start_app
+from bench.stub_servers import AnthropicStub, HeadlightsStub
+from services import traffic_capture
+from services.ai_service import ASSETS_SCHEMA, INCIDENTS_SCHEMA, TASKS_SCHEMA
+
+_USAGE_KEYS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+
+def _match_keys(request: dict) -> tuple[str, str, str]:
+    """Exact, messages-only and system-only keys for an upstream request."""
+    system = traffic_capture.redact(json.dumps(request.get("system", ""), sort_keys=True))
+    messages = traffic_capture.redact(json.dumps(request.get("messages", []), sort_keys=True))
+    return system + messages, messages, system
+
+
+class ReplayStub(AnthropicStub):
+    """AnthropicStub answering with recorded replies; repeats of a prompt cycle through its recordings."""
+
+    def __init__(self, exchanges: list[dict]):
+        super().__init__("fixed:0")
+        self._recorded = (defaultdict(deque), defaultdict(deque), defaultdict(deque))
+        for exchange in exchanges:
+            for recorded, key in zip(self._recorded, _match_keys(exchange["request"])):
+                recorded[key].append(exchange)
+        self.matches = Counter()
+
+    def respond(self, body: dict) -> dict:
+        with self.lock:
+            for tier, recorded, key in zip(("exact", "messages", "system"), self._recorded, _match_keys(body)):
+                candidates = recorded.get(key)
+                if candidates:
+                    exchange = candidates[0]
+                    candidates.rotate(-1)
+                    self.matches[tier] += 1
+                    break
+            else:
+                self.matches["unmatched"] += 1
+                return super().respond(body)
+        delay = exchange["latency_ms"] / 1000
+        first_token = exchange.get("first_token_ms")
+        return {
+            "text": exchange["text"],
+            "usage": {k: exchange["usage"].get(k, 0) for k in _USAGE_KEYS},
+            "delay": delay,
+            "first_token": first_token / 1000 if first_token is not None else delay / 4,
+        }
+
+
+def _load(paths: list[str]) -> list[dict]:
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "capture-*.jsonl*"))) if os.path.isdir(path) else [path])
+    records = []
+    for name in files:
+        with open(name, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return sorted(records, key=lambda r: r["ts"])
+
+
+def summarize(records: list[dict]) -> dict:
+    """Per-route request count, errors, latency percentiles, stage medians and mean tokens per request."""
+    by_route = defaultdict(list)
+    for r in records:
+        by_route[r.get("route") or r["path"]].append(r)
+
+    summary = {}
+    for route, rows in sorted(by_route.items()):
+        tokens = Counter()
+        stages = defaultdict(list)
+        for r in rows:
+            for call in r["upstream"]:
+                tokens.update({k: call["usage"].get(k, 0) for k in _USAGE_KEYS})
+            for stage, ms in r["stages"].items():
+                # Older captures redacted the first_token stage time along with secrets
+                if isinstance(ms, (int, float)):
+                    stages[stage].append(ms / 1000)
+        durations = [r["duration_ms"] / 1000 for r in rows]
+        first_bytes = [r["first_byte_ms"] / 1000 for r in rows if r.get("first_byte_ms") is not None]
+        summary[route] = {
+            "requests": len(rows),
+            "errors": sum(1 for r in rows if not r["status"] or r["status"] >= 400),
+            "p50_ms": _percentile(durations, 50),
+            "p95_ms": _percentile(durations, 95),
+            "first_byte_p50_ms": _percentile(first_bytes, 50),
+            "upstream_calls": round(sum(len(r["upstream"]) for r in rows) / len(rows), 2),
+            **{k: round(tokens[k] / len(rows), 1) for k in _USAGE_KEYS},
+            "stages_p50_ms": {stage: _percentile(v, 50) for stage, v in sorted(stages.items())},
+        }
+    return summary
+
+
+# Columns the backend reads itself (find_similar's reload) that the prompt schemas leave out
+_EXTRA_COLUMNS = {"incidents": ["description", "reported_by"]}
+
+
+def _stand_in_db(path: str) -> None:
+    """Empty SQLite copies of the tables lookups may query, columns taken from the prompt schemas."""
+    import re
+    import sqlite3
+
+    conn = sqlite3.connect(path)
+    try:
+        for schema in (INCIDENTS_SCHEMA, TASKS_SCHEMA, ASSETS_SCHEMA):
+            table = re.search(r"Table: (\w+)", schema).group(1)
+            columns = re.findall(r"^- (\w+):", schema, re.M) + _EXTRA_COLUMNS.get(table, [])
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _request_body(record: dict, auth: Counter):
+    """The captured body, with a redacted access token replaced by the captured (pseudonymous) user."""
+    body = record.get("request")
+    if not isinstance(body, dict) or "access_token" not in body:
+        return body
+    user_id = record.get("user_id")
+    auth["mapped" if user_id else "unmapped"] += 1
+    return {**body, "access_token": user_id or "replay-user"}
+
+
+def replay(records: list[dict], port: int, executor_url: str | None = None) -> tuple[list[dict], Counter, Counter]:
+    """Send records to a fresh app against a ReplayStub.
+
+    Returns the replay's own capture, upstream match counts and access-token mapping counts.
+    """
+    stub = ReplayStub([call for r in records for call in r["upstream"]]).start()
+    headlights_stub = HeadlightsStub("fixed:0").start()
+    capture_dir = tempfile.mkdtemp(prefix="bruce-replay-")
+    if not executor_url:
+        _stand_in_db(os.path.join(capture_dir, "lookups.db"))
+        executor_url = "sqlite:///" + os.path.join(capture_dir, "lookups.db")
+    env = {
+        **os.environ,
+        "ANTHROPIC_API_KEY": "replay",
+        "ANTHROPIC_BASE_URL": stub.url,
+        "HEADLIGHTS_SUPABASE_URL": headlights_stub.url,
+        "HEADLIGHTS_SUPABASE_KEY": "replay",
+        "CAPTURE_DIR": capture_dir,
+        "QUERY_EXECUTOR_URL": executor_url,
+    }
+    auth = Counter()
+    proc = _start_app(port, env)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=300) as client:
+            for n, r in enumerate(records, 1):
+                body = _request_body(r, auth)
+                kwargs = {"json": body} if isinstance(body, (dict, list)) else {"content": (body or "").encode()}
+                try:
+                    client.request(r["method"], r["path"], **kwargs).read()
+                except httpx.HTTPError as e:
+                    print(f"  {r['method']} {r['path']} failed: {e}")
+                if n % 100 == 0:
+                    print(f"  replayed {n}/{len(records)}")
+    finally:
+        # Graceful stop so the app flushes its capture file
+        proc.terminate()
+        proc.wait(30)
+        stub.shutdown()
+        headlights_stub.shutdown()
+    replayed = _load([capture_dir])
+    shutil.rmtree(capture_dir, ignore_errors=True)
+    return replayed, stub.matches, auth
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """Print per-route latency and token deltas between two replay reports."""
+    with open(before_path) as f:
+        before = json.load(f)["replay"]
+    with open(after_path) as f:
+        after = json.load(f)["replay"]
+
+    metrics = ("p50_ms", "p95_ms", "first_byte_p50_ms", "upstream_calls", *_USAGE_KEYS, "errors")
+    for route in sorted(before.keys() & after.keys()):
+        parts = []
+        for m in metrics:
+            old, new = before[route].get(m), after[route].get(m)
+            if old is None or new is None or old == new == 0:
+                continue
+            change = f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+            parts.append(f"{m}={old}->{new} ({change})")
+        print(f"{route:<28} " + "  ".join(parts))
+    for route in sorted(before.keys() ^ after.keys()):
+        print(f"{route:<28} only in {'before' if route in before else 'after'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("captures", nargs="*", help="capture files or CAPTURE_DIR directories")
+    parser.add_argument("--routes", help="comma-separated route templates to replay (default: all)")
+    parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    parser.add_argument("--executor", help="QUERY_EXECUTOR_URL for lookups (default: an empty SQLite stand-in)")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--out", help="write JSON results here")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if not args.captures:
+        parser.error("give capture files or directories to replay")
+
+    records = _load(args.captures)
+    if args.routes:
+        routes = set(args.routes.split(","))
+        records = [r for r in records if r.get("route") in routes]
+    records = records[:args.limit] if args.limit else records
+    print(f"Replaying {len(records)} requests")
+
+    replayed, matches, auth = replay(records, args.port, args.executor)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "requests": len(records),
+            "upstream_matches": dict(matches),
+            "access_tokens": dict(auth),
+        },
+        "captured": summarize(records),
+        "replay": summarize(replayed),
+    }
+    for route, s in report["replay"].items():
+        print(f"{route:<28} n={s['requests']:<5} p50={s['p50_ms']}ms p95={s['p95_ms']}ms "
+              f"in={s['input_tokens']} out={s['output_tokens']} errors={s['errors']}")
+    print(f"upstream calls matched: {dict(matches)}")
+    if auth:
+        print(f"access tokens mapped to captured users: {dict(auth)}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
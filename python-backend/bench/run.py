@@ -0,0 +1,298 @@
+"""Load benchmark for the FastAPI backend.
+
+Starts the Anthropic and Headlights stubs, runs main:app under uvicorn in a
+subprocess pointed at them, then drives each endpoint at increasing
+concurrency and writes the results as JSON.
+
+    cd python-backend
+    python -m bench.run --endpoints ask,diagnose --concurrency 1,8,32 --out before.json
+    python -m bench.run --compare before.json after.json
+
+Event-loop lag is measured from outside: a probe hits /health every 50 ms while
+the load runs, and its latency is reported. A blocked loop shows up there
+directly.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import httpx
+
+from bench.stub_servers import AnthropicStub, HeadlightsStub
+
+_TASKS = [
+    {"task_number": 12, "title": "Replace Oakdale nurse station printer", "priority": "high", "date_due": "2026-03-01"},
+    {"task_number": 14, "title": "Renew antivirus licences", "priority": None, "date_due": None},
+]
+
+_RESOLVED = [
+    {"id": f"inc-{i}", "task_number": i, "title": title, "description": f"{title}. Fixed on site."}
+    for i, title in enumerate(
+        ["Holden printer paper jam", "Oakdale laptop blue screen", "Reset PCC password", "Nurse station wifi drops",
+         "Front desk printer offline", "Replace UPS battery in IT closet"] * 50
+    )
+]
+
+# name -> (path, payload factory). {n} in payloads is a per-request counter so
+# response caches and single-flight don't turn the run into a cache benchmark.
+ENDPOINTS = {
+    "health": ("GET", "/health", None),
+    "track-click": ("POST", "/api/track-click", lambda n: {"user_email": f"bench{n % 50}@example.com"}),
+    "ask": ("POST", "/api/ask", lambda n: {"prompt": f"How do I map a network drive? ({n})", "user_email": "bench@example.com"}),
+    "ask-stream": ("POST", "/api/ask/stream", lambda n: {"prompt": f"How do I map a network drive? ({n})"}),
+    "summarize": ("POST", "/api/summarize", lambda n: {"description": f"Printer at Holden jams on every job #{n}"}),
+    "summarize-batch": ("POST", "/api/summarize/batch", lambda n: {
+        "descriptions": [f"Printer at Holden jams on every job #{n}-{i}" for i in range(20)],
+    }),
+    "similar": ("POST", "/api/similar", lambda n: {
+        "access_token": f"bench{n % 5}", "task_name": f"Holden printer jams on every job ({n})", "incidents": _RESOLVED,
+    }),
+    "generate-sql": ("POST", "/api/generate-sql", lambda n: {"question": f"open high priority tasks {n}", "target": "tasks"}),
+    "advise-plan": ("POST", "/api/advise/plan", lambda n: {"question": f"What should I do first? {n}", "in_progress_tasks": _TASKS}),
+    "advise-answer": ("POST", "/api/advise/answer", lambda n: {"question": f"What should I do first? {n}", "in_progress_tasks": _TASKS}),
+    "match-problem-type": ("POST", "/api/match-problem-type", lambda n: {
+        "description": f"things are weird today {n}",
+        "problem_types": ["intermittent_network_slowness: Intermittent Network Slowness", "backup_reliability: Backup Reliability"],
+    }),
+    "diagnose": ("POST", "/api/diagnose", lambda n: {
+        "problem_type": "intermittent_network_slowness", "information": f"Slow at Oakdale after 2pm ({n})",
+    }),
+    "diagnose-stream": ("POST", "/api/diagnose/stream", lambda n: {
+        "problem_type": "intermittent_network_slowness", "information": f"Slow at Oakdale after 2pm ({n})",
+    }),
+    "check-suggestions": ("POST", "/api/check-suggestions", lambda n: {"completed_tasks": [
+        {"task_number": n, "title": "Replaced UPS battery", "date_completed": "2025-06-01", "note": "Check again in 6 months"},
+    ]}),
+}
+
+
+def _percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return round(ordered[idx] * 1000, 2)
+
+
+def _proc_stats(pid: int) -> dict:
+    """Thread count and RSS of the server process (Linux /proc; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {
+            "threads": int(fields["Threads"].strip()),
+            "rss_mb": round(int(fields["VmRSS"].split()[0]) / 1024, 1),
+        }
+    except (OSError, KeyError, ValueError):
+        return {"threads": None, "rss_mb": None}
+
+
+async def _probe_loop_lag(client: httpx.AsyncClient, stop: asyncio.Event, samples: list[float]):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            await client.get("/health")
+            samples.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.05)
+
+
+async def _drive(base_url: str, endpoint: str, concurrency: int, requests: int, pid: int) -> dict:
+    method, path, payload = ENDPOINTS[endpoint]
+    latencies: list[float] = []
+    errors = 0
+    # Offset by wall-clock so payloads never repeat across steps of the same run
+    offset = time.time_ns() // 1000
+    counter = iter(range(offset, offset + requests))
+    peak = {"threads": 0, "rss_mb": 0.0}
+
+    limits = httpx.Limits(max_connections=concurrency + 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client, \
+            httpx.AsyncClient(base_url=base_url, timeout=30) as probe:
+
+        async def worker():
+            nonlocal errors
+            for n in counter:
+                start = time.perf_counter()
+                try:
+                    if method == "GET":
+                        resp = await client.get(path)
+                    else:
+                        resp = await client.post(path, json=payload(n))
+                    resp.read()
+                    if resp.status_code >= 400:
+                        errors += 1
+                    else:
+                        latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    errors += 1
+
+        async def sample_process(stop: asyncio.Event):
+            while not stop.is_set():
+                stats = _proc_stats(pid)
+                if stats["threads"] is not None:
+                    peak["threads"] = max(peak["threads"], stats["threads"])
+                    peak["rss_mb"] = max(peak["rss_mb"], stats["rss_mb"])
+                await asyncio.sleep(0.1)
+
+        stop = asyncio.Event()
+        lag: list[float] = []
+        background = [
+            asyncio.create_task(_probe_loop_lag(probe, stop, lag)),
+            asyncio.create_task(sample_process(stop)),
+        ]
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*background)
+
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "p99_ms": _percentile(latencies, 99),
+        "loop_lag_p50_ms": _percentile(lag, 50),
+        "loop_lag_p99_ms": _percentile(lag, 99),
+        "loop_lag_max_ms": _percentile(lag, 100),
+        "peak_threads": peak["threads"] or None,
+        "peak_rss_mb": peak["rss_mb"] or None,
+    }
+
+
+def _start_app(port: int, env: dict) -> subprocess.Popen:
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.Popen(
+        [sys.executable, "-X", "utf8", "-m", "uvicorn", "main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=backend_dir, env=env,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            raise RuntimeError("Backend exited during startup")
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("Backend did not become healthy within 30s")
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> dict:
+    anthropic_stub = AnthropicStub(args.latency, args.output_tokens).start()
+    headlights_stub = HeadlightsStub(args.headlights_latency).start()
+    env = {
+        **os.environ,
+        "ANTHROPIC_API_KEY": "bench",
+        "ANTHROPIC_BASE_URL": anthropic_stub.url,
+        "HEADLIGHTS_SUPABASE_URL": headlights_stub.url,
+        "HEADLIGHTS_SUPABASE_KEY": "bench",
+        # Local stand-in, which takes the access token as the user id (no Supabase Auth to call)
+        "QUERY_EXECUTOR_URL": "sqlite:///" + os.path.join(tempfile.gettempdir(), "bruce-bench.db"),
+    }
+    proc = _start_app(args.port, env)
+    results = []
+    try:
+        for endpoint in args.endpoints.split(","):
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                requests = max(args.requests, concurrency * 2)
+                result = asyncio.run(_drive(f"http://127.0.0.1:{args.port}", endpoint, concurrency, requests, proc.pid))
+                results.append(result)
+                print(
+                    f"{endpoint:<20} c={concurrency:<4} rps={result['rps']:<8} "
+                    f"p50={result['p50_ms']}ms p99={result['p99_ms']}ms "
+                    f"lag_p99={result['loop_lag_p99_ms']}ms threads={result['peak_threads']} "
+                    f"errors={result['errors']}"
+                )
+    finally:
+        proc.terminate()
+        proc.wait(10)
+        anthropic_stub.shutdown()
+        headlights_stub.shutdown()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "latency": args.latency,
+            "headlights_latency": args.headlights_latency,
+            "upstream_requests": anthropic_stub.requests,
+            "headlights_requests": headlights_stub.requests,
+        },
+        "results": results,
+    }
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """Print per-endpoint/concurrency deltas between two result files."""
+    with open(before_path) as f:
+        before = {(r["endpoint"], r["concurrency"]): r for r in json.load(f)["results"]}
+    with open(after_path) as f:
+        after = {(r["endpoint"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    metrics = ("rps", "p50_ms", "p95_ms", "p99_ms", "loop_lag_p99_ms", "peak_threads", "peak_rss_mb")
+    for key in sorted(before.keys() & after.keys()):
+        parts = []
+        for m in metrics:
+            old, new = before[key].get(m), after[key].get(m)
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+            parts.append(f"{m}={old}->{new} ({change})")
+        print(f"{key[0]:<20} c={key[1]:<4} " + "  ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default="health,ask,summarize,diagnose,advise-answer")
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint/concurrency step")
+    parser.add_argument("--latency", default="lognormal:800:0.5", help="stub model latency spec")
+    parser.add_argument("--output-tokens", type=int, default=0, help="fixed output token count (0 = from text)")
+    parser.add_argument("--headlights-latency", default="fixed:20")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--out", help="write JSON results here")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    unknown = set(args.endpoints.split(",")) - ENDPOINTS.keys()
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    report = run(args)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
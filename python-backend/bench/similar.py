@@ -0,0 +1,125 @@
+"""Build and query benchmark for the similar-incidents index.
+
+Generates a synthetic incident history (realistic IT titles and descriptions
+with varied wording), then times a cold build, a no-change resync, an
+incremental resync with 1% of incidents edited or added, and top-k queries.
+No servers needed; this measures services.similar_incidents directly.
+
+    cd python-backend
+    python -m bench.similar --sizes 10000,100000 --out similar.json
+"""
+import gc
+import json
+import time
+import random
+import argparse
+import platform
+from datetime import datetime, timezone
+
+from bench.run import _git_rev, _percentile
+from services import similar_incidents
+
+_DEVICES = ["printer", "laptop", "desktop", "monitor", "scanner", "badge reader", "phone", "iPad",
+            "access point", "switch", "label printer", "fax", "docking station", "webcam", "UPS"]
+_PLACES = ["Holden", "Oakdale", "Business Office", "IT Office", "nurse station", "med room",
+           "front desk", "kitchen", "therapy gym", "unit 2", "unit 3", "admissions"]
+_PROBLEMS = ["not printing", "keeps crashing", "won't power on", "blue screen on boot", "paper jam",
+             "slow to load", "no network connection", "drops wifi", "password expired", "locked out",
+             "toner low", "no sound", "screen flickering", "can't scan to email", "cert warning",
+             "stuck in update loop", "fan noise", "battery won't charge", "shared drive missing",
+             "PointClickCare slow", "Outlook not syncing", "Teams camera not detected"]
+_DETAILS = ["Reported by the charge nurse", "Happened after the weekend", "Started after Windows update",
+            "Only in the morning", "Restarted and it came back", "Swapped the cable",
+            "Vendor ticket opened", "Replaced with a spare", "Driver reinstalled", "Cleared the queue",
+            "Reset the profile", "Re-added to the security group", "Firmware updated",
+            "Moved to the 5 GHz network", "Power cycled the switch", "User retrained"]
+
+
+def _incident(rng: random.Random, n: int) -> dict:
+    device, place, problem = rng.choice(_DEVICES), rng.choice(_PLACES), rng.choice(_PROBLEMS)
+    details = ". ".join(rng.sample(_DETAILS, 2))
+    return {
+        "id": f"inc-{n}",
+        "task_number": n,
+        "title": f"{place} {device} {problem}",
+        "description": f"The {device} at {place} {problem}. {details}. Asset {rng.randint(1000, 9999)}.",
+        "reported_by": rng.choice([None, "Dana", "Lee", "Morgan", "Sam"]),
+        "priority": rng.choice([None, "High", "Medium", "Low"]),
+    }
+
+
+def _time(fn) -> tuple[float, object]:
+    """Seconds fn took, and its result."""
+    gc.collect()
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def bench_size(size: int, queries: int, k: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    incidents = [_incident(rng, n) for n in range(size)]
+    user = f"bench-{size}"
+    similar_incidents.drop(user)
+
+    build_s, _ = _time(lambda: similar_incidents.sync(user, incidents))
+    resync_s, _ = _time(lambda: similar_incidents.sync(user, incidents))
+
+    changed = list(incidents)
+    for i in rng.sample(range(size), size // 200):
+        changed[i] = {**changed[i], "description": changed[i]["description"] + " Reopened, same symptom."}
+    changed.extend(_incident(rng, size + n) for n in range(size // 200))
+    incremental_s, changes = _time(lambda: similar_incidents.sync(user, changed))
+
+    latencies = []
+    for _ in range(queries):
+        query = f"{rng.choice(_DEVICES)} {rng.choice(_PROBLEMS)} at {rng.choice(_PLACES)}"
+        seconds, _ = _time(lambda: similar_incidents.search(user, query, k))
+        latencies.append(seconds)
+
+    similar_incidents.drop(user)
+    return {
+        "incidents": size,
+        "build_ms": round(build_s * 1000, 1),
+        "resync_unchanged_ms": round(resync_s * 1000, 1),
+        "resync_1pct_ms": round(incremental_s * 1000, 1),
+        "resync_changes": changes,
+        "query_p50_ms": _percentile(latencies, 50),
+        "query_p95_ms": _percentile(latencies, 95),
+        "query_max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="write JSON results here")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        r = bench_size(size, args.queries, args.k, args.seed)
+        results.append(r)
+        print(f"{size:>7} incidents  build {r['build_ms']:.0f}ms  resync {r['resync_unchanged_ms']:.0f}ms  "
+              f"1% changed {r['resync_1pct_ms']:.0f}ms  query p50 {r['query_p50_ms']}ms p95 {r['query_p95_ms']}ms")
+
+    if args.out:
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "git_rev": _git_rev(),
+                "python": platform.python_version(),
+                "k": args.k,
+            },
+            "results": results,
+        }
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Check services.sql_guard against a corpus of model-style queries.
+
+Each query has an expected outcome (accepted as-is, rewritten, or rejected);
+the run reports mismatches, the cost of a cold check versus a shape-cache
+hit, and, with --db, runs every accepted query against a stand-in database
+seeded with two users' rows to confirm it only ever returns the caller's.
+
+    cd python-backend
+    python -m bench.sql_guard                       # scratch SQLite file
+    python -m bench.sql_guard --db postgresql://localhost/bruce_test
+
+Against SQLite, Postgres-only queries (jsonb functions, ILIKE, ::casts) are
+validated but not run.
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+from bench.run import _percentile
+from services import query_executor, sql_guard
+
+_TASKS, _INCIDENTS = {"tasks"}, {"incidents", "assets"}
+
+# (tables, query, expected: "ok" | "rewrite" | "reject")
+_CORPUS = [
+    (_TASKS, "SELECT * FROM tasks WHERE user_id = '{user_id}' AND status = 'Completed' LIMIT 20", "ok"),
+    (_TASKS, "SELECT task_name, date_completed FROM tasks WHERE user_id = '{user_id}' "
+             "AND date_completed >= '2026-01-01' ORDER BY date_completed DESC", "rewrite"),
+    (_TASKS, "SELECT * FROM tasks WHERE status = 'Open' ORDER BY created_at DESC", "rewrite"),
+    (_TASKS, "SELECT count(*) AS n FROM tasks t WHERE priority = 'High' OR priority = 'Critical'", "rewrite"),
+    (_TASKS, "SELECT * FROM tasks WHERE user_id = '{user_id}' LIMIT 5000", "rewrite"),
+    (_TASKS, "SELECT * FROM tasks WHERE user_id = '{user_id}' AND EXISTS (SELECT 1 FROM "
+             "jsonb_array_elements(issues_comments) c WHERE c->>'text' ILIKE '%printer%')", "rewrite"),
+    (_TASKS, "SELECT * FROM tasks WHERE user_id = '{user_id}' OR 1 = 1", "rewrite"),
+    (_TASKS, "SELECT * FROM tasks WHERE user_id = '{user_id}'; DELETE FROM tasks", "reject"),
+    (_TASKS, "UPDATE tasks SET status = 'Completed' WHERE user_id = '{user_id}'", "reject"),
+    (_TASKS, "SELECT * FROM auth.users", "reject"),
+    (_TASKS, "SELECT pg_sleep(30), * FROM tasks WHERE user_id = '{user_id}'", "reject"),
+    (_INCIDENTS, "SELECT title, status FROM incidents WHERE user_id = '{user_id}' AND status = 'resolved' "
+                 "ORDER BY created_at DESC LIMIT 10", "ok"),
+    (_INCIDENTS, "SELECT name, warranty_expires FROM assets WHERE user_id = '{user_id}' "
+                 "AND warranty_expires < '2027-01-01' ORDER BY warranty_expires", "rewrite"),
+    (_INCIDENTS, "SELECT a.name, i.title FROM assets a JOIN incidents i ON i.user_id = '{user_id}' "
+                 "WHERE a.user_id = '{user_id}' LIMIT 25", "ok"),
+    (_INCIDENTS, "SELECT a.name, i.title FROM assets a JOIN incidents i ON i.title LIKE '%' || a.name || '%' "
+                 "WHERE a.user_id = '{user_id}'", "reject"),
+    (_INCIDENTS, "WITH open AS (SELECT * FROM incidents WHERE user_id = '{user_id}' AND status <> 'resolved') "
+                 "SELECT title FROM open ORDER BY created_at", "rewrite"),
+    (_INCIDENTS, "SELECT title FROM incidents WHERE user_id = '{user_id}' UNION SELECT name FROM assets", "reject"),
+    (_INCIDENTS, "SELECT * FROM tasks WHERE user_id = '{user_id}'", "reject"),
+]
+
+_SCHEMA = """
+CREATE TABLE tasks (id TEXT, user_id TEXT, task_number INTEGER, task_name TEXT, status TEXT,
+                    priority TEXT, date_completed TEXT, created_at TEXT, issues_comments TEXT);
+CREATE TABLE incidents (id TEXT, user_id TEXT, task_number INTEGER, title TEXT, status TEXT, created_at TEXT);
+CREATE TABLE assets (id TEXT, user_id TEXT, name TEXT, warranty_expires TEXT);
+"""
+_USERS = ("user-a", "user-b")
+
+
+def _seed(path: str) -> None:
+    import sqlite3
+
+    conn = sqlite3.connect(path)
+    conn.executescript(_SCHEMA)
+    for u in _USERS:
+        for n in range(300):
+            conn.execute("INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?, '[]')", (
+                f"{u}-t{n}", u, n, f"Task {n}", ("Open", "Completed")[n % 2], ("High", "Low", "Critical")[n % 3],
+                f"2026-0{n % 9 + 1}-01", f"2026-0{n % 9 + 1}-01"))
+            conn.execute("INSERT INTO incidents VALUES (?, ?, ?, ?, ?, ?)", (
+                f"{u}-i{n}", u, n, f"Incident {n}", ("resolved", "pending")[n % 2], f"2026-0{n % 9 + 1}-01"))
+            conn.execute("INSERT INTO assets VALUES (?, ?, ?, ?)", (
+                f"{u}-a{n}", u, f"Asset {n}", f"202{6 + n % 3}-06-01"))
+    conn.commit()
+    conn.close()
+
+
+def _postgres_only(sql: str) -> bool:
+    low = sql.lower()
+    return "jsonb" in low or "ilike" in low or "::" in low
+
+
+def _check(tables, sql):
+    try:
+        return sql_guard.check(sql, tables)
+    except sql_guard.UnsafeSqlError as e:
+        return e
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="QUERY_EXECUTOR_URL-style target (default: scratch SQLite file)")
+    parser.add_argument("--repeat", type=int, default=200, help="checks per query for timing")
+    args = parser.parse_args()
+
+    failures = 0
+    for tables, sql, expected in _CORPUS:
+        result = _check(tables, sql)
+        if isinstance(result, Exception):
+            outcome, detail = "reject", str(result)
+        else:
+            outcome = "rewrite" if result["rewrites"] else "ok"
+            detail = ", ".join(result["rewrites"] + [f"flag:{f}" for f in result["flags"]])
+        mark = "  " if outcome == expected else "!!"
+        failures += outcome != expected
+        print(f"{mark} {outcome:<7} {sql[:70]:<70} {detail}")
+
+    # Cold: a fresh cache for every check; warm: same shapes with different literals
+    cold, warm = [], []
+    for _ in range(args.repeat):
+        for tables, sql, _ in _CORPUS:
+            sql_guard._shapes.clear()
+            start = time.perf_counter()
+            _check(tables, sql)
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            _check(tables, sql.replace("2026", "2025").replace("'Open'", "'Closed'"))
+            warm.append(time.perf_counter() - start)
+    print(f"check  cold p50 {_percentile(cold, 50)}ms p95 {_percentile(cold, 95)}ms   "
+          f"cached p50 {_percentile(warm, 50)}ms p95 {_percentile(warm, 95)}ms")
+
+    scratch = None
+    if args.db:
+        executor = query_executor.PostgresExecutor(args.db) if args.db.startswith("postgres") \
+            else query_executor.SqliteExecutor(args.db[len("sqlite:///"):])
+    else:
+        with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as f:
+            scratch = f.name
+        _seed(scratch)
+        executor = query_executor.SqliteExecutor(scratch)
+    sqlite = isinstance(executor, query_executor.SqliteExecutor)
+
+    ran = 0
+    for tables, sql, _ in _CORPUS:
+        result = _check(tables, sql)
+        if isinstance(result, Exception) or (sqlite and _postgres_only(result["sql"])):
+            continue
+        for user in _USERS:
+            rows = asyncio.run(executor.execute(result["sql"], user))
+            ran += 1
+            leaked = [r for r in rows if r.get("user_id") not in (None, user)]
+            if leaked or len(rows) > sql_guard.MAX_ROWS:
+                failures += 1
+                print(f"!! {user}: {len(rows)} rows, {len(leaked)} from another user: {result['sql']}")
+    print(f"ran {ran} accepted queries against {'scratch SQLite' if scratch else args.db}")
+    if scratch:
+        os.remove(scratch)
+
+    print(json.dumps(sql_guard.stats))
+    if failures:
+        raise SystemExit(f"{failures} failures")
+
+
+if __name__ == "__main__":
+    main()
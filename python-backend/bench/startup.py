@@ -0,0 +1,137 @@
+"""Startup profile for the backend: import time and time to ready.
+
+Runs `python -X importtime -c "import main"` to break import cost down by
+module, then starts uvicorn against the bench stubs and times how long it
+takes until /health turns 200 (lifespan warm-up included).
+
+    cd python-backend
+    python -m bench.startup --out startup.json
+    python -m bench.startup --compare before.json after.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from bench.run import _git_rev, _start_app
+from bench.stub_servers import AnthropicStub, HeadlightsStub
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(env: dict, top: int) -> dict:
+    """Total import time of main plus the heaviest modules, in ms."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=_BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000, len(name) - len(name.lstrip())))
+
+    total = next((cum for name, _, cum, _ in rows if name == "main"), None)
+    # Depth 1 = imported directly by main (indent of two spaces under it)
+    direct = sorted(((name, cum) for name, _, cum, depth in rows if depth == 3), key=lambda r: -r[1])
+    heaviest = sorted(((name, own) for name, own, _, _ in rows), key=lambda r: -r[1])
+    return {
+        "total_ms": round(total, 1) if total is not None else None,
+        "direct_imports_ms": {name: round(ms, 1) for name, ms in direct[:top]},
+        "heaviest_self_ms": {name: round(ms, 1) for name, ms in heaviest[:top]},
+    }
+
+
+def time_to_ready(env: dict, port: int, workers: int) -> float:
+    """Seconds from spawning uvicorn until /health reports ready."""
+    start = time.perf_counter()
+    proc = _start_app(port, {**env, "WEB_CONCURRENCY": str(workers)})
+    elapsed = time.perf_counter() - start
+    proc.terminate()
+    proc.wait(10)
+    return round(elapsed, 3)
+
+
+def run(args) -> dict:
+    anthropic_stub = AnthropicStub("fixed:50").start()
+    headlights_stub = HeadlightsStub(args.headlights_latency).start()
+    env = {
+        **os.environ,
+        "ANTHROPIC_API_KEY": "bench",
+        "ANTHROPIC_BASE_URL": anthropic_stub.url,
+        "HEADLIGHTS_SUPABASE_URL": headlights_stub.url,
+        "HEADLIGHTS_SUPABASE_KEY": "bench",
+    }
+    try:
+        imports = [import_profile(env, args.top) for _ in range(args.repeat)]
+        ready = [time_to_ready(env, args.port, args.workers) for _ in range(args.repeat)]
+    finally:
+        anthropic_stub.shutdown()
+        headlights_stub.shutdown()
+
+    # Report the fastest run; slower ones are mostly a cold page cache
+    best = min(imports, key=lambda r: r["total_ms"] or 0)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "workers": args.workers,
+            "repeat": args.repeat,
+        },
+        "import": best,
+        "time_to_ready_s": min(ready),
+        "time_to_ready_runs_s": ready,
+    }
+
+
+def compare(before_path: str, after_path: str) -> None:
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def line(label: str, old, new, unit: str):
+        change = f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+        print(f"{label:<32} {old}{unit} -> {new}{unit} ({change})")
+
+    line("import main", before["import"]["total_ms"], after["import"]["total_ms"], "ms")
+    line("time to ready", before["time_to_ready_s"], after["time_to_ready_s"], "s")
+    old_direct = before["import"]["direct_imports_ms"]
+    for name, ms in after["import"]["direct_imports_ms"].items():
+        if name in old_direct:
+            line(f"  {name}", old_direct[name], ms, "ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="modules to list per table")
+    parser.add_argument("--headlights-latency", default="fixed:20")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--out", help="write JSON results here")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args)
+    print(f"import main: {report['import']['total_ms']}ms  time to ready: {report['time_to_ready_s']}s")
+    for name, ms in report["import"]["direct_imports_ms"].items():
+        print(f"  {name:<40} {ms}ms")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
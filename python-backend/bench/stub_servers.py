@@ -0,0 +1,258 @@
+"""Local stand-ins for the Anthropic Messages API and Headlights PostgREST.
+
+Both run as threaded HTTP servers in-process so a benchmark (or a developer)
+can point the backend at them with ANTHROPIC_BASE_URL / HEADLIGHTS_SUPABASE_URL
+and get realistic latency without spending tokens or touching production data.
+"""
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_latency(spec: str):
+    """Turn a latency spec into a function returning seconds.
+
+    fixed:MS                   always MS milliseconds
+    uniform:LO:HI              uniform between LO and HI ms
+    lognormal:MEDIAN:SIGMA     log-normal with the given median (ms) and sigma
+    """
+    kind, *args = spec.split(":")
+    nums = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda: nums[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(nums[0], nums[1]) / 1000
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(nums[0]), nums[1]) / 1000
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+def _canned_reply(body: dict) -> str:
+    """Return text shaped like what each ai_service endpoint expects back."""
+    system = json.dumps(body.get("system", ""))
+    if "Review the user's question" in system:
+        return json.dumps({"rephrasing": "You're asking about your tasks.", "sql": None, "lookup_description": None})
+    if "diagnosing an IT issue" in system:
+        return json.dumps({"response": "Check the switch uplink and recent changes.", "follow_up_questions": ["Which site?"]})
+    if "extract new hire information" in system:
+        return json.dumps({"firstName": "Jane", "lastName": "Doe", "role": "cna", "site": "holden",
+                           "startDate": "", "nextAssetNumber": "", "computerName": "", "notes": ""})
+    if "problem classifier" in system:
+        return json.dumps({"matches": ["intermittent_network_slowness"]})
+    if "past resolved tasks similar" in system:
+        # Keep the first two candidates, in the order given
+        numbers = re.findall(r"^#(\d+):", body["messages"][-1]["content"], re.MULTILINE)
+        return json.dumps([{"task_number": int(n), "similarity": "Same device and symptom."} for n in numbers[:2]])
+    if "follow-up suggestions" in system or "JSON array" in system:
+        return "[]"
+    if "SQL" in system:
+        return "SELECT * FROM tasks WHERE user_id = '{user_id}' LIMIT 50"
+    return "Stub answer " + "lorem ipsum " * 20
+
+
+class _AnthropicHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; with Nagle on, the body
+    # waits for the client's delayed ACK and every reply gains ~40 ms
+    disable_nagle_algorithm = True
+    server: "AnthropicStub"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        # Only GET /v1/models, which ai_service.warm_up uses to open a connection
+        out = json.dumps({"data": [], "has_more": False, "first_id": None, "last_id": None}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.count()
+        retry_after = self.server.admit()
+        if retry_after:
+            out = json.dumps({"type": "error", "error": {"type": "rate_limit_error", "message": "Stub rate limit"}}).encode()
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.send_header("retry-after", str(retry_after))
+            self.end_headers()
+            self.wfile.write(out)
+            return
+        reply = self.server.respond(body)
+        text, usage, delay = reply["text"], reply["usage"], reply["delay"]
+
+        if body.get("stream"):
+            self._stream(body, text, usage, delay, reply.get("first_token", delay / 4))
+            return
+
+        time.sleep(delay)
+        out = json.dumps({
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": body["model"],
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": usage,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def _stream(self, body: dict, text: str, usage: dict, delay: float, first_token: float):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(event: str, data: dict):
+            chunk = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.flush()
+
+        pieces = [text[i:i + 8] for i in range(0, len(text), 8)] or [""]
+        # Wait out time-to-first-token, then spread the rest of the latency over the deltas
+        time.sleep(first_token)
+        send("message_start", {"type": "message_start", "message": {
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": body["model"], "content": [],
+            "stop_reason": None, "stop_sequence": None,
+            "usage": {**usage, "output_tokens": 0}}})
+        send("content_block_start", {"type": "content_block_start", "index": 0,
+                                     "content_block": {"type": "text", "text": ""}})
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(max(0.0, delay - first_token) / (len(pieces) - 1))
+            send("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                         "delta": {"type": "text_delta", "text": piece}})
+        send("content_block_stop", {"type": "content_block_stop", "index": 0})
+        send("message_delta", {"type": "message_delta",
+                               "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                               "usage": {"output_tokens": usage["output_tokens"]}})
+        send("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class _HeadlightsHandler(BaseHTTPRequestHandler):
+    disable_nagle_algorithm = True
+    server: "HeadlightsStub"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body=None):
+        out = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def _read(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def do_GET(self):
+        self.server.count()
+        time.sleep(self.server.latency())
+        if self.path.startswith("/rest/v1/prompts"):
+            if "select=updated_at" in self.path:
+                self._reply(200, [{"updated_at": "2026-01-01T00:00:00Z"}])
+            else:
+                self._reply(200, [])
+        else:
+            self._reply(200, [])
+
+    def do_POST(self):
+        self.server.count()
+        body = self._read()
+        time.sleep(self.server.latency())
+        if self.path.startswith("/rest/v1/rpc/bruce_increment_usage"):
+            with self.server.lock:
+                for d in body.get("deltas", []):
+                    row = self.server.usage.setdefault(d["email"], {})
+                    for k, v in d.items():
+                        if k != "email":
+                            row[k] = row.get(k, 0) + v
+        self._reply(204)
+
+    def do_PATCH(self):
+        self.server.count()
+        self._read()
+        time.sleep(self.server.latency())
+        self._reply(204)
+
+
+class _Stub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-stream (cancelled/speculative calls) are expected
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    def __init__(self, handler, latency: str):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = parse_latency(latency)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def count(self):
+        with self.lock:
+            self.requests += 1
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class AnthropicStub(_Stub):
+    def __init__(self, latency: str = "lognormal:800:0.5", output_tokens: int = 0, rpm: int = 0):
+        super().__init__(_AnthropicHandler, latency)
+        self.output_tokens = output_tokens
+        # Requests per rolling minute before answering 429 (0 = unlimited)
+        self.rpm = rpm
+        self.rate_limited = 0
+        self._recent: list[float] = []
+
+    def respond(self, body: dict) -> dict:
+        """The reply to a request: text, usage, delay (seconds) and optionally first_token (seconds)."""
+        text = _canned_reply(body)
+        return {
+            "text": text,
+            "usage": {
+                "input_tokens": max(1, len(json.dumps(body)) // 4),
+                "output_tokens": self.output_tokens or max(1, len(text) // 4),
+            },
+            "delay": self.latency(),
+        }
+
+    def admit(self) -> int:
+        """0 if the request is within the stub's rate limit, else seconds to put in retry-after."""
+        if not self.rpm:
+            return 0
+        now = time.monotonic()
+        with self.lock:
+            self._recent = [t for t in self._recent if t > now - 60]
+            if len(self._recent) >= self.rpm:
+                self.rate_limited += 1
+                return max(1, int(self._recent[0] + 60 - now) + 1)
+            self._recent.append(now)
+            return 0
+
+
+class HeadlightsStub(_Stub):
+    def __init__(self, latency: str = "fixed:20"):
+        super().__init__(_HeadlightsHandler, latency)
+        self.usage: dict[str, dict] = {}
@@ -1,15 +1,103 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
+import os
+import time
+import asyncio
+import json
+import secrets
+from contextlib import asynccontextmanager
+
+import anthropic
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 from services import ai_service
+from services import headlights_tracker
+from services import prompt_loader
+from services import metrics
+from services import query_executor
+from services import model_router
+from services import postgrest
+from services import scheduler
+from services import response_cache
+from services import sql_guard
+from services import traffic_capture
+from services import deadlines
 
 load_dotenv()
 
-app = FastAPI(title="Bruce IT Backend")
 
+# Set once _warm_up() has finished; /health reports 503 until then
+_ready = asyncio.Event()
+
+
+async def _warm_up():
+    """Load prompts, build the Anthropic client and open caches before reporting ready."""
+    start = time.perf_counter()
+    steps = [
+        ("prompts", prompt_loader.start),
+        ("anthropic", ai_service.warm_up),
+        ("response_cache", lambda: asyncio.to_thread(response_cache.warm_up)),
+        ("routing", lambda: asyncio.to_thread(model_router.config)),
+    ]
+    for name, step in steps:
+        step_start = time.perf_counter()
+        try:
+            await step()
+        except Exception as e:
+            # A failed step only means the first request pays for it; still go ready
+            print(f"[main] Warm-up step {name} failed: {e}")
+        metrics.STARTUP.labels(name).set(time.perf_counter() - step_start)
+    _ready.set()
+    print(f"[main] Ready after {time.perf_counter() - start:.2f}s warm-up")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _ready.clear()
+    traffic_capture.start()
+    warm_up = asyncio.create_task(_warm_up())
+    yield
+    warm_up.cancel()
+    await prompt_loader.stop()
+    # Write out any usage deltas still buffered in the tracker before exiting
+    await asyncio.to_thread(headlights_tracker.shutdown)
+    await asyncio.to_thread(response_cache.shutdown)
+    postgrest.close()
+    traffic_capture.shutdown()
+    metrics.shutdown()
+
+
+app = FastAPI(title="Bruce IT Backend", lifespan=lifespan)
+
+@app.exception_handler(anthropic.RateLimitError)
+async def rate_limited(request, exc: anthropic.RateLimitError):
+    """Upstream rate limit still hit after the scheduler's retries: tell the caller when to come back."""
+    retry_after = exc.response.headers.get("retry-after", "10")
+    return JSONResponse({"detail": "AI provider rate limit reached"}, status_code=429, headers={"Retry-After": retry_after})
+
+
+@app.exception_handler(anthropic.InternalServerError)
+async def upstream_unavailable(request, exc: anthropic.InternalServerError):
+    return JSONResponse({"detail": "AI provider unavailable"}, status_code=503)
+
+
+@app.exception_handler(query_executor.AuthError)
+async def unauthorized(request, exc: query_executor.AuthError):
+    return JSONResponse({"detail": str(exc)}, status_code=401)
+
+
+@app.exception_handler(sql_guard.UnsafeSqlError)
+async def unsafe_sql(request, exc: sql_guard.UnsafeSqlError):
+    """Generated SQL the guard refused: the question needs rephrasing, retrying won't help."""
+    return JSONResponse({"detail": f"Generated query rejected: {exc}"}, status_code=422)
+
+
+app.add_middleware(deadlines.DeadlineMiddleware)
+app.add_middleware(traffic_capture.CaptureMiddleware)
+app.add_middleware(metrics.TimingMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://localhost:3002", "https://bruce-app-ryrt.vercel.app"],
@@ -30,6 +118,12 @@ class SummarizeRequest(BaseModel):
     user_email: str = ""
 
 
+class SummarizeBatchRequest(BaseModel):
+    descriptions: list[str] = Field(max_length=1000)
+    user_email: str = ""
+    stream: bool = False
+
+
 class GenerateSqlRequest(BaseModel):
     question: str
     target: str  # "tasks" or "assets"
@@ -55,15 +149,113 @@ class AdviseAnswerRequest(BaseModel):
     user_email: str = ""
 
 
+class AdviseRequest(BaseModel):
+    question: str
+    in_progress_tasks: list[dict] = []
+    # Caller's Supabase JWT; the lookup's user_id comes from verifying it, never from the body
+    access_token: str = ""
+    user_email: str = ""
+    stream: bool = False
+    speculative: bool | None = None  # None = ADVISE_SPECULATIVE default
+
+
+class SimilarRequest(BaseModel):
+    task_name: str
+    elaboration: str | None = None
+    # Caller's Supabase JWT; whose index is searched comes from verifying it, as for /api/advise
+    access_token: str = ""
+    incidents: list[dict] | None = None  # the caller's resolved incidents; None = the backend loads them itself
+    top_k: int = Field(8, ge=1, le=50)
+    rerank: bool = True
+    user_email: str = ""
+
+
+class RoutingUpdateRequest(BaseModel):
+    routes: dict[str, list[dict]] = {}
+    enabled: bool | None = None
+
+
 class TrackClickRequest(BaseModel):
     user_email: str = ""
 
 
+def _require_admin(token: str | None) -> None:
+    """Operator-only routes need X-Admin-Token matching ADMIN_TOKEN; with ADMIN_TOKEN unset they are off."""
+    expected = os.getenv("ADMIN_TOKEN", "")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin routes are disabled (ADMIN_TOKEN is not set)")
+    if not token or not secrets.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+def _sse(events) -> StreamingResponse:
+    """Wrap an async iterator of (event, data) pairs as a text/event-stream response."""
+    async def body():
+        try:
+            async for event, data in events:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            print(f"[main] Stream failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/health")
 def health():
+    """Readiness: 503 until warm-up has finished, so load balancers hold traffic until then."""
+    if not _ready.is_set():
+        return JSONResponse({"status": "starting"}, status_code=503)
     return {"status": "ok"}
 
 
+@app.get("/health/live")
+def live():
+    """Liveness: the process is up and serving, warm or not."""
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+def metrics_ep():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+
+@app.get("/api/scheduler")
+def scheduler_state():
+    """Upstream queue depth, in-flight calls and per-model rate-limit budget use."""
+    return scheduler.snapshot()
+
+
+@app.post("/api/prompts/reload")
+async def reload_prompts(x_admin_token: str | None = Header(None)):
+    """Re-fetch prompts from Headlights now instead of waiting for the next background refresh. Admin only."""
+    _require_admin(x_admin_token)
+    version = await asyncio.to_thread(prompt_loader.reload)
+    return {"version": version}
+
+
+@app.get("/api/routing")
+def get_routing():
+    """Current model routing rules and how often each route has been taken."""
+    return {"enabled": model_router.enabled(), "routes": model_router.config(), "stats": model_router.stats}
+
+
+@app.put("/api/routing")
+def update_routing(request: RoutingUpdateRequest, x_admin_token: str | None = Header(None)):
+    """Replace the routing rules for the given keys; takes effect on the next call. Admin only."""
+    _require_admin(x_admin_token)
+    try:
+        routes = model_router.update(request.routes, request.enabled)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"enabled": model_router.enabled(), "routes": routes}
+
+
 @app.post("/api/track-click")
 async def track_click(request: TrackClickRequest):
     """Increment the click counter for a user — called from the frontend on page navigation."""
@@ -88,16 +280,76 @@ async def ask(request: AskRequest):
     return {"text": text}
 
 
+@app.post("/api/ask/stream")
+async def ask_stream(request: AskRequest):
+    return _sse(ai_service.ask_stream(request.prompt, request.system, request.user_email))
+
+
 @app.post("/api/summarize")
 async def summarize(request: SummarizeRequest):
     title = await ai_service.summarize_incident(request.description, request.user_email)
     return {"title": title}
 
 
+@app.post("/api/summarize/batch")
+async def summarize_batch(request: SummarizeBatchRequest):
+    """Titles for many descriptions in one call; set stream to get each title as SSE in order."""
+    events = ai_service.summarize_incidents(request.descriptions, request.user_email)
+    if request.stream:
+        return _sse(events)
+    titles = []
+    async for event, data in events:
+        if event == "result":
+            titles.append(data["title"])
+        else:
+            return {"titles": titles, **data}
+
+
+@app.post("/api/similar")
+async def similar(request: SimilarRequest):
+    executor = query_executor.get_executor()
+    user_id = await executor.authenticate(request.access_token)
+    traffic_capture.user(user_id)
+
+    async def run_query(sql: str) -> list[dict]:
+        return await executor.execute(sql, user_id, request.access_token)
+
+    return await ai_service.find_similar(
+        user_id,
+        request.task_name,
+        request.elaboration,
+        request.incidents,
+        request.top_k,
+        request.rerank,
+        request.user_email,
+        run_query,
+    )
+
+
 @app.post("/api/generate-sql")
 async def generate_sql(request: GenerateSqlRequest):
-    sql = await ai_service.generate_sql(request.question, request.target, request.user_email)
-    return {"sql": sql}
+    checked = await ai_service.generate_sql(request.question, request.target, request.user_email)
+    return {"sql": checked["sql"], "flags": checked["flags"]}
+
+
+@app.post("/api/advise")
+async def advise(request: AdviseRequest):
+    """Plan + lookup + answer in one round-trip; set stream to get each phase as SSE."""
+    executor = query_executor.get_executor()
+    # Before any model call, so an unauthenticated request costs nothing upstream
+    user_id = await executor.authenticate(request.access_token)
+    traffic_capture.user(user_id)
+
+    async def run_query(sql: str) -> list[dict]:
+        return await executor.execute(sql, user_id, request.access_token)
+
+    if request.stream:
+        return _sse(ai_service.advise_stream(
+            request.question, request.in_progress_tasks, run_query, request.user_email, request.speculative,
+        ))
+    return await ai_service.advise(
+        request.question, request.in_progress_tasks, run_query, request.user_email, request.speculative,
+    )
 
 
 @app.post("/api/advise/plan")
@@ -118,6 +370,17 @@ async def advise_answer(request: AdviseAnswerRequest):
     return {"answer": answer}
 
 
+@app.post("/api/advise/answer/stream")
+async def advise_answer_stream(request: AdviseAnswerRequest):
+    return _sse(ai_service.advise_answer_stream(
+        request.question,
+        request.in_progress_tasks,
+        request.lookup_description,
+        request.sql_results,
+        request.user_email,
+    ))
+
+
 @app.post("/api/check-suggestions")
 async def check_suggestions(request: CheckSuggestionsRequest):
     suggestions = await ai_service.check_suggestions(request.completed_tasks, request.user_email)
@@ -145,6 +408,13 @@ async def match_problem_type_ep(req: MatchProblemTypeRequest):
     return {"matches": matches}
 
 
+@app.get("/api/match-problem-type/stats")
+def match_problem_type_stats():
+    """Local-classifier skip rate and LLM agreement, for tuning its threshold."""
+    from services import problem_classifier
+    return problem_classifier.summary()
+
+
 @app.post("/api/diagnose")
 async def diagnose_ep(req: DiagnoseRequest):
     return await ai_service.diagnose(
@@ -155,3 +425,15 @@ async def diagnose_ep(req: DiagnoseRequest):
         req.conversation,
         req.user_email or "",
     )
+
+
+@app.post("/api/diagnose/stream")
+async def diagnose_stream_ep(req: DiagnoseRequest):
+    return _sse(ai_service.diagnose_stream(
+        req.problem_type,
+        req.task_details,
+        req.information,
+        req.task_fields,
+        req.conversation,
+        req.user_email or "",
+    ))
@@ -1,36 +1,469 @@
 from __future__ import annotations
 
 import os
+import time
+import asyncio
+import itertools
 import anthropic
+import httpx
 from services import prompt_loader
 from services import headlights_tracker
+from services import response_cache
+from services import problem_classifier
+from services import metrics
+from services import context_packer
+from services import followup_cues
+from services import model_router
+from services import scheduler
+from services import similar_incidents
+from services import onboarding_extractor
+from services import sql_guard
+from services import traffic_capture
 
-client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+# One async client shared by every endpoint so all calls reuse the same
+# keep-alive connection pool instead of blocking the event loop. Built on
+# first use (or by warm_up()) rather than at import, which keeps the TLS
+# context setup off the import path.
+_MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "20"))
+_WARMUP_CONNECT = os.getenv("ANTHROPIC_WARMUP_CONNECT", "1") == "1"
 
+_client: anthropic.AsyncAnthropic | None = None
 
+
+def get_client() -> anthropic.AsyncAnthropic:
+    global _client
+    if _client is None:
+        _client = anthropic.AsyncAnthropic(
+            api_key=os.environ.get("ANTHROPIC_API_KEY"),
+            # Retries go through the scheduler so they respect rate-limit budgets
+            max_retries=0,
+            http_client=anthropic.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=_MAX_CONNECTIONS,
+                    max_keepalive_connections=_MAX_CONNECTIONS,
+                ),
+            ),
+        )
+    return _client
+
+
+async def warm_up() -> None:
+    """Build the client, open a pooled connection to the API and precompute local indexes."""
+    client = get_client()
+    problem_types = [f"{k}: {v}" for k, v in _PROBLEM_TYPE_LABELS.items()]
+    problem_classifier.prepare(problem_types, _PROBLEM_TYPE_LABELS)
+    if _WARMUP_CONNECT:
+        # Free call that leaves a TLS connection in the pool for the first real request
+        try:
+            await client.models.list(limit=1)
+        except Exception as e:
+            print(f"[ai_service] Warm-up connection failed: {e}")
+
+
+# Strong references to fire-and-forget tasks so they aren't garbage-collected mid-run
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+class _Flight:
+    """One upstream call shared by every request with the same fingerprint."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+_inflight: dict[str, _Flight] = {}
+
+stats = {
+    "upstream_calls": 0,
+    "coalesced_calls": 0,
+    "speculation_wins": 0,
+    "speculation_losses": 0,
+    "speculation_wasted_input_tokens": 0,
+    "speculation_wasted_output_tokens": 0,
+    "history_turns_folded": 0,
+    "history_summaries_built": 0,
+    "cache_breakpoints_skipped": 0,
+}
+
+
+def _fingerprint(request: dict) -> str:
+    import json as _json
+    import hashlib
+
+    payload = _json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def _call_upstream(user_email: str, kwargs: dict):
+    model = kwargs.get("model", "")
+    estimate = scheduler.estimate_tokens(kwargs)
+    for attempt in itertools.count():
+        async with scheduler.slot(model, estimate) as slot:
+            stats["upstream_calls"] += 1
+            start = time.perf_counter()
+            try:
+                with metrics.span("upstream_call", model):
+                    raw = await get_client().messages.with_raw_response.create(**kwargs)
+                    message = raw.parse()
+            except asyncio.CancelledError:
+                # Deadline or client disconnect: closing the request stops generation,
+                # but the prompt was already sent and counts as used
+                _track_usage(user_email, _partial_usage(model, _prompt_usage(kwargs), ""), model)
+                raise
+            except (anthropic.APIStatusError, anthropic.APIConnectionError) as e:
+                delay = scheduler.retry_delay(e, attempt, model)
+                if delay is None:
+                    raise
+                print(f"[ai_service] {model} call failed ({e.__class__.__name__}), retrying")
+            else:
+                metrics.observe_route(time.perf_counter() - start, model)
+                traffic_capture.upstream(
+                    metrics.current_endpoint.get(), kwargs, message, message.usage, time.perf_counter() - start,
+                )
+                slot.headers(raw.headers)
+                slot.usage(message.usage)
+                break
+        await asyncio.sleep(delay)
+    _track_usage(user_email, message.usage, model)
+    return message
+
+
+async def _create(user_email: str = "", **kwargs):
+    """Call the Messages API without blocking, admitted through the scheduler.
+
+    Identical requests already in flight (double-clicks, frontend retries) await
+    the same upstream call instead of paying for a second one; its tokens are
+    tracked once, against the first caller. The shared call is only cancelled
+    when every caller waiting on it has gone away.
+    """
+    key = _fingerprint(kwargs)
+    flight = _inflight.get(key)
+    if flight is None:
+        flight = _Flight(asyncio.create_task(_call_upstream(user_email, kwargs)))
+        _inflight[key] = flight
+        flight.task.add_done_callback(
+            lambda _t, k=key, f=flight: _inflight.pop(k) if _inflight.get(k) is f else None
+        )
+    else:
+        stats["coalesced_calls"] += 1
+
+    flight.waiters += 1
+    try:
+        return await asyncio.shield(flight.task)
+    except asyncio.CancelledError:
+        if flight.waiters == 1 and not flight.task.done():
+            flight.task.cancel()
+        raise
+    finally:
+        flight.waiters -= 1
+
+
+def _prompt_usage(kwargs: dict):
+    """Estimated usage of a request whose reply never started: its prompt only."""
+    input_tokens = scheduler.estimate_tokens(kwargs) - int(kwargs.get("max_tokens", 0))
+    return anthropic.types.Usage(input_tokens=input_tokens, output_tokens=0)
+
+
+def _partial_usage(model: str, usage, text: str):
+    """Usage for a call abandoned before its final usage arrived.
+
+    Output tokens are only reported at the end of a reply, so those already
+    generated are estimated from the text received (~4 chars per token).
+    """
+    metrics.cancelled_call(model)
+    return usage.model_copy(update={"output_tokens": max(usage.output_tokens or 0, len(text) // 4)})
+
+
+def _track_usage(user_email: str, usage, model: str = "") -> None:
+    with metrics.span("track", model):
+        counts = {
+            "input_tokens": usage.input_tokens or 0,
+            "output_tokens": usage.output_tokens or 0,
+            "cache_read_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+            "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+        }
+        metrics.count_tokens(model, **counts)
+        headlights_tracker.track_tokens(user_email, **counts)
+
+
+# Shortest prefix each model will cache; a breakpoint on anything shorter is
+# silently ignored upstream. Matched by model-name prefix, first match wins.
+_CACHE_MIN_TOKENS = (("claude-haiku-4", 4096), ("claude-opus-4-5", 4096), ("claude-haiku-3", 2048), ("claude-", 1024))
+
+
+def _cache_min_tokens(model: str) -> int:
+    return next((n for name, n in _CACHE_MIN_TOKENS if model.startswith(name)), 1024)
+
+
+def _cached_system(prefix: str, suffix: str = "", model: str = "") -> list[dict]:
+    """System prompt as content blocks with a prompt-cache breakpoint after the stable prefix.
+
+    Everything up to the breakpoint is cached upstream, so the prefix must not
+    contain per-request data; put that in the suffix. The breakpoint is only
+    added when the prefix's estimated size reaches model's cache minimum.
+    """
+    block = {"type": "text", "text": prefix}
+    if context_packer.estimate_tokens(prefix) >= _cache_min_tokens(model):
+        block["cache_control"] = {"type": "ephemeral"}
+    else:
+        stats["cache_breakpoints_skipped"] += 1
+    blocks = [block]
+    if suffix:
+        blocks.append({"type": "text", "text": suffix})
+    return blocks
+
+
+async def _create_cached(endpoint: str, user_email: str = "", **kwargs) -> str:
+    """Return the response text for a request, serving repeats from response_cache.
+
+    Only tokens actually spent upstream (cache misses) are tracked.
+    """
+    key = response_cache.make_key(kwargs)
+    cached = await response_cache.get(endpoint, key)
+    if cached is not None:
+        return cached
+    message = await _create(user_email, **kwargs)
+    text = message.content[0].text
+    response_cache.put(endpoint, key, text)
+    return text
+
+
+async def _stream(user_email: str = "", usage_sink: list | None = None, **kwargs):
+    """Stream a Messages API call, yielding text deltas as they arrive.
+
+    Token usage is reported once the stream ends — including when the consumer
+    stops early or is cancelled, in which case the partial usage so far is
+    tracked. If usage_sink is given, the final usage object is also appended
+    to it.
+    """
+    model = kwargs.get("model", "")
+    estimate = scheduler.estimate_tokens(kwargs)
+    for attempt in itertools.count():
+        async with scheduler.slot(model, estimate) as slot:
+            stats["upstream_calls"] += 1
+            start = time.perf_counter()
+            first_token = None
+            parts = []
+            opened = False
+            completed = False
+            try:
+                async with get_client().messages.stream(**kwargs) as stream:
+                    opened = True
+                    slot.headers(stream.response.headers)
+                    try:
+                        async for text in stream.text_stream:
+                            if first_token is None:
+                                first_token = time.perf_counter() - start
+                                metrics.observe("first_token", first_token, model)
+                            parts.append(text)
+                            yield text
+                        completed = True
+                    finally:
+                        elapsed = time.perf_counter() - start
+                        metrics.observe("upstream_call", elapsed, model)
+                        metrics.observe_route(elapsed, model)
+                        try:
+                            usage = stream.current_message_snapshot.usage
+                        except (AssertionError, AttributeError):
+                            # Stopped before message_start arrived
+                            usage = _prompt_usage(kwargs)
+                        if not completed:
+                            usage = _partial_usage(model, usage, "".join(parts))
+                        traffic_capture.upstream(
+                            metrics.current_endpoint.get(), kwargs, "".join(parts), usage, elapsed, first_token,
+                        )
+                        slot.usage(usage)
+                        _track_usage(user_email, usage, model)
+                        if usage_sink is not None:
+                            usage_sink.append(usage)
+                return
+            except (anthropic.APIStatusError, anthropic.APIConnectionError) as e:
+                # Only opening the stream is retried; once tokens have flowed, errors propagate
+                delay = None if opened else scheduler.retry_delay(e, attempt, model)
+                if delay is None:
+                    raise
+                print(f"[ai_service] {model} stream failed ({e.__class__.__name__}), retrying")
+        await asyncio.sleep(delay)
+
+
+@metrics.endpoint("ask")
 async def ask(prompt: str, system: str = "", user_email: str = "") -> str:
     """Send a prompt to Claude and return the response text."""
-    message = client.messages.create(
-        model="claude-sonnet-4-6",
-        max_tokens=1024,
+    message = await _create(
+        user_email,
+        **model_router.choose("ask", input_chars=len(prompt)),
         system=system or prompt_loader.get_ask_prompt(),
         messages=[{"role": "user", "content": prompt}],
     )
-    headlights_tracker.track_tokens(user_email, message.usage.input_tokens, message.usage.output_tokens)
     headlights_tracker.track_activity(user_email, sessions=1)
     return message.content[0].text
 
 
+@metrics.endpoint("ask_stream")
+async def ask_stream(prompt: str, system: str = "", user_email: str = ""):
+    """Streaming variant of ask(); yields ("token", {...}) events then ("done", {...})."""
+    parts = []
+    async for text in _stream(
+        user_email,
+        **model_router.choose("ask", input_chars=len(prompt)),
+        system=system or prompt_loader.get_ask_prompt(),
+        messages=[{"role": "user", "content": prompt}],
+    ):
+        parts.append(text)
+        yield "token", {"text": text}
+    headlights_tracker.track_activity(user_email, sessions=1)
+    yield "done", {"text": "".join(parts)}
+
+
+@metrics.endpoint("summarize_incident")
 async def summarize_incident(description: str, user_email: str = "") -> str:
     """Generate a short title for an IT incident from its description."""
-    message = client.messages.create(
-        model="claude-haiku-4-5-20251001",
-        max_tokens=30,
+    text = await _create_cached(
+        "summarize_incident",
+        user_email,
+        **model_router.choose("summarize_incident", input_chars=len(description)),
         system="Generate a very short title (5-8 words) for this IT problem. Return only the title, nothing else.",
         messages=[{"role": "user", "content": description}],
     )
-    headlights_tracker.track_tokens(user_email, message.usage.input_tokens, message.usage.output_tokens)
-    return message.content[0].text.strip()
+    return text.strip()
+
+
+_BATCH_CONCURRENCY = int(os.getenv("SUMMARIZE_BATCH_CONCURRENCY", "4"))
+
+
+@metrics.endpoint("summarize_batch")
+async def summarize_incidents(descriptions: list[str], user_email: str = ""):
+    """Title many incidents at once; yields ("result", {...}) in input order, then ("done", {...}).
+
+    Identical descriptions are summarized once. At most SUMMARIZE_BATCH_CONCURRENCY
+    calls run at a time so an import doesn't crowd out interactive requests.
+    """
+    gate = asyncio.Semaphore(_BATCH_CONCURRENCY)
+
+    async def one(description: str) -> str:
+        async with gate:
+            return await summarize_incident(description, user_email)
+
+    keys = [d.strip() for d in descriptions]
+    unique = list(dict.fromkeys(k for k in keys if k))
+    with metrics.usage() as usage:
+        tasks = {k: asyncio.create_task(one(k)) for k in unique}
+
+    failed = 0
+    try:
+        for index, key in enumerate(keys):
+            if not key:
+                yield "result", {"index": index, "title": ""}
+                continue
+            try:
+                yield "result", {"index": index, "title": await tasks[key]}
+            except Exception as e:
+                failed += 1
+                print(f"[ai_service] Batch summarize failed for item {index}: {e}")
+                yield "result", {"index": index, "title": None, "error": str(e)}
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+    yield "done", {"count": len(keys), "unique": len(unique), "failed": failed, "usage": usage}
+
+
+_SIMILAR_RERANK_SYSTEM = """An IT technician wants to find past resolved tasks similar to a new one. \
+You get the new task and a short list of candidate past tasks.
+
+For each candidate with a meaningful similarity or an interesting contrast worth noting, return a JSON array:
+[{"task_number": 3, "similarity": "One or two sentences describing how it is similar and/or dissimilar."}]
+
+Order it from most to least relevant and only include tasks with genuine relevance. If none qualify, return [].
+Respond with only the JSON array, no other text."""
+
+
+# Where find_similar reloads a user's index from; {user_id} is the verified caller's
+_RESOLVED_INCIDENTS_SQL = (
+    "SELECT id, title, description, task_number, reported_by, priority FROM incidents "
+    "WHERE user_id = '{user_id}' AND status = 'resolved' ORDER BY created_at DESC"
+)
+
+
+def _local_similarity(candidate: dict) -> str:
+    return f"Also mentions {', '.join(candidate['matched'][:5])}." if candidate["matched"] else ""
+
+
+@metrics.endpoint("similar")
+async def find_similar(
+    user_id: str,
+    task_name: str,
+    elaboration: str | None = None,
+    incidents: list[dict] | None = None,
+    top_k: int = 8,
+    rerank: bool = True,
+    user_email: str = "",
+    run_query=None,
+) -> dict:
+    """Past resolved incidents most like a new task.
+
+    incidents (the user's resolved list) is synced into the local index first.
+    Without it, run_query (an async callable taking SQL with the {user_id}
+    placeholder, as for advise) reloads the list when the index is stale;
+    otherwise what is already indexed is searched. Candidates come from the
+    index; with rerank, only those top_k go to the model, which keeps the
+    relevant ones and explains each.
+    """
+    import json as _json
+
+    query = f"{task_name}\n{elaboration or ''}"
+    with metrics.span("index"):
+        if incidents is None and run_query is not None and similar_incidents.stale(user_id):
+            incidents = await run_query(_RESOLVED_INCIDENTS_SQL)
+        if incidents is not None:
+            changes = await asyncio.to_thread(similar_incidents.sync, user_id, incidents)
+        else:
+            changes = {"indexed": similar_incidents.size(user_id)}
+        candidates = await asyncio.to_thread(similar_incidents.search, user_id, query, top_k)
+
+    results = [
+        {"id": c["id"], "task_number": c["task_number"], "title": c["title"],
+         "similarity": _local_similarity(c), "score": c["score"]}
+        for c in candidates
+    ]
+    if not rerank or not candidates:
+        return {"results": results, "indexed": changes["indexed"], "reranked": False}
+
+    task_list = "\n".join(
+        f"#{c['task_number']}: \"{c['title']}\"" + (f" (customer: {c['reported_by']})" if c["reported_by"] else "")
+        for c in candidates
+    )
+    prompt = f'New task: "{task_name}"' + (f'\nAdditional context: "{elaboration}"' if elaboration else "")
+    text = await _create_cached(
+        "similar_rerank",
+        user_email,
+        **model_router.choose("similar_rerank", input_chars=len(task_list)),
+        system=_SIMILAR_RERANK_SYSTEM,
+        messages=[{"role": "user", "content": f"{prompt}\n\nCandidate past tasks:\n{task_list}"}],
+    )
+
+    with metrics.span("parse"):
+        try:
+            picked = [p for p in _json.loads(text.strip()) if isinstance(p, dict)]
+        except Exception:
+            metrics.parse_fallback()
+            return {"results": results, "indexed": changes["indexed"], "reranked": False}
+
+    by_number = {str(r["task_number"]): r for r in results}
+    reranked = []
+    for p in picked:
+        r = by_number.pop(str(p.get("task_number")), None)
+        if r is not None:
+            reranked.append({**r, "similarity": p.get("similarity") or r["similarity"]})
+    return {"results": reranked, "indexed": changes["indexed"], "reranked": True}
 
 
 TASKS_SCHEMA = """
@@ -76,17 +509,26 @@ Table: assets (IT asset inventory — computers, printers, phones, tablets, came
 """
 
 
-async def generate_sql(question: str, target: str, user_email: str = "") -> str:
-    """Generate a safe SELECT SQL query from a natural language question."""
+@metrics.endpoint("generate_sql")
+async def generate_sql(question: str, target: str, user_email: str = "") -> dict:
+    """Generate a safe SELECT SQL query from a natural language question.
+
+    Returns {"sql", "flags", "rewrites"} from sql_guard.check; raises
+    sql_guard.UnsafeSqlError if the model's query can't be made safe.
+    """
     schema = TASKS_SCHEMA if target == "tasks" else ASSETS_SCHEMA
-    message = client.messages.create(
-        model="claude-sonnet-4-6",
-        max_tokens=512,
-        system=f"{prompt_loader.get_sql_prompt()}\n\nSchema:\n{schema}",
+    route = model_router.choose(
+        "generate_sql", complexity=model_router.sql_complexity(question, target), input_chars=len(question),
+    )
+    text = await _create_cached(
+        "generate_sql",
+        user_email,
+        **route,
+        system=_cached_system(f"{prompt_loader.get_sql_prompt()}\n\nSchema:\n{schema}", model=route["model"]),
         messages=[{"role": "user", "content": question}],
     )
-    headlights_tracker.track_tokens(user_email, message.usage.input_tokens, message.usage.output_tokens)
-    return message.content[0].text.strip()
+    with metrics.span("sql_guard"):
+        return sql_guard.check(text, {target if target == "tasks" else "assets"})
 
 
 INCIDENTS_SCHEMA = """
@@ -116,16 +558,11 @@ def _tasks_text(in_progress_tasks: list[dict]) -> str:
     )
 
 
-async def advise_plan(question: str, in_progress_tasks: list[dict], user_email: str = "") -> dict:
-    """Pass 1 — decide what data to look up, return rephrasing + optional SQL."""
-    import json as _json
-
-    system = f"""You are IT Buddy, an IT advisor for an IT professional at Oriol Healthcare — \
+# Stable part of the advise_plan system prompt. It never varies per request, so
+# it sits before the prompt-cache breakpoint; tasks and the date follow it.
+_ADVISE_PLAN_PREFIX = f"""You are IT Buddy, an IT advisor for an IT professional at Oriol Healthcare — \
 a nursing facility operator with three sites: Holden, Oakdale, and Business Office.
 
-Current in-progress tasks:
-{_tasks_text(in_progress_tasks)}
-
 Review the user's question. Return a JSON object with exactly these fields:
 - "rephrasing": one sentence starting with "You're asking..." confirming what you understood
 - "sql": a single SELECT query if database data would help you give a better answer, \
@@ -134,7 +571,7 @@ otherwise null. Use {{user_id}} as a placeholder.
 "warranty expiration dates for your computers"), or null if sql is null.
 
 Only generate SQL if it would let you give a meaningfully better answer. \
-For questions answerable from the in-progress tasks alone, set sql to null.
+For questions answerable from the in-progress tasks listed below alone, set sql to null.
 
 You may query:
 {INCIDENTS_SCHEMA}
@@ -142,44 +579,60 @@ You may query:
 
 Return only the JSON object with no markdown fences."""
 
-    message = client.messages.create(
-        model="claude-sonnet-4-6",
-        max_tokens=512,
-        system=system,
+
+@metrics.endpoint("advise_plan")
+async def advise_plan(question: str, in_progress_tasks: list[dict], user_email: str = "") -> dict:
+    """Pass 1 — decide what data to look up, return rephrasing + optional SQL."""
+    import json as _json
+    from datetime import date
+
+    with metrics.span("build_prompt"):
+        suffix = f"""Current in-progress tasks:
+{_tasks_text(in_progress_tasks)}
+
+Today is {date.today().isoformat()}."""
+
+    route = model_router.choose("advise_plan", input_chars=len(question))
+    message = await _create(
+        user_email,
+        **route,
+        system=_cached_system(_ADVISE_PLAN_PREFIX, suffix, route["model"]),
         messages=[{"role": "user", "content": question}],
     )
-    headlights_tracker.track_tokens(user_email, message.usage.input_tokens, message.usage.output_tokens)
 
     text = message.content[0].text.strip()
-    try:
-        return _json.loads(text)
-    except Exception:
-        return {"rephrasing": "I understood your question.", "sql": None, "lookup_description": None}
+    with metrics.span("parse"):
+        try:
+            plan = _json.loads(text)
+        except Exception:
+            metrics.parse_fallback()
+            return {"rephrasing": "I understood your question.", "sql": None, "lookup_description": None}
+    if plan.get("sql"):
+        with metrics.span("sql_guard"):
+            try:
+                checked = sql_guard.check(plan["sql"], {"incidents", "assets"})
+                plan["sql"], plan["sql_flags"] = checked["sql"], checked["flags"]
+            except sql_guard.UnsafeSqlError as e:
+                # Answer without the lookup rather than run it
+                print(f"[ai_service] advise_plan SQL rejected: {e}")
+                plan.update(sql=None, lookup_description=None, sql_rejected=str(e))
+    return plan
 
 
-async def advise_answer(
-    question: str,
+def _advise_answer_system(
     in_progress_tasks: list[dict],
     lookup_description: str | None,
     sql_results: list[dict],
-    user_email: str = "",
 ) -> str:
-    """Pass 2 — answer the question using in-progress tasks + any SQL results."""
-
-    # Format SQL results as readable text (cap at 30 rows)
+    # Pack SQL results as a compact table, as many rows as the token budget allows
     data_section = ""
     if lookup_description and sql_results:
-        rows = sql_results[:30]
-        formatted = "\n".join(
-            "  " + ", ".join(f"{k}: {v}" for k, v in row.items() if v is not None)
-            for row in rows
-        )
-        suffix = f"\n  ... ({len(sql_results) - 30} more rows)" if len(sql_results) > 30 else ""
-        data_section = f"\nAdditional data you looked up ({lookup_description}):\n{formatted}{suffix}\n"
+        formatted, _ = context_packer.pack_rows(sql_results)
+        data_section = f"\nAdditional data you looked up ({lookup_description}, {len(sql_results)} rows):\n{formatted}\n"
     elif lookup_description:
         data_section = f"\nYou tried to look up {lookup_description} but the query returned no results.\n"
 
-    system = f"""You are IT Buddy, an IT advisor for an IT professional at Oriol Healthcare — \
+    return f"""You are IT Buddy, an IT advisor for an IT professional at Oriol Healthcare — \
 a nursing facility operator with three sites: Holden, Oakdale, and Business Office.
 
 Current in-progress tasks:
@@ -189,27 +642,249 @@ Answer the user's question directly and helpfully. Be specific — reference tas
 equipment names, or data points from the lookup where relevant. \
 Plain text only, no markdown symbols."""
 
-    message = client.messages.create(
-        model="claude-sonnet-4-6",
-        max_tokens=2048,
+
+@metrics.endpoint("advise_answer")
+async def advise_answer(
+    question: str,
+    in_progress_tasks: list[dict],
+    lookup_description: str | None,
+    sql_results: list[dict],
+    user_email: str = "",
+) -> str:
+    """Pass 2 — answer the question using in-progress tasks + any SQL results."""
+    with metrics.span("build_prompt"):
+        system = _advise_answer_system(in_progress_tasks, lookup_description, sql_results)
+    message = await _create(
+        user_email,
+        **model_router.choose("advise_answer", has_data=bool(sql_results), input_chars=len(question)),
         system=system,
         messages=[{"role": "user", "content": question}],
     )
-    headlights_tracker.track_tokens(user_email, message.usage.input_tokens, message.usage.output_tokens)
     headlights_tracker.track_activity(user_email, sessions=1)
 
     return message.content[0].text.strip()
 
 
+@metrics.endpoint("advise_answer_stream")
+async def advise_answer_stream(
+    question: str,
+    in_progress_tasks: list[dict],
+    lookup_description: str | None,
+    sql_results: list[dict],
+    user_email: str = "",
+):
+    """Streaming variant of advise_answer(); yields ("token", {...}) events then ("done", {...})."""
+    with metrics.span("build_prompt"):
+        system = _advise_answer_system(in_progress_tasks, lookup_description, sql_results)
+    parts = []
+    async for text in _stream(
+        user_email,
+        **model_router.choose("advise_answer", has_data=bool(sql_results), input_chars=len(question)),
+        system=system,
+        messages=[{"role": "user", "content": question}],
+    ):
+        parts.append(text)
+        yield "token", {"text": text}
+    headlights_tracker.track_activity(user_email, sessions=1)
+    yield "done", {"answer": "".join(parts).strip()}
+
+
+async def _run_lookup(plan: dict, run_query) -> list[dict]:
+    if not plan.get("sql"):
+        return []
+    try:
+        with metrics.span("lookup"):
+            return await run_query(plan["sql"])
+    except Exception as e:
+        # Same as the old Next.js flow: a failed lookup just means no supporting data
+        print(f"[ai_service] Advise lookup failed: {e}")
+        return []
+
+
+# Start the no-lookup answer alongside advise_plan; most questions need no data.
+_SPECULATIVE_ADVISE = os.getenv("ADVISE_SPECULATIVE", "1") == "1"
+
+
+class _Speculation:
+    """A no-lookup advise answer generated while advise_plan is still running.
+
+    Tokens are buffered on a queue so a streaming caller can replay them once
+    the plan confirms no lookup is needed; cancel() drops the work and records
+    what it cost.
+    """
+
+    def __init__(self, question: str, in_progress_tasks: list[dict], user_email: str):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.usage: list = []
+        self.task = asyncio.create_task(self._run(question, in_progress_tasks, user_email))
+
+    async def _run(self, question: str, in_progress_tasks: list[dict], user_email: str):
+        try:
+            async for text in _stream(
+                user_email,
+                self.usage,
+                **model_router.choose("advise_answer", has_data=False, input_chars=len(question)),
+                system=_advise_answer_system(in_progress_tasks, None, []),
+                messages=[{"role": "user", "content": question}],
+            ):
+                await self.queue.put(text)
+        finally:
+            await self.queue.put(None)
+
+    async def tokens(self):
+        stats["speculation_wins"] += 1
+        while (text := await self.queue.get()) is not None:
+            yield text
+        # Surface upstream errors the same way a direct advise_answer call would
+        await self.task
+
+    async def cancel(self):
+        stats["speculation_losses"] += 1
+        self.task.cancel()
+        try:
+            await self.task
+        except (asyncio.CancelledError, Exception):
+            pass
+        for usage in self.usage:
+            stats["speculation_wasted_input_tokens"] += usage.input_tokens or 0
+            stats["speculation_wasted_output_tokens"] += usage.output_tokens or 0
+
+
+def _advise_result(plan: dict, rows: list[dict], answer: str) -> dict:
+    return {
+        "rephrasing": plan.get("rephrasing"),
+        "lookup_description": plan.get("lookup_description"),
+        "sql": plan.get("sql"),
+        "supporting_data": rows,
+        "answer": answer,
+    }
+
+
+@metrics.endpoint("advise")
+async def advise(
+    question: str,
+    in_progress_tasks: list[dict],
+    run_query,
+    user_email: str = "",
+    speculative: bool | None = None,
+) -> dict:
+    """Plan, run the lookup and answer in one server-side pass.
+
+    run_query is an async callable taking the plan's SQL (with the {user_id}
+    placeholder still in it) and returning rows — see services.query_executor.
+    With speculative (default ADVISE_SPECULATIVE), the no-lookup answer starts
+    in parallel with the plan and is used directly when the plan has no SQL.
+    """
+    speculation = None
+    if _SPECULATIVE_ADVISE if speculative is None else speculative:
+        speculation = _Speculation(question, in_progress_tasks, user_email)
+    try:
+        plan = await advise_plan(question, in_progress_tasks, user_email)
+    except BaseException:
+        if speculation:
+            await speculation.cancel()
+        raise
+
+    if speculation and not plan.get("sql"):
+        answer = "".join([text async for text in speculation.tokens()]).strip()
+        headlights_tracker.track_activity(user_email, sessions=1)
+        return _advise_result(plan, [], answer)
+    if speculation:
+        await speculation.cancel()
+
+    rows = await _run_lookup(plan, run_query)
+    answer = await advise_answer(question, in_progress_tasks, plan.get("lookup_description"), rows, user_email)
+    return _advise_result(plan, rows, answer)
+
+
+@metrics.endpoint("advise_stream")
+async def advise_stream(
+    question: str,
+    in_progress_tasks: list[dict],
+    run_query,
+    user_email: str = "",
+    speculative: bool | None = None,
+):
+    """Streaming variant of advise(): yields "plan", "data", "token"... then "done"."""
+    speculation = None
+    if _SPECULATIVE_ADVISE if speculative is None else speculative:
+        speculation = _Speculation(question, in_progress_tasks, user_email)
+    try:
+        plan = await advise_plan(question, in_progress_tasks, user_email)
+        yield "plan", {
+            "rephrasing": plan.get("rephrasing"),
+            "lookup_description": plan.get("lookup_description"),
+            "sql": plan.get("sql"),
+        }
+    except BaseException:
+        if speculation:
+            await speculation.cancel()
+        raise
+
+    if speculation and not plan.get("sql"):
+        parts = []
+        async for text in speculation.tokens():
+            parts.append(text)
+            yield "token", {"text": text}
+        headlights_tracker.track_activity(user_email, sessions=1)
+        yield "done", _advise_result(plan, [], "".join(parts).strip())
+        return
+    if speculation:
+        await speculation.cancel()
+
+    rows = await _run_lookup(plan, run_query)
+    if plan.get("sql"):
+        yield "data", {"rows": rows}
+    async for event, data in advise_answer_stream(
+        question, in_progress_tasks, plan.get("lookup_description"), rows, user_email,
+    ):
+        if event == "done":
+            yield "done", _advise_result(plan, rows, data["answer"])
+        else:
+            yield event, data
+
+
+@metrics.endpoint("match_problem_type")
 async def match_problem_type(description: str, problem_types: list[str], user_email: str = "") -> list[str]:
-    """Classify a freeform description against a list of known problem types."""
+    """Classify a freeform description against a list of known problem types.
+
+    Clear-cut descriptions are answered by the local problem_classifier; only
+    ambiguous ones cost a Haiku call.
+    """
+    import random
+
+    best_id, confidence, confident = problem_classifier.classify(
+        description, problem_types, _PROBLEM_TYPE_LABELS,
+    )
+    if confident:
+        if random.random() < problem_classifier.AUDIT_RATE:
+            _spawn(_audit_problem_type(description, problem_types, user_email, best_id, confidence))
+        return [best_id]
+
+    matches = await _match_problem_type_llm(description, problem_types, user_email)
+    problem_classifier.record_agreement(best_id, confidence, matches, audited=False)
+    return matches
+
+
+async def _audit_problem_type(
+    description: str, problem_types: list[str], user_email: str, best_id: str, confidence: float,
+) -> None:
+    try:
+        matches = await _match_problem_type_llm(description, problem_types, user_email)
+        problem_classifier.record_agreement(best_id, confidence, matches, audited=True)
+    except Exception as e:
+        print(f"[ai_service] Problem-type audit failed: {e}")
+
+
+async def _match_problem_type_llm(description: str, problem_types: list[str], user_email: str = "") -> list[str]:
     import json as _json
 
     types_text = "\n".join(f"- {pt}" for pt in problem_types)
 
-    message = client.messages.create(
-        model="claude-haiku-4-5-20251001",
-        max_tokens=256,
+    text = await _create_cached(
+        "match_problem_type",
+        user_email,
+        **model_router.choose("match_problem_type", input_chars=len(description)),
         system=f"""You are an IT problem classifier. Match the user's description to one or more of these problem types:
 
 {types_text}
@@ -219,18 +894,19 @@ Return one ID if confident; up to 3 if genuinely ambiguous. Return an empty list
 Return only the JSON object, no markdown fences.""",
         messages=[{"role": "user", "content": description}],
     )
-    headlights_tracker.track_tokens(user_email, message.usage.input_tokens, message.usage.output_tokens)
 
-    text = message.content[0].text.strip()
+    text = text.strip()
     # Strip markdown fences if the model wrapped the JSON
     if text.startswith("```"):
         lines = text.splitlines()
         text = "\n".join(lines[1:-1] if lines[-1].strip() == "```" else lines[1:]).strip()
-    try:
-        result = _json.loads(text)
-        return result.get("matches", [])
-    except Exception:
-        return []
+    with metrics.span("parse"):
+        try:
+            result = _json.loads(text)
+            return result.get("matches", [])
+        except Exception:
+            metrics.parse_fallback()
+            return []
 
 
 _PROBLEM_TYPE_LABELS = {
@@ -243,6 +919,7 @@ _PROBLEM_TYPE_LABELS = {
 }
 
 
+@metrics.endpoint("diagnose")
 async def diagnose(
     problem_type: str,
     task_details: str | None = None,
@@ -252,67 +929,200 @@ async def diagnose(
     user_email: str = "",
 ) -> dict:
     """Diagnose an IT issue or extract onboarding structured data."""
-    import json as _json
+    if problem_type == "onboarding":
+        return await _extract_onboarding(task_details, information, user_email)
 
-    label = _PROBLEM_TYPE_LABELS.get(problem_type, problem_type)
+    summary, recent = await _compact_history(problem_type, conversation, user_email)
+    with metrics.span("build_prompt"):
+        system, messages = _diagnosis_request(problem_type, task_details, information, task_fields, recent, summary)
+    message = await _create(
+        user_email,
+        **_diagnose_route(information, conversation),
+        system=system,
+        messages=messages,
+    )
+    headlights_tracker.track_activity(user_email, sessions=1)
 
-    if problem_type == "onboarding":
+    with metrics.span("parse"):
+        return _parse_diagnosis(message.content[0].text.strip())
+
+
+_ONBOARDING_FIELD_SPECS = {
+    "firstName": "string",
+    "lastName": "string",
+    "role": "one of [" + ", ".join(onboarding_extractor.ROLES) + "] ("
+            + "; ".join(f"{k} = {label}" for k, (label, _, _) in onboarding_extractor.ROLES.items()) + ")",
+    "site": "one of [" + ", ".join(onboarding_extractor.SITES) + "] ("
+            + "; ".join(f"{k} = {label}" for k, (label, _, _) in onboarding_extractor.SITES.items()) + ")",
+    "startDate": "YYYY-MM-DD string (or empty string if not mentioned)",
+    "nextAssetNumber": "string (or empty string if not mentioned)",
+    "computerName": "string (or empty string if not mentioned)",
+    "notes": "string (any other info not captured above, or empty string)",
+}
+
+
+async def _extract_onboarding(task_details: str | None, information: str | None, user_email: str = "") -> dict:
+    """New-hire fields from free text: local matchers first, the model only for what they leave open.
+
+    Notes go to the model whenever the matchers leave enough text unexplained,
+    even if every other field resolved. field_sources in the result says which
+    path filled each field ("local" or "model").
+    """
+    import json as _json
+
+    with metrics.span("build_prompt"):
         context_parts = []
         if task_details:
             context_parts.append(f"Task details: {task_details}")
         if information:
             context_parts.append(f"Information gathered:\n{information}")
         context = "\n\n".join(context_parts) if context_parts else "No information provided."
+        resolved, missing = onboarding_extractor.extract(context)
+        notes_gap = bool(onboarding_extractor.leftover(context))
 
-        message = client.messages.create(
-            model="claude-sonnet-4-6",
-            max_tokens=512,
-            system="""You extract new hire information from free-form text. Return ONLY a valid JSON object with exactly these fields:
-- firstName: string
-- lastName: string
-- role: one of [cna, lpn, rn, administrator, maintenance, housekeeping, dietary, laundry, social_worker, activity_director, business_office, it, medical_records, pt_ot]
-- site: one of [holden, oakdale, business_office]
-- startDate: YYYY-MM-DD string (or empty string if not mentioned)
-- nextAssetNumber: string (or empty string if not mentioned)
-- computerName: string (or empty string if not mentioned)
-- notes: string (any other info not captured above, or empty string)
-Return only the JSON object, no explanation, no markdown fences.""",
-            messages=[{"role": "user", "content": context}],
-        )
-        headlights_tracker.track_tokens(user_email, message.usage.input_tokens, message.usage.output_tokens)
-        headlights_tracker.track_activity(user_email, sessions=1)
+    counts = onboarding_extractor.stats
+    counts["extractions"] += 1
+    counts["fields_local"] += len(resolved)
+    structured_data = {**resolved, "notes": ""}
+    sources = {field: "local" for field in resolved}
+    headlights_tracker.track_activity(user_email, sessions=1)
+    if not missing and not notes_gap:
+        counts["fully_local"] += 1
+        return {"structured_data": structured_data, "field_sources": sources}
 
-        text = message.content[0].text.strip()
+    counts["model_fallbacks"] += 1
+    counts["fields_model"] += len(missing)
+    counts["notes_gaps"] += notes_gap
+    asked = missing + ["notes"]
+    known = "\n".join(f"- {field}: {value}" for field, value in resolved.items() if value)
+    text = await _create_cached(
+        "onboarding",
+        user_email,
+        **model_router.choose("onboarding", input_chars=len(context), missing=len(missing)),
+        system="You extract new hire information from free-form text. Return ONLY a valid JSON object with exactly these fields:\n"
+               + "\n".join(f"- {field}: {_ONBOARDING_FIELD_SPECS[field]}" for field in asked)
+               + (f"\nAlready known (don't return these):\n{known}" if known else "")
+               + "\nReturn only the JSON object, no explanation, no markdown fences.",
+        messages=[{"role": "user", "content": context}],
+    )
+
+    with metrics.span("parse"):
         try:
-            structured_data = _json.loads(text)
-            return {"structured_data": structured_data}
+            extracted = _json.loads(text.strip())
+            if not isinstance(extracted, dict):
+                raise ValueError("expected a JSON object")
         except Exception:
-            return {"structured_data": {}}
+            metrics.parse_fallback()
+            extracted = {}
+    for field in asked:
+        structured_data[field] = onboarding_extractor.normalize(field, extracted.get(field))
+        if field != "notes":
+            sources[field] = "model"
+    ordered = (*onboarding_extractor.FIELDS, "notes")
+    return {"structured_data": {f: structured_data[f] for f in ordered}, "field_sources": sources}
 
-    else:
-        # Build context string
-        context_parts = [f"Problem type: {label}"]
-        if task_fields:
-            tf_parts = [f"{k}: {v}" for k, v in task_fields.items() if v]
-            if tf_parts:
-                context_parts.append("Task: " + ", ".join(tf_parts))
-        if task_details:
-            context_parts.append(f"Questions/Details:\n{task_details}")
-        if information:
-            context_parts.append(f"Information gathered:\n{information}")
-        context_text = "\n\n".join(context_parts)
 
-        # Build message list: initial user request + conversation history
-        messages = [{"role": "user", "content": f"Please analyze this IT issue:\n\n{context_text}"}]
-        if conversation:
-            for turn in conversation:
-                role = turn.get("role", "user")
-                content = turn.get("content", turn.get("text", ""))
-                api_role = "assistant" if role == "ai" else "user"
-                messages.append({"role": api_role, "content": content})
-            # Last turn is the user's latest answer — Claude will respond
+# Diagnose sessions replay the last DIAGNOSE_KEEP_TURNS turns verbatim. Older
+# turns are folded into a Haiku summary DIAGNOSE_FOLD_STEP turns at a time, so
+# the summary only changes every few turns and is served from response_cache
+# in between.
+_KEEP_TURNS = int(os.getenv("DIAGNOSE_KEEP_TURNS", "6"))
+# Kept even so the verbatim tail starts on the same speaker as the full history
+_FOLD_STEP = max(2, int(os.getenv("DIAGNOSE_FOLD_STEP", "4")) // 2 * 2)
+
+_HISTORY_SUMMARY_SYSTEM = """You keep a running summary of an IT diagnostic conversation between IT Buddy and an IT professional.
+Merge the new turns into the summary so far. Keep every concrete fact: symptoms, sites, devices, \
+times, answers the user gave, steps already tried and their results, and causes ruled in or out. \
+Drop pleasantries and repeated questions. At most 200 words, plain text, no markdown symbols."""
 
-        system = f"""You are IT Buddy, an expert IT advisor for Oriol Healthcare (nursing facility with three sites: Holden, Oakdale, Business Office).
+
+def _turns_text(turns: list[dict]) -> str:
+    return "\n".join(
+        ("IT Buddy: " if turn.get("role") == "ai" else "User: ") + str(turn.get("content", turn.get("text", "")))
+        for turn in turns
+    )
+
+
+def _history_key(problem_type: str, turns: list[dict]) -> str:
+    return response_cache.make_key({"problem_type": problem_type, "turns": turns})
+
+
+async def _compact_history(
+    problem_type: str,
+    conversation: list[dict] | None,
+    user_email: str = "",
+) -> tuple[str | None, list[dict] | None]:
+    """Split a diagnose conversation into (summary of folded turns, verbatim recent turns)."""
+    if not conversation or len(conversation) < _KEEP_TURNS + _FOLD_STEP:
+        return None, conversation
+
+    folded = (len(conversation) - _KEEP_TURNS) // _FOLD_STEP * _FOLD_STEP
+    key = _history_key(problem_type, conversation[:folded])
+    summary = await response_cache.get("diagnose_history", key)
+    if summary is None:
+        # Extend the previous fold's summary when we have it, else start from scratch
+        start = folded - _FOLD_STEP
+        previous = (
+            await response_cache.get("diagnose_history", _history_key(problem_type, conversation[:start])) if start else None
+        )
+        if previous is None:
+            start = 0
+        prompt = (f"Summary so far:\n{previous}\n\n" if previous else "") + \
+            f"New turns:\n{_turns_text(conversation[start:folded])}"
+        message = await _create(
+            user_email,
+            **model_router.choose("diagnose_history", input_chars=len(prompt)),
+            system=_HISTORY_SUMMARY_SYSTEM,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        summary = message.content[0].text.strip()
+        response_cache.put("diagnose_history", key, summary)
+        stats["history_summaries_built"] += 1
+
+    stats["history_turns_folded"] += folded
+    return summary, conversation[folded:]
+
+
+def _diagnosis_request(
+    problem_type: str,
+    task_details: str | None,
+    information: str | None,
+    task_fields: dict | None,
+    conversation: list[dict] | None,
+    history_summary: str | None = None,
+) -> tuple[str, list[dict]]:
+    """Build (system, messages) for a non-onboarding diagnose turn.
+
+    conversation holds the turns to replay verbatim; history_summary, if given,
+    stands in for the earlier turns that were folded away.
+    """
+    label = _PROBLEM_TYPE_LABELS.get(problem_type, problem_type)
+
+    # Build context string
+    context_parts = [f"Problem type: {label}"]
+    if task_fields:
+        tf_parts = [f"{k}: {v}" for k, v in task_fields.items() if v]
+        if tf_parts:
+            context_parts.append("Task: " + ", ".join(tf_parts))
+    if task_details:
+        context_parts.append(f"Questions/Details:\n{task_details}")
+    if information:
+        context_parts.append(f"Information gathered:\n{information}")
+    if history_summary:
+        context_parts.append(f"Summary of the earlier conversation:\n{history_summary}")
+    context_text = "\n\n".join(context_parts)
+
+    # Build message list: initial user request + conversation history
+    messages = [{"role": "user", "content": f"Please analyze this IT issue:\n\n{context_text}"}]
+    if conversation:
+        for turn in conversation:
+            role = turn.get("role", "user")
+            content = turn.get("content", turn.get("text", ""))
+            api_role = "assistant" if role == "ai" else "user"
+            messages.append({"role": api_role, "content": content})
+        # Last turn is the user's latest answer — Claude will respond
+
+    system = f"""You are IT Buddy, an expert IT advisor for Oriol Healthcare (nursing facility with three sites: Holden, Oakdale, Business Office).
 
 You are diagnosing an IT issue of type: {label}
 
@@ -322,52 +1132,196 @@ Return a JSON object with exactly these fields:
 
 Return only the JSON object, no markdown fences."""
 
-        message = client.messages.create(
-            model="claude-sonnet-4-6",
-            max_tokens=2048,
-            system=system,
-            messages=messages,
-        )
-        headlights_tracker.track_tokens(user_email, message.usage.input_tokens, message.usage.output_tokens)
-        headlights_tracker.track_activity(user_email, sessions=1)
+    return system, messages
 
-        text = message.content[0].text.strip()
-        try:
-            result = _json.loads(text)
-            return {
-                "response": result.get("response", ""),
-                "follow_up_questions": result.get("follow_up_questions", []),
-            }
-        except Exception:
-            return {"response": text, "follow_up_questions": []}
+
+def _diagnose_route(information: str | None, conversation: list[dict] | None) -> dict:
+    """Size a diagnose turn by what the user just added: the latest answer, or the initial information."""
+    if conversation:
+        latest = str(conversation[-1].get("content", conversation[-1].get("text", "")))
+    else:
+        latest = information or ""
+    return model_router.choose("diagnose", turns=len(conversation or []), input_chars=len(latest))
 
 
-async def check_suggestions(completed_tasks: list[dict], user_email: str = "") -> list[dict]:
-    """Scan completed task notes for time-based suggestions and return new tasks to propose."""
-    if not completed_tasks:
-        return []
+def _parse_diagnosis(text: str) -> dict:
+    import json as _json
 
-    task_list = "\n".join(
-        f"Task #{t['task_number']} (completed {t['date_completed']}): {t['title']}"
-        + (f"\n  Note: {t['note']}" if t.get('note') else "")
-        for t in completed_tasks
-    )
+    try:
+        result = _json.loads(text)
+        return {
+            "response": result.get("response", ""),
+            "follow_up_questions": result.get("follow_up_questions", []),
+        }
+    except Exception:
+        metrics.parse_fallback()
+        return {"response": text, "follow_up_questions": []}
 
+
+class _JsonStringField:
+    """Incrementally decode one top-level string field from a JSON object being streamed.
+
+    feed() takes raw chunks of model output and returns whatever new text of the
+    field's value has become decodable, so it can be forwarded before the object closes.
+    """
+
+    def __init__(self, field: str):
+        self._key = f'"{field}"'
+        self._buf = ""
+        self._state = "seek"  # seek -> value -> done
+        self._pos = 0
+
+    def feed(self, chunk: str) -> str:
+        import json as _json
+        import re
+
+        self._buf += chunk
+        if self._state == "seek":
+            m = re.search(re.escape(self._key) + r'\s*:\s*"', self._buf)
+            if not m:
+                return ""
+            self._state = "value"
+            self._pos = m.end()
+        if self._state != "value":
+            return ""
+
+        out = []
+        buf, i = self._buf, self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self._state = "done"
+                i += 1
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            # Escape sequence — wait for the rest of it if it was split across chunks
+            if i + 1 >= len(buf):
+                break
+            if buf[i + 1] != "u":
+                out.append(_json.loads(f'"{buf[i:i + 2]}"'))
+                i += 2
+                continue
+            if i + 6 > len(buf):
+                break
+            width = 6
+            if 0xD800 <= int(buf[i + 2:i + 6], 16) <= 0xDBFF:
+                # High surrogate: decode together with the low surrogate that follows
+                if i + 12 > len(buf):
+                    break
+                width = 12
+            out.append(_json.loads(f'"{buf[i:i + width]}"'))
+            i += width
+        self._pos = i
+        return "".join(out)
+
+    @property
+    def started(self) -> bool:
+        return self._state != "seek"
+
+
+@metrics.endpoint("diagnose_stream")
+async def diagnose_stream(
+    problem_type: str,
+    task_details: str | None = None,
+    information: str | None = None,
+    task_fields: dict | None = None,
+    conversation: list[dict] | None = None,
+    user_email: str = "",
+):
+    """Streaming variant of diagnose().
+
+    Yields ("token", {"text": ...}) events carrying the "response" field as it is
+    generated, then ("done", {...}) with the same shape diagnose() returns. Onboarding
+    extraction has nothing to stream and is returned as a single "done" event.
+    """
+    if problem_type == "onboarding":
+        yield "done", await diagnose(problem_type, task_details, information, task_fields, conversation, user_email)
+        return
+
+    summary, recent = await _compact_history(problem_type, conversation, user_email)
+    with metrics.span("build_prompt"):
+        system, messages = _diagnosis_request(problem_type, task_details, information, task_fields, recent, summary)
+    field = _JsonStringField("response")
+    parts = []
+    async for text in _stream(
+        user_email,
+        **_diagnose_route(information, conversation),
+        system=system,
+        messages=messages,
+    ):
+        parts.append(text)
+        delta = field.feed(text)
+        if delta:
+            yield "token", {"text": delta}
+    headlights_tracker.track_activity(user_email, sessions=1)
+
+    with metrics.span("parse"):
+        result = _parse_diagnosis("".join(parts).strip())
+    if not field.started and result["response"]:
+        # Model didn't return JSON — nothing was streamed, so send the raw text now
+        yield "token", {"text": result["response"]}
+    yield "done", result
+
+
+@metrics.endpoint("check_suggestions")
+async def check_suggestions(completed_tasks: list[dict], user_email: str = "") -> list[dict]:
+    """Scan completed task notes for time-based suggestions and return new tasks to propose.
+
+    Notes without a temporal cue are dropped locally. Follow-ups are extracted
+    once per task and note content (cached), so repeat runs only compare the
+    cached due dates against today; only new or edited notes reach the model.
+    """
     import json as _json
-    from datetime import date
 
-    today = date.today().isoformat()
+    cues: list[dict] = []
+    pending = []
+    with metrics.span("build_prompt"):
+        for t in completed_tasks:
+            followup_cues.stats["tasks"] += 1
+            if not followup_cues.has_cue(t.get("note")):
+                followup_cues.stats["prefiltered"] += 1
+                continue
+            cached = await followup_cues.get_cached(t)
+            if cached is None:
+                pending.append(t)
+            else:
+                followup_cues.stats["cache_hits"] += 1
+                cues.extend(cached)
 
-    message = client.messages.create(
-        model="claude-sonnet-4-6",
-        max_tokens=1024,
-        system=f"{prompt_loader.get_suggestions_prompt()}\nToday is {today}.",
-        messages=[{"role": "user", "content": task_list}],
-    )
+    if pending:
+        task_list = "\n".join(
+            f"Task #{t['task_number']} (completed {t['date_completed']}): {t['title']}\n  Note: {t['note']}"
+            for t in pending
+        )
+        message = await _create(
+            user_email,
+            **model_router.choose("check_suggestions", input_chars=len(task_list)),
+            system=prompt_loader.get_suggestion_cues_prompt(),
+            messages=[{"role": "user", "content": task_list}],
+        )
 
-    headlights_tracker.track_tokens(user_email, message.usage.input_tokens, message.usage.output_tokens)
-    text = message.content[0].text.strip()
-    try:
-        return _json.loads(text)
-    except Exception:
-        return []
+        text = message.content[0].text.strip()
+        with metrics.span("parse"):
+            try:
+                extracted = [c for c in _json.loads(text) if isinstance(c, dict)]
+            except Exception:
+                metrics.parse_fallback()
+                extracted = None
+
+        # Don't cache a reply we couldn't read; those notes are retried next run
+        if extracted is not None:
+            followup_cues.stats["extracted"] += len(pending)
+            by_task: dict[str, list[dict]] = {}
+            for c in extracted:
+                by_task.setdefault(str(c.get("task_number")), []).append(c)
+            for t in pending:
+                found = by_task.get(str(t["task_number"]), [])
+                followup_cues.put_cached(t, found)
+                cues.extend(found)
+
+    due = [c for c in cues if followup_cues.is_due(c)]
+    followup_cues.stats["due"] += len(due)
+    return [{"title": c.get("title", ""), "reason": c.get("reason", "")} for c in due]
@@ -0,0 +1,100 @@
+"""Pack SQL lookup rows into advise_answer's prompt within a token budget.
+
+Rows are rendered as a pipe-separated table with the header printed once
+instead of repeating "column: value" on every row. Columns that carry no
+information are dropped first:
+
+    - all null / empty
+    - identifiers (id, user_id, *_uuid, UUID-shaped values) the model can't use
+    - one value on every row, which is stated once above the table instead
+
+Rows are then added until ADVISE_DATA_TOKEN_BUDGET (estimated locally, no
+tokenizer call) would be exceeded, and the remainder is summarised as a count.
+"""
+import os
+import re
+
+TOKEN_BUDGET = int(os.getenv("ADVISE_DATA_TOKEN_BUDGET", "2000"))
+# Long free-text cells (notes, descriptions) are cut to this many characters
+MAX_CELL_CHARS = int(os.getenv("ADVISE_DATA_MAX_CELL_CHARS", "200"))
+
+_ID_COLUMNS = frozenset({"id", "user_id", "uuid", "created_by", "updated_by"})
+_UUID = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.I)
+# Roughly how Claude's tokenizer splits text: words, digit runs and single symbols
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+stats = {"calls": 0, "rows_in": 0, "rows_packed": 0, "columns_dropped": 0, "estimated_tokens": 0}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate; long words count as several tokens."""
+    return sum(1 + len(p) // 8 for p in _TOKEN_PIECES.findall(text))
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    text = str(value).replace("\n", " ").replace("|", "/").strip()
+    if len(text) > MAX_CELL_CHARS:
+        text = text[:MAX_CELL_CHARS - 1].rstrip() + "…"
+    return text
+
+
+def _is_identifier(column: str, values: list[str]) -> bool:
+    name = column.lower()
+    if name in _ID_COLUMNS or name.endswith("_uuid"):
+        return True
+    present = [v for v in values if v]
+    return bool(present) and all(_UUID.match(v) for v in present)
+
+
+def pack_rows(rows: list[dict], budget: int | None = None) -> tuple[str, int]:
+    """Render rows as a compact table; returns (text, rows included)."""
+    budget = TOKEN_BUDGET if budget is None else budget
+    stats["calls"] += 1
+    stats["rows_in"] += len(rows)
+
+    columns: list[str] = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+    cells = {c: [_cell(row.get(c)) for row in rows] for c in columns}
+
+    kept, constants = [], []
+    for c in columns:
+        values = cells[c]
+        if not any(values) or _is_identifier(c, values):
+            continue
+        if len(rows) > 1 and len(set(values)) == 1:
+            constants.append(f"{c}={values[0]}")
+            continue
+        kept.append(c)
+    stats["columns_dropped"] += len(columns) - len(kept)
+
+    lines = []
+    if constants:
+        lines.append("  (every row has " + ", ".join(constants) + ")")
+    if kept:
+        lines.append("  " + " | ".join(kept))
+    used = estimate_tokens("\n".join(lines))
+
+    shown = 0
+    if kept:
+        for i in range(len(rows)):
+            line = "  " + " | ".join(cells[c][i] for c in kept)
+            cost = estimate_tokens(line) + 1
+            # Always show at least one row, even if it alone blows the budget
+            if shown and used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+            shown += 1
+    else:
+        shown = len(rows)
+
+    if shown < len(rows):
+        lines.append(f"  ... ({len(rows) - shown} more rows not shown)")
+    stats["rows_packed"] += shown
+    stats["estimated_tokens"] += used
+    return "\n".join(lines), shown
@@ -0,0 +1,143 @@
+"""Per-route deadlines and client-disconnect cancellation for /api/ requests.
+
+DeadlineMiddleware runs each /api/ request as a task and cancels it when the
+route's deadline passes or the client goes away, whichever comes first.
+Cancellation reaches the in-flight Messages API call through ai_service, so
+the upstream connection is closed and generation stops; ai_service tracks
+the partial usage to headlights_tracker on the way out.
+
+A request past its deadline gets a 504, or, if a stream has already started,
+a final "error" SSE event. A request whose client disconnected gets nothing,
+as there is nobody left to read it. Both are counted per route in
+bruce_http_cancelled_total.
+
+Deadlines are in seconds, per route path, overridable with
+AI_DEADLINE_<ROUTE> (path after /api/, "/" and "-" as "_", upper-cased:
+AI_DEADLINE_ADVISE_ANSWER_STREAM). Routes not listed use
+AI_DEADLINE_DEFAULT; 0 turns a deadline off.
+"""
+import os
+import asyncio
+import contextlib
+
+from services import metrics
+
+_DEFAULT_DEADLINES = {
+    "/api/ask": 60,
+    "/api/ask/stream": 120,
+    "/api/summarize": 30,
+    # Up to 1000 descriptions, SUMMARIZE_BATCH_CONCURRENCY at a time
+    "/api/summarize/batch": 600,
+    "/api/similar": 30,
+    "/api/generate-sql": 30,
+    "/api/advise": 120,
+    "/api/advise/plan": 30,
+    "/api/advise/answer": 90,
+    "/api/advise/answer/stream": 120,
+    "/api/check-suggestions": 60,
+    "/api/match-problem-type": 20,
+    "/api/diagnose": 90,
+    "/api/diagnose/stream": 120,
+}
+_DEFAULT = float(os.getenv("AI_DEADLINE_DEFAULT", "30"))
+
+
+def deadline(path: str) -> float:
+    """Seconds a request to path may run (0 = no deadline)."""
+    name = path.removeprefix("/api/").replace("/", "_").replace("-", "_").upper()
+    return float(os.getenv(f"AI_DEADLINE_{name}", _DEFAULT_DEADLINES.get(path, _DEFAULT)))
+
+
+def config() -> dict[str, float]:
+    return {path: deadline(path) for path in _DEFAULT_DEADLINES}
+
+
+class DeadlineMiddleware:
+    """ASGI middleware enforcing deadline() and cancelling on client disconnect.
+
+    Once the app has read the request body, the only message left on the
+    ASGI receive channel is http.disconnect, so a watcher takes over the
+    channel and hands the disconnect to the app's own listeners (such as
+    StreamingResponse) when it arrives.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        limit = deadline(scope["path"])
+        body_read = asyncio.Event()
+        disconnected = asyncio.Event()
+        response = {"started": False, "finished": False, "stream": False}
+
+        async def receive_wrapper():
+            if body_read.is_set():
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body"):
+                body_read.set()
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["started"] = True
+                content_type = dict(message.get("headers", [])).get(b"content-type", b"")
+                response["stream"] = content_type.startswith(b"text/event-stream")
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                response["finished"] = True
+            await send(message)
+
+        async def watch():
+            await body_read.wait()
+            await receive()
+            disconnected.set()
+
+        task = asyncio.create_task(self.app(scope, receive_wrapper, send_wrapper))
+        watcher = asyncio.create_task(watch())
+        try:
+            done, _ = await asyncio.wait(
+                {task, watcher}, timeout=limit or None, return_when=asyncio.FIRST_COMPLETED,
+            )
+            if task in done or response["finished"]:
+                # Finished, or the "disconnect" was just the end of a completed response
+                await task
+                return
+            reason = "disconnect" if watcher in done else "deadline"
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        finally:
+            watcher.cancel()
+            if not task.done():
+                # This request itself was cancelled (server shutdown)
+                task.cancel()
+
+        route = getattr(scope.get("route"), "path", scope["path"])
+        metrics.cancelled(route, reason)
+        print(f"[deadlines] {scope['method']} {route} cancelled: {reason}")
+        if reason == "deadline" and not response["finished"]:
+            await self._timed_out(send, response, limit)
+
+    @staticmethod
+    async def _timed_out(send, response: dict, limit: float) -> None:
+        import json as _json
+
+        detail = f"Request took longer than {limit:g}s"
+        if not response["started"]:
+            body = _json.dumps({"detail": detail}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 504,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        body = f"event: error\ndata: {_json.dumps({'message': detail})}\n\n".encode() if response["stream"] else b""
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,72 @@
+"""Local side of check_suggestions: temporal-cue prefilter and due-date checks.
+
+Most completed-task notes ("replaced toner", "reset password") carry no
+follow-up at all, so has_cue() drops them before anything reaches the model.
+For the notes that do, the model extracts each follow-up once as an absolute
+due date; those extractions are cached per task and note content, and every
+later run just compares the cached dates against today (is_due()).
+"""
+import os
+import re
+import json
+from datetime import date, timedelta
+
+from services import response_cache
+
+# Suggestions surface this many days before they fall due
+LEAD_DAYS = int(os.getenv("SUGGESTION_LEAD_DAYS", "14"))
+
+_NUMBER = r"(?:\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|couple of|few)"
+_UNIT = r"(?:day|week|month|year|quarter)s?"
+_MONTH = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*"
+_CUE = re.compile(
+    "|".join([
+        rf"\b(?:in|within|after|every|another)\s+(?:the\s+next\s+)?{_NUMBER}\s+{_UNIT}\b",
+        rf"\b{_NUMBER}[\s-]+{_UNIT}\s+(?:from|after|later|out)\b",
+        r"\b(?:next|this|end of(?: the)?|following)\s+(?:week|month|year|quarter|spring|summer|fall|autumn|winter|fiscal year)\b",
+        r"\b(?:annual(?:ly)?|yearly|quarterly|monthly|weekly|biannual(?:ly)?|semi-?annual(?:ly)?)\b",
+        rf"\b(?:by|before|after|until|on|in|around|early|mid|late)\s+{_MONTH}\b",
+        rf"\b{_MONTH}\s+\d{{1,2}}(?:st|nd|rd|th)?\b",
+        r"\b\d{4}-\d{2}-\d{2}\b",
+        r"\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b",
+        r"\b(?:q[1-4]|20\d\d)\b",
+        r"\b(?:follow[\s-]?up|revisit|re-?check|check (?:again|back)|remind(?:er)?|re-?evaluate|"
+        r"warranty|expir(?:e|es|ed|ing|ation)|renew(?:al)?|due|schedule[ds]?|end[\s-]of[\s-]life|eol)\b",
+    ]),
+    re.IGNORECASE,
+)
+
+stats = {"tasks": 0, "prefiltered": 0, "cache_hits": 0, "extracted": 0, "due": 0}
+
+
+def has_cue(note: str | None) -> bool:
+    """True if the note mentions anything that could schedule a follow-up."""
+    return bool(note) and _CUE.search(note) is not None
+
+
+def cache_key(task: dict) -> str:
+    """Key for a task's extracted cues; changes whenever the note (or its anchor date) does."""
+    return response_cache.make_key({
+        "task_number": task.get("task_number"),
+        "date_completed": task.get("date_completed"),
+        "title": task.get("title"),
+        "note": task.get("note"),
+    })
+
+
+async def get_cached(task: dict) -> list[dict] | None:
+    cached = await response_cache.get("suggestion_cues", cache_key(task))
+    return json.loads(cached) if cached is not None else None
+
+
+def put_cached(task: dict, cues: list[dict]) -> None:
+    response_cache.put("suggestion_cues", cache_key(task), json.dumps(cues))
+
+
+def is_due(cue: dict, today: date | None = None) -> bool:
+    """True once the cue's due date is within LEAD_DAYS (or already past)."""
+    try:
+        due = date.fromisoformat(str(cue.get("due_date"))[:10])
+    except ValueError:
+        return False
+    return due <= (today or date.today()) + timedelta(days=LEAD_DAYS)
@@ -1,25 +1,46 @@
-"""Fire-and-forget: write AI usage metrics to Headlights Supabase."""
+"""Fire-and-forget: write AI usage metrics to Headlights Supabase.
+
+Events are queued and summed per user by a single background writer, which
+flushes them every HEADLIGHTS_FLUSH_INTERVAL seconds (or once
+HEADLIGHTS_FLUSH_USERS users have pending deltas) as one atomic, batched
+increment via the bruce_increment_usage RPC
+(supabase/headlights-increment-usage.sql), sent over the shared postgrest pool.
+
+A batch that fails to write (or, on the per-user fallback, the users not yet
+written when a write fails) is kept and merged with newer events for the
+next flush, which waits for the next interval rather than the user count.
+At most HEADLIGHTS_MAX_PENDING_USERS users are held; deltas beyond that, or
+still unwritten at shutdown, are counted in stats["deltas_lost"].
+"""
 import os
-import json
+import time
+import queue
+import hashlib
+import atexit
 import threading
-import urllib.request
-import urllib.parse
 
+from services import postgrest
 
-def _get_url() -> str:
-    return os.getenv("HEADLIGHTS_SUPABASE_URL", "").strip()
+_FIELDS = (
+    "input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens",
+    "sessions", "uploads", "clicks",
+)
 
+_FLUSH_INTERVAL = float(os.getenv("HEADLIGHTS_FLUSH_INTERVAL", "5"))
+_FLUSH_USERS = int(os.getenv("HEADLIGHTS_FLUSH_USERS", "50"))
+_QUEUE_SIZE = int(os.getenv("HEADLIGHTS_QUEUE_SIZE", "10000"))
+_MAX_PENDING_USERS = int(os.getenv("HEADLIGHTS_MAX_PENDING_USERS", "5000"))
+# Longest a caller will wait for queue space before the event is dropped.
+_PUT_TIMEOUT = 0.05
 
-def _get_key() -> str:
-    return os.getenv("HEADLIGHTS_SUPABASE_KEY", "").strip()
+_STOP = object()
 
+_queue: queue.Queue = queue.Queue(maxsize=_QUEUE_SIZE)
+_worker: threading.Thread | None = None
+_worker_lock = threading.Lock()
+_rpc_available = True
 
-def _headers(key: str) -> dict:
-    return {
-        "apikey": key,
-        "Authorization": f"Bearer {key}",
-        "Content-Type": "application/json",
-    }
+stats = {"enqueued": 0, "dropped": 0, "flushes": 0, "flush_failures": 0, "deltas_lost": 0}
 
 
 def _update(
@@ -29,25 +50,23 @@ def _update(
     sessions: int = 0,
     uploads: int = 0,
     clicks: int = 0,
+    cache_read_tokens: int = 0,
+    cache_write_tokens: int = 0,
+    raise_errors: bool = False,
 ) -> None:
-    url = _get_url()
-    key = _get_key()
-    if not url or not key or not user_email:
+    if not postgrest.configured() or not user_email:
         return
 
     try:
-        encoded_email = urllib.parse.quote(user_email, safe="")
-        get_url = (
-            f"{url}/rest/v1/user_accounts"
-            f"?app_id=eq.bruce&email=eq.{encoded_email}"
-            f"&select=id,input_tokens,output_tokens,sessions,uploads,clicks"
-        )
-        req = urllib.request.Request(
-            get_url,
-            headers={"apikey": key, "Authorization": f"Bearer {key}"},
-        )
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            rows = json.loads(resp.read().decode())
+        # Prompt-cache columns are newer than the rest; only touch them when
+        # non-zero so this keeps working against tables that predate them.
+        cache_counts = {"cache_read_tokens": cache_read_tokens, "cache_write_tokens": cache_write_tokens}
+        cache_counts = {k: v for k, v in cache_counts.items() if v}
+        rows = postgrest.request("GET", "user_accounts", params={
+            "app_id": "eq.bruce",
+            "email": f"eq.{user_email}",
+            "select": "id,input_tokens,output_tokens,sessions,uploads,clicks" + "".join(f",{k}" for k in cache_counts),
+        }).json()
 
         if rows:
             row = rows[0]
@@ -61,18 +80,14 @@ def _update(
                 patch["uploads"]  = (row.get("uploads")  or 0) + uploads
             if clicks:
                 patch["clicks"]   = (row.get("clicks")   or 0) + clicks
+            for k, v in cache_counts.items():
+                patch[k] = (row.get(k) or 0) + v
             if patch:
-                patch_url = f"{url}/rest/v1/user_accounts?id=eq.{row['id']}"
-                req = urllib.request.Request(
-                    patch_url, data=json.dumps(patch).encode(),
-                    headers=_headers(key), method="PATCH",
-                )
-                with urllib.request.urlopen(req, timeout=5) as _:
-                    pass
+                postgrest.request("PATCH", "user_accounts", params={"id": f"eq.{row['id']}"}, json=patch)
         else:
-            import time
-            row_id = f"br-{int(time.time())}"
-            data = json.dumps({
+            # Same id scheme as the RPC: a batch can insert several new users in one second
+            row_id = f"br-{int(time.time())}-{hashlib.md5(user_email.encode()).hexdigest()[:6]}"
+            postgrest.request("POST", "user_accounts", json={
                 "id":            row_id,
                 "app_id":        "bruce",
                 "email":         user_email,
@@ -84,33 +99,175 @@ def _update(
                 "cost":          0,
                 "input_tokens":  input_tokens,
                 "output_tokens": output_tokens,
-            }).encode()
-            req = urllib.request.Request(
-                f"{url}/rest/v1/user_accounts",
-                data=data, headers=_headers(key), method="POST",
-            )
-            with urllib.request.urlopen(req, timeout=5) as _:
-                pass
+                **cache_counts,
+            })
 
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"[headlights_tracker] Failed to update: {e}")
 
 
-def track_tokens(user_email: str, input_tokens: int, output_tokens: int) -> None:
-    """Increment token counts for this user in Headlights. Non-blocking."""
-    if not input_tokens and not output_tokens:
+def _post_increments(pending: dict[str, dict[str, int]]) -> None:
+    """Apply summed deltas in one round-trip, or per user if the RPC isn't installed.
+
+    Users are removed from pending as they are written, so on an exception
+    pending holds exactly the deltas still to retry.
+    """
+    global _rpc_available
+    if not postgrest.configured() or not pending:
+        return
+
+    if _rpc_available:
+        try:
+            deltas = [{"email": email, **counts} for email, counts in pending.items()]
+            postgrest.request("POST", "rpc/bruce_increment_usage", json={"deltas": deltas})
+            pending.clear()
+            return
+        except postgrest.PostgrestError as e:
+            if e.status_code != 404:
+                raise
+            print("[headlights_tracker] bruce_increment_usage RPC missing; using per-user updates")
+            _rpc_available = False
+
+    # Fallback: safe against lost updates within this process because only the
+    # writer thread ever calls it.
+    for email in list(pending):
+        counts = pending[email]
+        _update(email, raise_errors=True, **{f: counts[f] for f in _FIELDS if counts.get(f)})
+        del pending[email]
+
+
+def _flush(pending: dict[str, dict[str, int]]) -> bool:
+    """Write pending deltas; False if some weren't written and are left in pending to retry."""
+    if not pending:
+        return True
+    users = len(pending)
+    try:
+        _post_increments(pending)
+        stats["flushes"] += 1
+        return True
+    except Exception as e:
+        stats["flush_failures"] += 1
+        print(f"[headlights_tracker] Failed to flush {len(pending)} of {users} users: {e}")
+        return False
+
+
+def _retain(pending: dict[str, dict[str, int]]) -> dict[str, dict[str, int]]:
+    """Deltas to carry over after a failed flush, capped at _MAX_PENDING_USERS users."""
+    if len(pending) <= _MAX_PENDING_USERS:
+        return pending
+    stats["deltas_lost"] += len(pending) - _MAX_PENDING_USERS
+    print(f"[headlights_tracker] Dropping {len(pending) - _MAX_PENDING_USERS} users' unwritten deltas")
+    return dict(list(pending.items())[:_MAX_PENDING_USERS])
+
+
+def _run() -> None:
+    pending: dict[str, dict[str, int]] = {}
+    failing = False
+    deadline = time.monotonic() + _FLUSH_INTERVAL
+    while True:
+        try:
+            item = _queue.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            item = None
+
+        if item is _STOP:
+            if not _flush(pending):
+                stats["deltas_lost"] += len(pending)
+            _queue.task_done()
+            return
+        if isinstance(item, threading.Event):
+            # Explicit flush() request
+            failing = not _flush(pending)
+            pending = _retain(pending) if failing else {}
+            deadline = time.monotonic() + _FLUSH_INTERVAL
+            item.set()
+            _queue.task_done()
+            continue
+        if item is not None:
+            email, counts = item
+            user = pending.setdefault(email, dict.fromkeys(_FIELDS, 0))
+            for field, n in counts.items():
+                user[field] += n
+            _queue.task_done()
+
+        if (len(pending) >= _FLUSH_USERS and not failing) or time.monotonic() >= deadline:
+            failing = not _flush(pending)
+            pending = _retain(pending) if failing else {}
+            deadline = time.monotonic() + _FLUSH_INTERVAL
+
+
+def _ensure_worker() -> None:
+    global _worker
+    if _worker is not None and _worker.is_alive():
         return
-    threading.Thread(
-        target=_update, daemon=True,
-        kwargs={"user_email": user_email, "input_tokens": input_tokens, "output_tokens": output_tokens},
-    ).start()
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="headlights-writer", daemon=True)
+            _worker.start()
+
+
+def _enqueue(user_email: str, **counts: int) -> None:
+    if not user_email:
+        return
+    _ensure_worker()
+    try:
+        _queue.put((user_email, counts), timeout=_PUT_TIMEOUT)
+        stats["enqueued"] += 1
+    except queue.Full:
+        stats["dropped"] += 1
+        print(f"[headlights_tracker] Queue full, dropped event for {user_email}")
+
+
+def track_tokens(
+    user_email: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_write_tokens: int = 0,
+) -> None:
+    """Increment token counts for this user in Headlights. Non-blocking.
+
+    cache_read_tokens / cache_write_tokens are the prompt-cache input tokens
+    (billed separately from input_tokens) reported by the Messages API.
+    """
+    if not input_tokens and not output_tokens and not cache_read_tokens and not cache_write_tokens:
+        return
+    _enqueue(
+        user_email,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cache_read_tokens=cache_read_tokens,
+        cache_write_tokens=cache_write_tokens,
+    )
 
 
 def track_activity(user_email: str, sessions: int = 0, uploads: int = 0, clicks: int = 0) -> None:
     """Increment activity counters for this user in Headlights. Non-blocking."""
     if not sessions and not uploads and not clicks:
         return
-    threading.Thread(
-        target=_update, daemon=True,
-        kwargs={"user_email": user_email, "sessions": sessions, "uploads": uploads, "clicks": clicks},
-    ).start()
+    _enqueue(user_email, sessions=sessions, uploads=uploads, clicks=clicks)
+
+
+def flush(timeout: float = 10.0) -> None:
+    """Write all pending deltas now and wait (up to timeout) for the flush to finish."""
+    if _worker is None or not _worker.is_alive():
+        return
+    done = threading.Event()
+    _queue.put(done)
+    done.wait(timeout)
+
+
+def shutdown(timeout: float = 10.0) -> None:
+    """Flush pending deltas and stop the writer thread."""
+    global _worker
+    worker = _worker
+    if worker is None or not worker.is_alive():
+        return
+    _queue.put(_STOP)
+    worker.join(timeout)
+    _worker = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,290 @@
+"""Prometheus metrics for the backend, served by main.py on /metrics.
+
+ai_service functions run under endpoint(name), which tags every span and
+token count recorded while they run (including inside tasks they spawn) with
+that endpoint. The ad-hoc stats dicts kept by other modules are exported
+as-is through _StatsCollector, so they show up without extra wiring.
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory before starting so /metrics aggregates the histograms, counters
+and gauges across workers. The stats dicts are per process and only reflect
+the worker that served the scrape.
+"""
+import os
+import time
+import inspect
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess, CONTENT_TYPE_LATEST,
+)
+from prometheus_client.core import CounterMetricFamily
+
+from services import traffic_capture
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+
+HTTP_LATENCY = Histogram(
+    "bruce_http_request_seconds",
+    "Time to response headers per route (streams: time to first byte).",
+    ["route", "method", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "bruce_ai_stage_seconds",
+    "Time spent per ai_service stage: build_prompt, upstream_call, first_token, parse, track.",
+    ["endpoint", "stage", "model"],
+    buckets=_LATENCY_BUCKETS,
+)
+TOKENS = Counter(
+    "bruce_ai_tokens_total",
+    "Tokens reported by the Messages API.",
+    ["endpoint", "model", "kind"],
+)
+ROUTE_LATENCY = Histogram(
+    "bruce_ai_route_seconds",
+    "Upstream call time per model_router route (streams: until the last token).",
+    ["endpoint", "route", "model"],
+    buckets=_LATENCY_BUCKETS,
+)
+ROUTE_TOKENS = Counter(
+    "bruce_ai_route_tokens_total",
+    "Tokens reported by the Messages API per model_router route.",
+    ["endpoint", "route", "model", "kind"],
+)
+QUEUE_DEPTH = Gauge(
+    "bruce_ai_queue_depth",
+    "Calls waiting in the scheduler for an upstream slot.",
+    ["priority"],
+    multiprocess_mode="livesum",
+)
+STARTUP = Gauge(
+    "bruce_startup_step_seconds",
+    "Time each lifespan warm-up step took on the last start.",
+    ["step"],
+    multiprocess_mode="max",
+)
+QUEUE_WAIT = Histogram(
+    "bruce_ai_queue_wait_seconds",
+    "Time calls spent waiting in the scheduler before going upstream.",
+    ["model", "priority"],
+    buckets=_LATENCY_BUCKETS,
+)
+PARSE_FALLBACKS = Counter(
+    "bruce_ai_parse_fallbacks_total",
+    "Model replies that failed to parse and took the fallback branch.",
+    ["endpoint"],
+)
+CANCELLED_REQUESTS = Counter(
+    "bruce_http_cancelled_total",
+    "Requests cancelled before finishing, by reason: deadline or disconnect.",
+    ["route", "reason"],
+)
+CANCELLED_CALLS = Counter(
+    "bruce_ai_cancelled_calls_total",
+    "Upstream calls abandoned before the reply was complete; their partial usage is still tracked.",
+    ["endpoint", "model"],
+)
+
+current_endpoint: ContextVar[str] = ContextVar("ai_endpoint", default="unknown")
+current_usage: ContextVar[dict | None] = ContextVar("ai_usage", default=None)
+current_route: ContextVar[str] = ContextVar("ai_route", default="")
+
+
+def endpoint(name: str):
+    """Decorator tagging everything recorded inside an ai_service function with name."""
+    def decorate(fn):
+        if inspect.isasyncgenfunction(fn):
+            @wraps(fn)
+            async def gen_wrapper(*args, **kwargs):
+                token = current_endpoint.set(name)
+                route_token = current_route.set("")
+                try:
+                    async for item in fn(*args, **kwargs):
+                        yield item
+                finally:
+                    try:
+                        current_route.reset(route_token)
+                        current_endpoint.reset(token)
+                    except ValueError:
+                        # Finalized from a different context (e.g. client disconnect)
+                        pass
+            return gen_wrapper
+
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            token = current_endpoint.set(name)
+            route_token = current_route.set("")
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                current_route.reset(route_token)
+                current_endpoint.reset(token)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def span(stage: str, model: str = ""):
+    """Time a stage of the current endpoint."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, model)
+
+
+def observe(stage: str, seconds: float, model: str = "") -> None:
+    STAGE_LATENCY.labels(current_endpoint.get(), stage, model).observe(seconds)
+    traffic_capture.stage(stage, seconds)
+
+
+def observe_route(seconds: float, model: str = "") -> None:
+    """Record an upstream call's time against the route model_router picked for it."""
+    route = current_route.get()
+    if route:
+        ROUTE_LATENCY.labels(current_endpoint.get(), route, model).observe(seconds)
+
+
+@contextmanager
+def usage():
+    """Sum token counts recorded inside the block (and tasks created in it) into a dict."""
+    totals: dict[str, int] = {}
+    token = current_usage.set(totals)
+    try:
+        yield totals
+    finally:
+        current_usage.reset(token)
+
+
+def count_tokens(model: str, **counts: int) -> None:
+    name = current_endpoint.get()
+    totals = current_usage.get()
+    route = current_route.get()
+    for kind, n in counts.items():
+        if n:
+            TOKENS.labels(name, model, kind).inc(n)
+            if route:
+                ROUTE_TOKENS.labels(name, route, model, kind).inc(n)
+            if totals is not None:
+                totals[kind] = totals.get(kind, 0) + n
+
+
+def parse_fallback() -> None:
+    PARSE_FALLBACKS.labels(current_endpoint.get()).inc()
+
+
+def cancelled(route: str, reason: str) -> None:
+    CANCELLED_REQUESTS.labels(route, reason).inc()
+
+
+def cancelled_call(model: str = "") -> None:
+    CANCELLED_CALLS.labels(current_endpoint.get(), model).inc()
+
+
+class _StatsCollector:
+    """Expose module-level stats dicts (counters only) as Prometheus counters."""
+
+    def describe(self):
+        # Metric names depend on the dicts' keys; skip collect() at registration time
+        return []
+
+    def collect(self):
+        from services import (
+            ai_service, context_packer, followup_cues, headlights_tracker,
+            model_router, onboarding_extractor, postgrest, problem_classifier, query_executor,
+            response_cache, scheduler, similar_incidents, sql_guard,
+        )
+
+        flat = [
+            ("bruce_ai", ai_service.stats),
+            ("bruce_headlights", headlights_tracker.stats),
+            ("bruce_postgrest", postgrest.stats),
+            ("bruce_scheduler", scheduler.stats),
+            ("bruce_problem_classifier", problem_classifier.stats),
+            ("bruce_context_packer", context_packer.stats),
+            ("bruce_followup_cues", followup_cues.stats),
+            ("bruce_similar_incidents", similar_incidents.stats),
+            ("bruce_onboarding_extractor", onboarding_extractor.stats),
+            ("bruce_sql_guard", sql_guard.stats),
+            ("bruce_query_executor", query_executor.stats),
+            ("bruce_traffic_capture", traffic_capture.stats),
+        ]
+        for prefix, stats in flat:
+            for key, value in list(stats.items()):
+                yield CounterMetricFamily(f"{prefix}_{key}", f"{prefix} {key}", value=value)
+
+        cache = CounterMetricFamily(
+            "bruce_response_cache", "Response cache lookups by endpoint and outcome.",
+            labels=["endpoint", "outcome"],
+        )
+        for name, counts in list(response_cache.stats.items()):
+            for outcome, value in counts.items():
+                cache.add_metric([name, outcome], value)
+        yield cache
+
+        routes = CounterMetricFamily(
+            "bruce_ai_route_calls", "Calls per model_router route.", labels=["route"],
+        )
+        for route, counts in list(model_router.stats.items()):
+            routes.add_metric([route], counts["calls"])
+        yield routes
+
+
+REGISTRY.register(_StatsCollector())
+
+
+class TimingMiddleware:
+    """ASGI middleware recording HTTP_LATENCY per route template.
+
+    Plain ASGI rather than @app.middleware so streaming responses and client
+    disconnects pass through untouched; timing stops when headers are sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        recorded = False
+
+        def record(status: int):
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            # Label by route template (/api/issues/{id}), not raw path, to bound cardinality
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_LATENCY.labels(route, scope["method"], str(status)).observe(time.perf_counter() - start)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record(500)
+
+
+def render() -> tuple[bytes, str]:
+    """Return (body, content type) for the /metrics response."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_StatsCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def shutdown() -> None:
+    """Drop this worker's live gauges from the multiprocess files when it exits."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
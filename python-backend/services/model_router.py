@@ -0,0 +1,187 @@
+"""Pick the model and max_tokens for each ai_service call.
+
+Every call site asks choose(key, **features) instead of hard-coding a model.
+Each key maps to an ordered list of rules; the first rule whose "when"
+conditions all hold wins, and the last rule (no "when") is the default:
+
+    {"generate_sql": [
+        {"name": "simple", "when": {"complexity": "simple"}, "model": "claude-haiku-4-5-20251001", "max_tokens": 256},
+        {"name": "default", "model": "claude-sonnet-4-6", "max_tokens": 512}]}
+
+Condition keys compare against the features the caller passes: max_<f> means
+features[f] <= value, min_<f> means >=, anything else must be equal.
+
+Rules start from _DEFAULT_ROUTES, overlaid with the JSON file at
+AI_ROUTES_PATH if set, and can be replaced per key at runtime with update()
+(PUT /api/routing with X-Admin-Token). AI_ROUTING=0 (or {"enabled": false}
+on the same route) pins every key to its default rule, which matches the old
+hard-coded behaviour, so the two can be compared on live traffic.
+"""
+import os
+import re
+import json
+import copy
+import threading
+
+from services import metrics
+
+SONNET = "claude-sonnet-4-6"
+HAIKU = "claude-haiku-4-5-20251001"
+
+_DEFAULT_ROUTES: dict[str, list[dict]] = {
+    "ask": [
+        {"name": "default", "model": SONNET, "max_tokens": 1024},
+    ],
+    "summarize_incident": [
+        {"name": "default", "model": HAIKU, "max_tokens": 30},
+    ],
+    "generate_sql": [
+        {"name": "simple", "when": {"complexity": "simple"}, "model": HAIKU, "max_tokens": 256},
+        {"name": "default", "model": SONNET, "max_tokens": 512},
+    ],
+    "advise_plan": [
+        {"name": "default", "model": SONNET, "max_tokens": 512},
+    ],
+    "advise_answer": [
+        # No looked-up rows and a short question: the answer only covers the task list
+        {"name": "no_data", "when": {"has_data": False, "max_input_chars": 300}, "model": SONNET, "max_tokens": 1024},
+        {"name": "default", "model": SONNET, "max_tokens": 2048},
+    ],
+    "match_problem_type": [
+        {"name": "default", "model": HAIKU, "max_tokens": 256},
+    ],
+    "onboarding": [
+        # The local extractor resolved most fields; the rest are simple lookups in the text
+        {"name": "fill_gaps", "when": {"max_missing": 4}, "model": HAIKU, "max_tokens": 256},
+        {"name": "default", "model": SONNET, "max_tokens": 512},
+    ],
+    "diagnose": [
+        # A short answer to a follow-up question rarely needs the full budget
+        {"name": "short_turn", "when": {"min_turns": 1, "max_input_chars": 400}, "model": SONNET, "max_tokens": 1024},
+        {"name": "default", "model": SONNET, "max_tokens": 2048},
+    ],
+    "diagnose_history": [
+        {"name": "default", "model": HAIKU, "max_tokens": 400},
+    ],
+    "similar_rerank": [
+        {"name": "default", "model": HAIKU, "max_tokens": 800},
+    ],
+    "check_suggestions": [
+        {"name": "default", "model": SONNET, "max_tokens": 1024},
+    ],
+}
+
+# Questions needing joins, grouping or comparisons stay on the stronger model
+_COMPLEX_SQL = re.compile(
+    r"\b(join|compare|compared|versus|vs|trend|average|avg|median|per|each|group|grouped|rank|ranking|"
+    r"top \d+|most|least|ratio|percent|percentage|over time|by month|by week|by site|by type|"
+    r"both|across|without|never|except|whose|which of)\b",
+    re.IGNORECASE,
+)
+
+_ENABLED = os.getenv("AI_ROUTING", "1") == "1"
+
+_lock = threading.Lock()
+_routes: dict[str, list[dict]] = {}
+
+stats: dict[str, dict[str, int]] = {}
+
+
+def sql_complexity(question: str, target: str) -> str:
+    """'simple' for a short single-table question, else 'complex'."""
+    other = "assets" if target == "tasks" else "task"
+    if len(question) > 160 or _COMPLEX_SQL.search(question) or other in question.lower():
+        return "complex"
+    return "simple"
+
+
+def _validate(key: str, rules) -> list[dict]:
+    if not isinstance(rules, list) or not rules:
+        raise ValueError(f"{key}: expected a non-empty list of rules")
+    for rule in rules:
+        if not isinstance(rule, dict) or not rule.get("name") or not rule.get("model"):
+            raise ValueError(f"{key}: every rule needs a name and a model")
+        if not isinstance(rule.get("max_tokens"), int) or rule["max_tokens"] <= 0:
+            raise ValueError(f"{key}/{rule['name']}: max_tokens must be a positive integer")
+        if not isinstance(rule.get("when", {}), dict):
+            raise ValueError(f"{key}/{rule['name']}: when must be an object")
+    if rules[-1].get("when"):
+        raise ValueError(f"{key}: the last rule is the default and can't have conditions")
+    return rules
+
+
+def _load() -> dict[str, list[dict]]:
+    routes = copy.deepcopy(_DEFAULT_ROUTES)
+    path = os.getenv("AI_ROUTES_PATH", "").strip()
+    if path:
+        try:
+            with open(path) as f:
+                for key, rules in json.load(f).items():
+                    routes[key] = _validate(key, rules)
+        except (OSError, ValueError) as e:
+            print(f"[model_router] Ignoring {path}: {e}")
+    return routes
+
+
+def _get_routes() -> dict[str, list[dict]]:
+    global _routes
+    if not _routes:
+        with _lock:
+            if not _routes:
+                _routes = _load()
+    return _routes
+
+
+def config() -> dict[str, list[dict]]:
+    return copy.deepcopy(_get_routes())
+
+
+def enabled() -> bool:
+    return _ENABLED
+
+
+def update(changes: dict[str, list[dict]], enabled: bool | None = None) -> dict[str, list[dict]]:
+    """Replace the rules for the given keys; raises ValueError without applying anything if invalid."""
+    global _routes, _ENABLED
+    validated = {key: _validate(key, rules) for key, rules in changes.items()}
+    current = _get_routes()
+    with _lock:
+        _routes = {**current, **copy.deepcopy(validated)}
+        if enabled is not None:
+            _ENABLED = enabled
+    return config()
+
+
+def reset() -> None:
+    """Drop runtime changes and go back to the defaults (plus AI_ROUTES_PATH)."""
+    global _routes
+    with _lock:
+        _routes = {}
+
+
+def _matches(when: dict, features: dict) -> bool:
+    for cond, expected in when.items():
+        if cond.startswith("max_"):
+            value = features.get(cond[4:])
+            if value is None or value > expected:
+                return False
+        elif cond.startswith("min_"):
+            value = features.get(cond[4:])
+            if value is None or value < expected:
+                return False
+        elif features.get(cond) != expected:
+            return False
+    return True
+
+
+def choose(key: str, **features) -> dict:
+    """Return {"model", "max_tokens"} for a call and tag its metrics with the route taken."""
+    rules = _get_routes()[key]
+    rule = rules[-1]
+    if _ENABLED:
+        rule = next((r for r in rules if _matches(r.get("when", {}), features)), rule)
+    route = f"{key}/{rule['name']}"
+    counts = stats.setdefault(route, {"calls": 0})
+    counts["calls"] += 1
+    metrics.current_route.set(route)
+    return {"model": rule["model"], "max_tokens": rule["max_tokens"]}
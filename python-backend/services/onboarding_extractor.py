@@ -0,0 +1,331 @@
+"""Local fast path for onboarding extraction in diagnose.
+
+Most new-hire fields are closed vocabularies or regular formats: the role
+and site come from fixed tables, the start date is a date, asset numbers and
+computer names follow a pattern. extract() resolves what it can with
+matchers built from those tables plus a small date parser, and returns the
+fields it couldn't pin down; ai_service only asks the model for those.
+
+A field counts as resolved when exactly one value matches, or when the text
+doesn't mention it at all (start date, asset number and computer name are
+then ""). Anything ambiguous — two roles, two dates, a start cue with a date
+the parser can't read — is left to the model rather than guessed.
+
+Notes are the one open-ended field. leftover() strips everything the
+matchers account for; when enough words remain, they are sent to the model
+as a notes gap even if every other field resolved.
+
+ROLES and SITES mirror src/data/roles.ts and src/data/sites.ts (the keys
+the onboarding page accepts); keep them in sync.
+"""
+import os
+import re
+from datetime import date, timedelta
+
+# Words left over after the matchers before notes are worth asking the model for
+_NOTES_MIN_WORDS = int(os.getenv("ONBOARDING_NOTES_MIN_WORDS", "3"))
+
+FIELDS = ("firstName", "lastName", "role", "site", "startDate", "nextAssetNumber", "computerName")
+
+# key -> label, phrases matched case-insensitively, acronyms that are also
+# everyday words ("it", "Don") matched in capitals only
+ROLES: dict[str, tuple[str, list[str], list[str]]] = {
+    "executive": ("Executive", [
+        "executive", "executive director", "administrator", "nursing home administrator",
+        "ceo", "cfo", "coo", "chief executive", "chief financial officer", "chief operating officer",
+    ], ["ED"]),
+    "business_office": ("Business Office", [
+        "business office", "billing", "biller", "accounts payable", "accounts receivable",
+        "bookkeeper", "payroll", "business office manager", "bom",
+    ], []),
+    "admissions": ("Admissions", [
+        "admissions", "admission", "admissions coordinator", "admissions director", "intake",
+    ], []),
+    "hr": ("Human Resources", ["human resources", "recruiter", "hr generalist", "hr manager"], ["HR"]),
+    "don_adon": ("DON / ADON", [
+        "director of nursing", "assistant director of nursing", "adon",
+    ], ["DON"]),
+    "social_services": ("Social Services / Case Mgr", [
+        "social services", "social worker", "case manager", "case mgr", "discharge planner",
+    ], []),
+    "activities": ("Activities", [
+        "activities", "activity director", "activities director", "activity aide", "recreation",
+    ], []),
+    "sdc": ("SDC", ["sdc", "staff development", "staff development coordinator", "staff educator"], []),
+    "home_health": ("Home Healthcare", ["home health", "home healthcare", "home care", "visiting nurse"], []),
+    "maintenance": ("Maintenance", ["maintenance", "maintenance director", "maintenance tech", "facilities"], []),
+    "kitchen": ("Kitchen / Food Services", [
+        "kitchen", "food service", "food services", "dietary", "dietary aide", "dietitian",
+        "cook", "chef", "dishwasher",
+    ], []),
+    "concierge": ("Concierge", ["concierge", "receptionist", "front desk"], []),
+    "it": ("IT", [
+        "information technology", "help desk", "helpdesk", "it technician", "it support",
+        "network administrator", "system administrator", "systems administrator",
+    ], ["IT"]),
+    "clinical_floor": ("CNA / Floor Clinical", [
+        "cna", "lpn", "rn", "nurse", "nursing assistant", "nurse aide", "charge nurse", "floor nurse",
+        "med tech", "medication technician", "caregiver", "floor clinical",
+    ], []),
+}
+
+# key -> label, phrases, computer-name prefix
+SITES: dict[str, tuple[str, list[str], str]] = {
+    "holden": ("Holden (HRSNC)", ["holden", "hrsnc", "hnh"], "HNH"),
+    "oakdale": ("Oakdale (ORSNC)", ["oakdale", "orsnc"], "ORSNC"),
+    "business": ("Business Office (OHC)", ["business office", "ohc"], "BUS"),
+}
+
+_MONTHS = {m: i + 1 for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+)}
+_WEEKDAYS = {d: i for i, d in enumerate(["mon", "tue", "wed", "thu", "fri", "sat", "sun"])}
+_MONTH = r"(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sept?(?:ember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+_WEEKDAY = r"(mon|tue|wed|thu|fri|sat|sun)(?:day|sday|nesday|rsday|urday)?"
+
+_DATE_PATTERNS = [
+    ("iso", re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")),
+    ("us", re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2}|\d{4}))?\b")),
+    ("month_day", re.compile(rf"\b{_MONTH}\s+(\d{{1,2}})(?:st|nd|rd|th)?\b(?:,?\s+(\d{{4}}))?", re.IGNORECASE)),
+    ("day_month", re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?{_MONTH}(?:,?\s+(\d{{4}}))?", re.IGNORECASE)),
+    ("weekday", re.compile(rf"\b(?:(next|this|on)\s+)?{_WEEKDAY}\b", re.IGNORECASE)),
+    ("relative", re.compile(r"\b(today|tomorrow)\b", re.IGNORECASE)),
+]
+_START_CUE = re.compile(
+    r"\b(?:start(?:s|ing)?|start\s+date|begin(?:s|ning)?|first\s+day|join(?:s|ing)?|hire\s+date|onboard(?:ing)?\s+(?:on|date))\b",
+    re.IGNORECASE,
+)
+# Something date-like after a start cue that the patterns above didn't read
+_DATE_HINT = re.compile(rf"\d|{_MONTH}|{_WEEKDAY}|\b(?:next|week|month|first|end)\b", re.IGNORECASE)
+
+_ASSET_CUE = re.compile(r"\basset\b", re.IGNORECASE)
+_ASSET = re.compile(
+    r"\basset\s*(?:tag|number|num|no\.?)?\s*(?:is|:|=|-)?\s*#?\s*([A-Z]{0,4}\d[\w-]*)", re.IGNORECASE,
+)
+_COMPUTER_CUE = re.compile(r"\b(?:computer|pc|device|machine)\s*name\b|\bhostname\b", re.IGNORECASE)
+_COMPUTER_LABELED = re.compile(
+    r"\b(?:computer|pc|device|machine)\s*name\s*(?:is|:|=|-)?\s*([A-Za-z0-9][\w-]{1,30})|\bhostname\s*(?:is|:|=|-)?\s*([A-Za-z0-9][\w-]{1,30})",
+    re.IGNORECASE,
+)
+_COMPUTER_CODED = re.compile(rf"\b(?:{'|'.join(code for _, _, code in SITES.values())})-[A-Z0-9]{{1,12}}\b")
+
+_NAME = r"([A-Z][a-z][\w'’-]*)\s+((?:(?:de|del|da|di|van|von|la|le)\s+)?[A-Z][\w'’-]+)"
+_NAME_PATTERNS = [
+    re.compile(rf"\b(?i:name|employee|new\s+hire|hire)\s*(?:is|:|-)\s*{_NAME}"),
+    re.compile(rf"\b(?i:new\s+hire|new\s+employee|onboard(?:ing)?|welcome|named|hired)\s+{_NAME}"),
+    re.compile(rf"\b{_NAME}\s+(?i:is\s+(?:starting|joining|our\s+new|a\s+new|the\s+new)|starts|will\s+start|begins|joins|is\s+joining)\b"),
+]
+_FIRST_NAME = re.compile(r"\b(?i:first\s*name)\s*(?:is|:|-)\s*([A-Z][\w'’-]+)")
+_LAST_NAME = re.compile(r"\b(?i:last\s*name|surname)\s*(?:is|:|-)\s*([A-Z][\w'’-]+(?:\s+[A-Z][\w'’-]+)?)")
+
+
+def _phrase_regex(phrases: list[str], acronyms: list[str]) -> re.Pattern:
+    words = "|".join(re.escape(p).replace(r"\ ", r"\s+") for p in sorted(phrases, key=len, reverse=True))
+    caps = "|".join(re.escape(a) for a in acronyms)
+    return re.compile(rf"\b(?i:{words})\b" + (rf"|\b(?:{caps})\b" if caps else ""))
+
+
+_ROLE_MATCHERS = {key: _phrase_regex(phrases, acronyms) for key, (_, phrases, acronyms) in ROLES.items()}
+_SITE_MATCHERS = {key: _phrase_regex(phrases, []) for key, (_, phrases, _) in SITES.items()}
+_ROLE_LABEL = re.compile(r"\b(?i:role|position|title|job)\s*(?:is|:|-)\s*([^\n.;,]+)")
+_SITE_LABEL = re.compile(r"\b(?i:site|location|facility|building)\s*(?:is|:|-)\s*([^\n.;,]+)")
+
+# Capitalised words that start sentences or name places, never a new hire
+_NOT_NAMES = frozenset(
+    w.lower() for w in
+    ["The", "New", "Our", "This", "Next", "Please", "Hire", "Start", "Starting", "Name"]
+    + [label for label, _, _ in SITES.values()] + [p for _, phrases, _ in SITES.values() for p in phrases]
+    + [p for _, phrases, _ in ROLES.values() for p in phrases]
+    + list(_MONTHS) + ["january", "february", "march", "april", "june", "july", "august", "september",
+                       "october", "november", "december", "monday", "tuesday", "wednesday", "thursday",
+                       "friday", "saturday", "sunday"]
+)
+
+# Section headers ai_service puts around the text, and words that only connect field values
+_HEADER = re.compile(r"\b(?:task\s+details|information\s+gathered|no\s+information\s+provided)\b", re.IGNORECASE)
+_FILLER = frozenset("""
+    a an the and or but of to in on at by for from with as is are was be will would should can
+    he she they them their his her its it we our us you your i me my this that these those who
+    new hire hired employee staff member person name named first last role position title job
+    site location facility building start starts starting started date day begin begins beginning
+    join joins joining onboard onboarding asset tag number computer pc device machine hostname
+    please set up setup get getting next week month today tomorrow also here there
+""".split())
+_WORD = re.compile(r"[A-Za-z][A-Za-z'’-]+")
+
+stats = {"extractions": 0, "fully_local": 0, "model_fallbacks": 0, "fields_local": 0, "fields_model": 0,
+         "notes_gaps": 0}
+
+
+def _unique(values: list) -> list:
+    return list(dict.fromkeys(values))
+
+
+def _match_one(text: str, matchers: dict[str, re.Pattern]) -> list[str]:
+    """Keys whose phrases occur in text, ignoring matches inside a longer one ("visiting nurse")."""
+    spans = [(m.start(), m.end(), key) for key, rx in matchers.items() for m in rx.finditer(text)]
+    kept = [
+        key for start, end, key in spans
+        if not any(s <= start and end <= e and e - s > end - start for s, e, _ in spans)
+    ]
+    return _unique(kept)
+
+
+def match_role(text: str) -> str | None:
+    """The one role key text names, or None when it names none or several."""
+    labeled = _ROLE_LABEL.search(text)
+    if labeled:
+        found = _match_one(labeled.group(1), _ROLE_MATCHERS)
+        if len(found) == 1:
+            return found[0]
+    if text.strip().lower() in ROLES:
+        return text.strip().lower()
+    found = _match_one(text, _ROLE_MATCHERS)
+    return found[0] if len(found) == 1 else None
+
+
+def match_site(text: str) -> str | None:
+    """The one site key text names, or None when it names none or several."""
+    labeled = _SITE_LABEL.search(text)
+    if labeled:
+        found = _match_one(labeled.group(1), _SITE_MATCHERS)
+        if len(found) == 1:
+            return found[0]
+    if text.strip().lower() in SITES:
+        return text.strip().lower()
+    found = _match_one(text, _SITE_MATCHERS)
+    if len(found) > 1 and "business" in found:
+        # "Business office" is also a role; a named facility wins over it
+        found.remove("business")
+    return found[0] if len(found) == 1 else None
+
+
+def _make_date(year: int | None, month: int, day: int, today: date) -> date | None:
+    try:
+        if year is not None:
+            return date(year + 2000 if year < 100 else year, month, day)
+        # No year: start dates are upcoming, so a date well in the past means next year
+        candidate = date(today.year, month, day)
+        return candidate if candidate >= today - timedelta(days=30) else date(today.year + 1, month, day)
+    except ValueError:
+        return None
+
+
+def find_dates(text: str, today: date | None = None) -> list[tuple[int, date]]:
+    """Every date text mentions, as (position, date)."""
+    today = today or date.today()
+    found = []
+    for kind, rx in _DATE_PATTERNS:
+        for m in rx.finditer(text):
+            g = m.groups()
+            if kind == "iso":
+                d = _make_date(int(g[0]), int(g[1]), int(g[2]), today)
+            elif kind == "us":
+                d = _make_date(int(g[2]) if g[2] else None, int(g[0]), int(g[1]), today)
+            elif kind == "month_day":
+                d = _make_date(int(g[2]) if g[2] else None, _MONTHS[g[0][:3].lower()], int(g[1]), today)
+            elif kind == "day_month":
+                d = _make_date(int(g[2]) if g[2] else None, _MONTHS[g[1][:3].lower()], int(g[0]), today)
+            elif kind == "weekday":
+                ahead = (_WEEKDAYS[g[1][:3].lower()] - today.weekday()) % 7 or 7
+                d = today + timedelta(days=ahead)
+            else:
+                d = today if g[0].lower() == "today" else today + timedelta(days=1)
+            if d is not None:
+                found.append((m.start(), d))
+    return sorted(found)
+
+
+def _start_date(text: str, today: date) -> str | None:
+    dates = find_dates(text, today)
+    distinct = _unique(d for _, d in dates)
+    if len(distinct) == 1:
+        return distinct[0].isoformat()
+    cues = [m.end() for m in _START_CUE.finditer(text)]
+    if len(distinct) > 1:
+        # Several dates: take the one right after a start cue, if exactly one is
+        near = _unique(d for pos, d in dates for cue in cues if 0 <= pos - cue <= 40)
+        return near[0].isoformat() if len(near) == 1 else None
+    if any(_DATE_HINT.search(text[cue:cue + 40]) for cue in cues):
+        return None
+    return ""
+
+
+def _names(text: str) -> tuple[str | None, str | None]:
+    first = _FIRST_NAME.search(text)
+    last = _LAST_NAME.search(text)
+    if first and last:
+        return first.group(1), last.group(1)
+    candidates = []
+    for rx in _NAME_PATTERNS:
+        for m in rx.finditer(text):
+            given, family = m.group(1), m.group(2)
+            if given.lower() not in _NOT_NAMES and family.lower() not in _NOT_NAMES:
+                candidates.append((given, family))
+    candidates = _unique(candidates)
+    if len(candidates) == 1:
+        return candidates[0]
+    return (first.group(1) if first else None), (last.group(1) if last else None)
+
+
+def _asset_number(text: str) -> str | None:
+    found = _unique(m.group(1) for m in _ASSET.finditer(text))
+    if len(found) == 1:
+        return found[0]
+    return "" if not found and not _ASSET_CUE.search(text) else None
+
+
+def _computer_name(text: str) -> str | None:
+    found = _unique([next(g for g in m.groups() if g) for m in _COMPUTER_LABELED.finditer(text)]
+                    + [m.group(0) for m in _COMPUTER_CODED.finditer(text)])
+    if len(found) == 1:
+        return found[0]
+    return "" if not found and not _COMPUTER_CUE.search(text) else None
+
+
+def extract(text: str, today: date | None = None) -> tuple[dict, list[str]]:
+    """Resolve what the text pins down; returns (fields, names of unresolved fields)."""
+    today = today or date.today()
+    first, last = _names(text)
+    values = {
+        "firstName": first,
+        "lastName": last,
+        "role": match_role(text),
+        "site": match_site(text),
+        "startDate": _start_date(text, today),
+        "nextAssetNumber": _asset_number(text),
+        "computerName": _computer_name(text),
+    }
+    missing = [f for f in FIELDS if values[f] is None]
+    return {f: v for f, v in values.items() if v is not None}, missing
+
+
+def leftover(text: str) -> str:
+    """text with everything the field matchers account for removed; "" when only filler remains."""
+    matchers = [
+        *_ROLE_MATCHERS.values(), *_SITE_MATCHERS.values(), *(rx for _, rx in _DATE_PATTERNS), *_NAME_PATTERNS,
+        _FIRST_NAME, _LAST_NAME, _START_CUE, _ASSET, _ASSET_CUE, _COMPUTER_LABELED, _COMPUTER_CODED, _COMPUTER_CUE,
+        _HEADER,
+    ]
+    spans = sorted((m.start(), m.end()) for rx in matchers for m in rx.finditer(text))
+    parts, pos = [], 0
+    for start, end in spans:
+        if start > pos:
+            parts.append(text[pos:start])
+        pos = max(pos, end)
+    parts.append(text[pos:])
+    words = [w for w in _WORD.findall(" ".join(parts)) if w.lower() not in _FILLER and w.lower() not in _NOT_NAMES]
+    return " ".join(words) if len(words) >= _NOTES_MIN_WORDS else ""
+
+
+def normalize(field: str, value) -> str:
+    """Coerce a model-supplied value onto the vocabularies the frontend accepts."""
+    value = str(value or "").strip()
+    if field == "role":
+        return value if value in ROLES else (match_role(value) or "")
+    if field == "site":
+        return value if value in SITES else (match_site(value) or "")
+    if field == "startDate" and value:
+        dates = find_dates(value)
+        return dates[0][1].isoformat() if dates else ""
+    return value
@@ -0,0 +1,194 @@
+"""Shared, pooled HTTP access to the Headlights Supabase PostgREST API.
+
+One keep-alive connection pool per process (HTTP/2 when the h2 package is
+installed) with the base URL and auth headers set once, instead of a fresh
+TCP+TLS handshake per urllib call. Transient failures (connection errors,
+429, 5xx) are retried with jittered exponential backoff; POSTs only when the
+request can't have been applied.
+
+A circuit breaker sits in front of every call: after HEADLIGHTS_BREAKER_THRESHOLD
+consecutive transient failures every call fails fast with CircuitOpenError
+for HEADLIGHTS_BREAKER_COOLDOWN seconds, then a single probe is let through.
+A Headlights outage therefore costs callers one quick exception instead of a
+timeout per call.
+
+This is a thread-safe sync client, not an httpx.AsyncClient, on purpose.
+Every caller is already off the event loop: headlights_tracker's writer
+thread, and prompt_loader's startup, refresh and reload, which run through
+asyncio.to_thread. An async client would need an event loop in the writer
+thread, and it would be bound to whichever loop first used it. No request
+handler ever waits on Headlights.
+"""
+import os
+import time
+import random
+import threading
+
+import httpx
+
+_TIMEOUT = httpx.Timeout(
+    float(os.getenv("HEADLIGHTS_TIMEOUT", "5")),
+    connect=float(os.getenv("HEADLIGHTS_CONNECT_TIMEOUT", "2")),
+)
+_LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=10, keepalive_expiry=60)
+_RETRIES = int(os.getenv("HEADLIGHTS_RETRIES", "2"))
+_BACKOFF = float(os.getenv("HEADLIGHTS_BACKOFF", "0.2"))
+_BREAKER_THRESHOLD = int(os.getenv("HEADLIGHTS_BREAKER_THRESHOLD", "5"))
+_BREAKER_COOLDOWN = float(os.getenv("HEADLIGHTS_BREAKER_COOLDOWN", "30"))
+
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+_lock = threading.Lock()
+_client: httpx.Client | None = None
+_config: tuple[str, str] | None = None
+
+_failures = 0
+_open_until = 0.0
+_probing = False
+
+stats = {"requests": 0, "retries": 0, "failures": 0, "short_circuited": 0, "breaker_opens": 0}
+
+
+class PostgrestError(Exception):
+    """PostgREST answered with an error status."""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"HTTP {status_code}: {body[:200]}")
+        self.status_code = status_code
+
+
+class CircuitOpenError(Exception):
+    """Headlights has been failing; the call was not attempted."""
+
+
+def _settings() -> tuple[str, str]:
+    return (
+        os.getenv("HEADLIGHTS_SUPABASE_URL", "").strip().rstrip("/"),
+        os.getenv("HEADLIGHTS_SUPABASE_KEY", "").strip(),
+    )
+
+
+def configured() -> bool:
+    url, key = _settings()
+    return bool(url and key)
+
+
+def _client_kwargs(url: str, key: str) -> dict:
+    return {
+        "base_url": f"{url}/rest/v1/",
+        "headers": {"apikey": key, "Authorization": f"Bearer {key}"},
+        "timeout": _TIMEOUT,
+        "limits": _LIMITS,
+        "http2": _HTTP2,
+    }
+
+
+def _get_client() -> httpx.Client:
+    global _client, _config
+    settings = _settings()
+    with _lock:
+        if _client is None or settings != _config:
+            # Env changed (tests, bench): drop the old pool and rebuild
+            if _client is not None:
+                _client.close()
+            _client = httpx.Client(**_client_kwargs(*settings))
+            _config = settings
+        return _client
+
+
+def _before_call() -> None:
+    global _probing
+    with _lock:
+        if _failures < _BREAKER_THRESHOLD:
+            return
+        if time.monotonic() < _open_until or _probing:
+            stats["short_circuited"] += 1
+            raise CircuitOpenError("Headlights circuit open after repeated failures")
+        # Cooldown over: this call is the half-open probe
+        _probing = True
+
+
+def _after_call(ok: bool | None) -> None:
+    """Record a call's outcome; None (cancelled, bad arguments) only releases the probe slot."""
+    global _failures, _open_until, _probing
+    with _lock:
+        _probing = False
+        if ok is None:
+            return
+        if ok:
+            _failures = 0
+            return
+        _failures += 1
+        stats["failures"] += 1
+        if _failures >= _BREAKER_THRESHOLD:
+            if time.monotonic() >= _open_until:
+                stats["breaker_opens"] += 1
+                print(f"[postgrest] Circuit open for {_BREAKER_COOLDOWN:.0f}s after {_failures} failures")
+            _open_until = time.monotonic() + _BREAKER_COOLDOWN
+
+
+def _transient(resp: httpx.Response | None) -> bool:
+    return resp is None or resp.status_code == 429 or resp.status_code >= 500
+
+
+def _retryable(method: str, resp: httpx.Response | None, error: Exception | None) -> bool:
+    if method.upper() != "POST":
+        return True
+    # POSTs (RPC increments, inserts) may have been applied before a timeout or
+    # 5xx, so only retry when the request can't have reached the server.
+    if error is not None:
+        return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+    return resp.status_code in (429, 503)
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, _BACKOFF * 2 ** attempt)
+
+
+def _result(resp: httpx.Response) -> httpx.Response:
+    if resp.status_code >= 400:
+        raise PostgrestError(resp.status_code, resp.text)
+    return resp
+
+
+def request(method: str, path: str, **kwargs) -> httpx.Response:
+    """Send a PostgREST request (path relative to /rest/v1/); raises PostgrestError on 4xx/5xx."""
+    _before_call()
+    ok = None
+    try:
+        client = _get_client()
+        for attempt in range(_RETRIES + 1):
+            stats["requests"] += 1
+            resp, error = None, None
+            try:
+                resp = client.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                error = e
+            if not _transient(resp):
+                ok = True
+                return _result(resp)
+            if attempt == _RETRIES or not _retryable(method, resp, error):
+                break
+            stats["retries"] += 1
+            time.sleep(_backoff(attempt))
+        ok = False
+        if error is not None:
+            raise error
+        return _result(resp)
+    finally:
+        _after_call(ok)
+
+
+def close() -> None:
+    """Close the pool (app shutdown); the next request opens a fresh one."""
+    global _client, _config
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _config = None
+
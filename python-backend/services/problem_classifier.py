@@ -0,0 +1,170 @@
+"""Local fast-path classifier for match_problem_type.
+
+Scores a description against each "id: Label" problem type using hand-written
+synonym phrases plus TF-IDF cosine over the id, label and synonym terms. When
+the best type clears PROBLEM_CLASSIFIER_THRESHOLD by a clear margin the caller
+can skip the Haiku round-trip; anything ambiguous still goes to the model.
+
+A sample of local decisions (PROBLEM_CLASSIFIER_AUDIT_RATE) is re-checked
+against the model so the agreement rate can be watched while tuning the
+threshold.
+"""
+import os
+import math
+from collections import Counter, deque
+from functools import lru_cache
+
+from services.text import split_words, stemmed_terms
+
+THRESHOLD = float(os.getenv("PROBLEM_CLASSIFIER_THRESHOLD", "0.6"))
+# Minimum lead of the best score over the runner-up before we trust it
+MARGIN = float(os.getenv("PROBLEM_CLASSIFIER_MARGIN", "0.25"))
+AUDIT_RATE = float(os.getenv("PROBLEM_CLASSIFIER_AUDIT_RATE", "0.05"))
+
+# Multi-word phrases are strong signals on their own; single words feed TF-IDF.
+_SYNONYMS: dict[str, list[str]] = {
+    "onboarding": [
+        "new hire", "new employee", "new staff", "new user", "new nurse", "new cna",
+        "start date", "first day", "starting on", "starts on", "starting monday",
+        "set up accounts", "onboard", "onboarding", "hire", "hired", "joining", "employee",
+    ],
+    "intermittent_network_slowness": [
+        "slow network", "network slow", "network is slow", "slow internet", "internet slow",
+        "internet is slow", "wi fi", "keeps dropping", "packet loss", "connection drops",
+        "drops connection", "access point", "network", "internet", "wifi", "wireless",
+        "ethernet", "latency", "bandwidth", "router", "switch", "disconnect", "disconnecting",
+    ],
+    "application_performance_degradation": [
+        "application slow", "app slow", "app is slow", "slow to load", "takes forever",
+        "not responding", "pointclickcare", "point click care", "application", "app",
+        "software", "program", "sluggish", "laggy", "lag", "loading", "hangs", "ehr", "emr", "pcc",
+    ],
+    "access_drift_permission_sprawl": [
+        "access denied", "cant access", "cannot access", "no access", "lost access",
+        "too much access", "shared drive", "security group", "folder access", "active directory",
+        "access", "permission", "permissions", "denied", "rights", "privileges", "sharepoint",
+        "group", "groups", "folder",
+    ],
+    "recurring_endpoint_instability": [
+        "blue screen", "keeps crashing", "keeps rebooting", "keeps restarting", "keeps freezing",
+        "computer crash", "laptop crash", "bsod", "crash", "crashes", "crashing", "reboot",
+        "rebooting", "restart", "restarting", "unstable", "laptop", "computer", "desktop",
+        "workstation",
+    ],
+    "backup_reliability": [
+        "backup failed", "backups failed", "backup job", "restore test", "backup", "backups",
+        "restore", "restoring", "veeam", "retention", "snapshot", "replication", "nas",
+    ],
+}
+
+stats = {
+    "calls": 0, "local": 0, "llm_fallbacks": 0,
+    "audit_checks": 0, "audit_agreements": 0,
+    "fallback_checks": 0, "fallback_agreements": 0,
+}
+# Recent local-vs-LLM comparisons for threshold tuning
+samples: deque = deque(maxlen=500)
+
+
+def _parse(problem_type: str, labels: dict[str, str]) -> tuple[str, str]:
+    type_id, _, label = problem_type.partition(":")
+    type_id = type_id.strip()
+    return type_id, label.strip() or labels.get(type_id, type_id)
+
+
+@lru_cache(maxsize=32)
+def _build_index(problem_types: tuple[str, ...], labels: tuple[tuple[str, str], ...]):
+    """Precompute phrase lists and TF-IDF vectors for one problem-type list."""
+    label_map = dict(labels)
+    entries = []
+    for pt in problem_types:
+        type_id, label = _parse(pt, label_map)
+        synonyms = _SYNONYMS.get(type_id, [])
+        phrases = [" ".join(split_words(p)) for p in synonyms + [label] if len(split_words(p)) > 1]
+        terms = Counter(stemmed_terms(type_id.replace("_", " ")) + stemmed_terms(label))
+        for syn in synonyms:
+            terms.update(stemmed_terms(syn))
+        entries.append((type_id, phrases, terms))
+
+    n = len(entries)
+    df = Counter(t for _, _, terms in entries for t in terms)
+    idf = {t: math.log((1 + n) / (1 + d)) + 1 for t, d in df.items()}
+
+    index = []
+    for type_id, phrases, terms in entries:
+        vec = {t: c * idf[t] for t, c in terms.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        index.append((type_id, phrases, {t: v / norm for t, v in vec.items()}))
+    return index, idf
+
+
+def prepare(problem_types: list[str], labels: dict[str, str]) -> None:
+    """Build the index for a problem-type list ahead of the first classify(), without touching stats."""
+    _build_index(tuple(problem_types), tuple(sorted(labels.items())))
+
+
+def score(description: str, problem_types: list[str], labels: dict[str, str]) -> list[tuple[str, float]]:
+    """Return (type_id, score in [0, 1]) for every problem type, best first."""
+    index, idf = _build_index(tuple(problem_types), tuple(sorted(labels.items())))
+    text = f" {' '.join(split_words(description))} "
+    query = Counter(t for t in stemmed_terms(description) if t in idf)
+    qvec = {t: c * idf[t] for t, c in query.items()}
+    qnorm = math.sqrt(sum(v * v for v in qvec.values())) or 1.0
+
+    scored = []
+    for type_id, phrases, vec in index:
+        cosine = sum(v * vec.get(t, 0.0) for t, v in qvec.items()) / qnorm
+        hits = sum(1 for p in phrases if f" {p} " in text)
+        scored.append((type_id, min(1.0, 0.6 * hits + cosine)))
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored
+
+
+def classify(description: str, problem_types: list[str], labels: dict[str, str]) -> tuple[str | None, float, bool]:
+    """Return (best type_id, confidence, confident).
+
+    confidence is the best score, or 0 when the runner-up is within MARGIN of
+    it; confident says whether it clears THRESHOLD and the LLM can be skipped.
+    """
+    stats["calls"] += 1
+    scored = score(description, problem_types, labels)
+    if not scored or scored[0][1] <= 0:
+        stats["llm_fallbacks"] += 1
+        return None, 0.0, False
+    best_id, best = scored[0]
+    runner_up = scored[1][1] if len(scored) > 1 else 0.0
+    confidence = best if best - runner_up >= MARGIN else 0.0
+    confident = confidence >= THRESHOLD
+    stats["local" if confident else "llm_fallbacks"] += 1
+    return best_id, confidence, confident
+
+
+def record_agreement(best_id: str | None, confidence: float, llm: list[str], audited: bool) -> None:
+    """Compare the local best guess with the model's answer for the same description.
+
+    audited=True is a sampled re-check of a local decision (feeds agreement_rate);
+    audited=False is an LLM fallback, which shows how often a lower threshold
+    would still have been right (feeds fallback_agreement_rate).
+    """
+    agreed = best_id in llm[:1] if best_id is not None else not llm
+    prefix = "audit" if audited else "fallback"
+    stats[f"{prefix}_checks"] += 1
+    if agreed:
+        stats[f"{prefix}_agreements"] += 1
+    samples.append({"path": prefix, "confidence": round(confidence, 3), "local": best_id, "llm": llm})
+
+
+def summary() -> dict:
+    """Skip and agreement rates plus recent samples, for tuning THRESHOLD/MARGIN."""
+    def rate(n: int, d: int) -> float | None:
+        return n / d if d else None
+
+    return {
+        **stats,
+        "threshold": THRESHOLD,
+        "margin": MARGIN,
+        "skip_rate": rate(stats["local"], stats["calls"]),
+        "agreement_rate": rate(stats["audit_agreements"], stats["audit_checks"]),
+        "fallback_agreement_rate": rate(stats["fallback_agreements"], stats["fallback_checks"]),
+        "recent_samples": list(samples)[-20:],
+    }
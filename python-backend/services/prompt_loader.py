@@ -1,6 +1,16 @@
-"""Load Bruce prompts from Headlights Supabase, falling back to hardcoded values."""
+"""Load Bruce prompts from Headlights Supabase, falling back to hardcoded values.
+
+Prompts are preloaded at app startup (start()) and refreshed in the background
+every PROMPT_REFRESH_SECONDS. Readers only ever see the in-memory copy — stale
+while a refresh is running, hardcoded defaults if nothing has loaded yet — so
+they never wait on the network. Refreshes are conditional: an updated_at
+watermark probe (or If-None-Match when PostgREST sends an ETag) skips the full
+fetch when nothing changed.
+"""
 import os
+import asyncio
 import threading
+from services import postgrest
 from utils.prompts import SYSTEM_PROMPT as _DEFAULT_ASK
 
 _DEFAULT_SQL = """You are a SQL generator for an IT management app.
@@ -23,31 +33,75 @@ Respond with a JSON array only — no other text:
 
 If no suggestions are ready, return []."""
 
+# Appended to the editable suggestions prompt for check_suggestions, which
+# caches every follow-up with its due date and does the "is it due" check itself
+_SUGGESTION_CUES_FORMAT = """Output format (this replaces any timing rule or format given above):
+Return every follow-up a note calls for, whether or not it is due yet, and work out its absolute due
+date from the task's completion date.
+
+Respond with a JSON array only — no other text:
+[{"task_number": 12, "title": "Short task title", "reason": "Brief explanation referencing the original task", "due_date": "YYYY-MM-DD"}]
+
+If no note calls for a follow-up, return []."""
+
+_REFRESH_SECONDS = float(os.getenv("PROMPT_REFRESH_SECONDS", "300"))
+
 _lock = threading.Lock()
 _prompts: dict[str, str] = {}
 _loaded = False
-
-
-def _fetch_from_supabase() -> dict[str, str]:
-    """Fetch prompt texts from Headlights Supabase. Returns {} on any failure."""
-    url = os.getenv("HEADLIGHTS_SUPABASE_URL", "").strip()
-    key = os.getenv("HEADLIGHTS_SUPABASE_KEY", "").strip()
-    if not url or not key:
+_loading = False
+_version = 0
+_etag: str | None = None
+_watermark: str | None = None
+_watermark_supported = True
+_refresh_task: asyncio.Task | None = None
+
+
+def _request(path: str, headers: dict | None = None):
+    """GET a PostgREST path; returns (status, headers, rows) — rows is None on 304."""
+    resp = postgrest.request("GET", path, headers=headers)
+    if resp.status_code == 304:
+        return 304, resp.headers, None
+    return resp.status_code, resp.headers, resp.json()
+
+
+def _probe_watermark() -> str | None:
+    """Latest prompts.updated_at, or None if the table has no such column."""
+    global _watermark_supported
+    if not _watermark_supported:
+        return None
+    try:
+        _, _, rows = _request("prompts?app_id=eq.bruce&select=updated_at&order=updated_at.desc&limit=1")
+        return str(rows[0]["updated_at"]) if rows else ""
+    except postgrest.PostgrestError as e:
+        if e.status_code >= 500:
+            raise
+        print(f"[prompt_loader] updated_at watermark unavailable, using full fetches: {e}")
+        _watermark_supported = False
+        return None
+
+
+def _fetch_from_supabase() -> dict[str, str] | None:
+    """Fetch prompt texts from Headlights Supabase.
+
+    Returns None when nothing changed since the last fetch or the fetch failed,
+    so callers keep serving what they already have.
+    """
+    global _etag, _watermark
+    if not postgrest.configured():
         return {}
 
     try:
-        import urllib.request
-        import json
-
-        req = urllib.request.Request(
-            f"{url}/rest/v1/prompts?app_id=eq.bruce&select=id,text",
-            headers={
-                "apikey": key,
-                "Authorization": f"Bearer {key}",
-            },
-        )
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            rows = json.loads(resp.read().decode())
+        watermark = _probe_watermark()
+        if watermark is not None and _loaded and watermark == _watermark:
+            return None
+
+        headers = {"If-None-Match": _etag} if _etag and _loaded else {}
+        status, resp_headers, rows = _request("prompts?app_id=eq.bruce&select=id,text", headers)
+        if status == 304:
+            return None
+        _etag = resp_headers.get("ETag")
+        _watermark = watermark
 
         result = {}
         for row in rows:
@@ -55,18 +109,64 @@ def _fetch_from_supabase() -> dict[str, str]:
         return result
     except Exception as e:
         print(f"[prompt_loader] Could not fetch prompts from Supabase: {e}")
-        return {}
+        return None
+
+
+def refresh() -> bool:
+    """Fetch prompts now (blocking) and swap them in. Returns True if they changed."""
+    global _loaded, _loading, _prompts, _version
+    fetched = _fetch_from_supabase()
+    with _lock:
+        _loaded = True
+        _loading = False
+        if fetched is None or fetched == _prompts:
+            return False
+        _prompts = fetched
+        _version += 1
+        return True
 
 
 def _ensure_loaded():
-    global _loaded, _prompts
-    if _loaded:
+    """Kick off a background load if start() was never called (scripts, tests)."""
+    global _loading
+    if _loaded or _loading:
         return
     with _lock:
-        if _loaded:
+        if _loaded or _loading:
             return
-        _prompts = _fetch_from_supabase()
-        _loaded = True
+        _loading = True
+    threading.Thread(target=refresh, name="prompt-loader", daemon=True).start()
+
+
+async def _refresh_loop():
+    while True:
+        await asyncio.sleep(_REFRESH_SECONDS)
+        try:
+            if await asyncio.to_thread(refresh):
+                print(f"[prompt_loader] Prompts updated (version {_version})")
+        except Exception as e:
+            print(f"[prompt_loader] Background refresh failed: {e}")
+
+
+async def start():
+    """Preload prompts, then keep them fresh in the background. Call once at app startup."""
+    global _refresh_task
+    await asyncio.to_thread(refresh)
+    if _refresh_task is None and _REFRESH_SECONDS > 0:
+        _refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        _refresh_task = None
+
+
+def version() -> int:
+    """Bumped whenever the loaded prompt set changes — lets caches key on prompt content."""
+    _ensure_loaded()
+    return _version
 
 
 def get_sql_prompt() -> str:
@@ -79,14 +179,21 @@ def get_suggestions_prompt() -> str:
     return _prompts.get("p-bruce-suggestions") or _DEFAULT_SUGGESTIONS
 
 
+def get_suggestion_cues_prompt() -> str:
+    """The editable p-bruce-suggestions prompt, asking for every follow-up with a due date."""
+    return f"{get_suggestions_prompt()}\n\n{_SUGGESTION_CUES_FORMAT}"
+
+
 def get_ask_prompt() -> str:
     _ensure_loaded()
     return _prompts.get("p-bruce-ask") or _DEFAULT_ASK
 
 
-def reload():
+def reload() -> int:
     """Force a fresh fetch from Supabase (useful after editing prompts in Headlights)."""
-    global _loaded
+    global _etag, _watermark
     with _lock:
-        _loaded = False
-    _ensure_loaded()
+        _etag = None
+        _watermark = None
+    refresh()
+    return _version
@@ -0,0 +1,259 @@
+"""Content-addressed cache for near-deterministic model responses.
+
+Entries are keyed on a hash of the full request (model, system prompt, messages,
+sampling params) plus the prompt_loader version, so editing a prompt in
+Headlights invalidates everything built from the old one.
+
+The in-memory tier is an LRU capped at AI_CACHE_MAX_ENTRIES. Setting
+AI_CACHE_PATH adds a SQLite tier that survives restarts and is shared by every
+worker process pointing at the same file.
+
+Only the in-memory lookup runs on the event loop. A memory miss reads the
+disk tier in a worker thread (asyncio.to_thread), and disk writes are queued
+to one background writer thread that commits them in batches, as
+headlights_tracker does, so a slow disk or a locked database never stalls
+other requests.
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from services import prompt_loader
+
+_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "2048"))
+_DISK_PATH = os.getenv("AI_CACHE_PATH", "").strip()
+_WRITE_QUEUE_SIZE = int(os.getenv("AI_CACHE_WRITE_QUEUE", "1000"))
+_WRITE_BATCH = 100
+
+# Seconds an entry stays fresh, per ai_service endpoint. Override with
+# AI_CACHE_TTL_<ENDPOINT>, e.g. AI_CACHE_TTL_GENERATE_SQL=600; 0 disables caching.
+_DEFAULT_TTLS = {
+    "summarize_incident": 7 * 86400,
+    "match_problem_type": 86400,
+    "generate_sql": 3600,
+    # Rolling diagnose-conversation summaries, keyed on the folded turns
+    "diagnose_history": 86400,
+    # Follow-up cues extracted from a completed task's note (see followup_cues)
+    "suggestion_cues": 30 * 86400,
+    # Explanations for one new task against the same similar-incident candidates
+    "similar_rerank": 86400,
+    # Onboarding fields the local extractor left open, for the same pasted text
+    "onboarding": 86400,
+}
+
+_lock = threading.Lock()
+_memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+# Reader connection, used from to_thread workers under _db_lock; the writer
+# thread opens its own so reads never wait behind a commit (WAL)
+_db: sqlite3.Connection | None = None
+_db_lock = threading.Lock()
+
+_CLEAR = object()
+_STOP = object()
+_writes: queue.Queue = queue.Queue(maxsize=_WRITE_QUEUE_SIZE)
+_writer: threading.Thread | None = None
+_writer_lock = threading.Lock()
+
+stats: dict[str, dict[str, int]] = {}
+
+
+def ttl(endpoint: str) -> float:
+    return float(os.getenv(f"AI_CACHE_TTL_{endpoint.upper()}", _DEFAULT_TTLS.get(endpoint, 0)))
+
+
+def make_key(request: dict) -> str:
+    """Hash a Messages API request body together with the current prompt version."""
+    payload = json.dumps(
+        {"prompt_version": prompt_loader.version(), **request},
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _connect() -> sqlite3.Connection:
+    db = sqlite3.connect(_DISK_PATH, check_same_thread=False, timeout=1)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        " key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+    )
+    return db
+
+
+def _get_db() -> sqlite3.Connection | None:
+    """The reader connection; callers hold _db_lock and are never on the event loop."""
+    global _db
+    if not _DISK_PATH:
+        return None
+    if _db is None:
+        db = _connect()
+        db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        db.commit()
+        _db = db
+    return _db
+
+
+def warm_up() -> None:
+    """Open the disk tier (and drop expired rows) now instead of on the first lookup."""
+    with _db_lock:
+        try:
+            _get_db()
+        except sqlite3.Error as e:
+            print(f"[response_cache] Disk open failed: {e}")
+
+
+def _count(endpoint: str, outcome: str) -> None:
+    counts = stats.setdefault(endpoint, {"hits": 0, "misses": 0, "disk_hits": 0, "disk_writes_dropped": 0})
+    counts[outcome] += 1
+
+
+def _disk_get(key: str) -> tuple[float, str] | None:
+    with _db_lock:
+        try:
+            db = _get_db()
+            return db.execute(
+                "SELECT expires_at, value FROM responses WHERE key = ?", (key,)
+            ).fetchone() if db else None
+        except sqlite3.Error as e:
+            print(f"[response_cache] Disk read failed: {e}")
+            return None
+
+
+async def get(endpoint: str, key: str) -> str | None:
+    """Return the cached response text, or None on a miss or expired entry."""
+    if ttl(endpoint) <= 0:
+        return None
+    now = time.time()
+    with _lock:
+        entry = _memory.get(key)
+        if entry and entry[0] > now:
+            _memory.move_to_end(key)
+            _count(endpoint, "hits")
+            return entry[1]
+        if entry:
+            del _memory[key]
+
+    row = await asyncio.to_thread(_disk_get, key) if _DISK_PATH else None
+    if row and row[0] > now:
+        with _lock:
+            _memory[key] = (row[0], row[1])
+            _evict()
+        _count(endpoint, "hits")
+        _count(endpoint, "disk_hits")
+        return row[1]
+
+    _count(endpoint, "misses")
+    return None
+
+
+def put(endpoint: str, key: str, value: str) -> None:
+    """Store a response; the disk write is queued for the writer thread. Non-blocking."""
+    seconds = ttl(endpoint)
+    if seconds <= 0:
+        return
+    expires_at = time.time() + seconds
+    with _lock:
+        _memory[key] = (expires_at, value)
+        _memory.move_to_end(key)
+        _evict()
+    if _DISK_PATH and not _enqueue((key, expires_at, value)):
+        _count(endpoint, "disk_writes_dropped")
+
+
+def _evict() -> None:
+    while len(_memory) > _MAX_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def clear() -> None:
+    """Drop every cached entry, in memory now and on disk once queued writes are done."""
+    with _lock:
+        _memory.clear()
+    if _DISK_PATH:
+        _enqueue(_CLEAR)
+
+
+def _write(db: sqlite3.Connection, batch: list) -> None:
+    for item in batch:
+        if item is _CLEAR:
+            db.execute("DELETE FROM responses")
+        else:
+            db.execute("INSERT OR REPLACE INTO responses (key, expires_at, value) VALUES (?, ?, ?)", item)
+    db.commit()
+
+
+def _run() -> None:
+    db = None
+    while True:
+        batch = [_writes.get()]
+        while len(batch) < _WRITE_BATCH:
+            try:
+                batch.append(_writes.get_nowait())
+            except queue.Empty:
+                break
+        stop = _STOP in batch
+        batch = [item for item in batch if item is not _STOP]
+        try:
+            if batch:
+                db = db or _connect()
+                _write(db, batch)
+        except sqlite3.Error as e:
+            print(f"[response_cache] Disk write of {len(batch)} entries failed: {e}")
+        finally:
+            for _ in range(len(batch)):
+                _writes.task_done()
+        if stop:
+            _writes.task_done()
+            if db is not None:
+                db.close()
+            return
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_run, name="response-cache-writer", daemon=True)
+            _writer.start()
+
+
+def _enqueue(item) -> bool:
+    _ensure_writer()
+    try:
+        _writes.put_nowait(item)
+        return True
+    except queue.Full:
+        print("[response_cache] Write queue full, entry kept in memory only")
+        return False
+
+
+def flush(timeout: float = 10.0) -> None:
+    """Wait (up to timeout) until queued disk writes are committed."""
+    if _writer is None or not _writer.is_alive():
+        return
+    deadline = time.monotonic() + timeout
+    while _writes.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def shutdown(timeout: float = 10.0) -> None:
+    """Commit queued disk writes and stop the writer thread."""
+    global _writer
+    writer = _writer
+    if writer is None or not writer.is_alive():
+        return
+    _writes.put(_STOP)
+    writer.join(timeout)
+    _writer = None
+
+
+atexit.register(shutdown)
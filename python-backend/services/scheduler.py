@@ -0,0 +1,317 @@
+"""Admission control for Messages API calls.
+
+Every upstream call waits here for a slot. A slot is granted when:
+
+    - fewer than ANTHROPIC_MAX_CONCURRENCY calls are in flight (background
+      work also leaves SCHEDULER_INTERACTIVE_RESERVE of them free), and
+    - the model's rolling 60 s request and token budgets have room, and
+    - the model isn't cooling down after a 429 / 529.
+
+Budgets come from ANTHROPIC_RATE_LIMITS, e.g. '{"claude-sonnet-4-6":
+{"rpm": 50, "tpm": 38000}}'. Models not listed there pick up their limits
+from the anthropic-ratelimit-* response headers after the first call. Tokens
+are charged at admission from a local estimate and corrected to the
+reported usage when the call finishes.
+
+Waiters are served in priority order: interactive endpoints first, then the
+ones in SCHEDULER_BACKGROUND_ENDPOINTS. The SDK's own retries are turned off
+(see ai_service.get_client) so rate-limit retries go through retry_delay(), which
+honours retry-after and pauses the whole model rather than one call.
+"""
+import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import anthropic
+
+from services import metrics
+
+MAX_CONCURRENCY = int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "16"))
+# Slots background work can never take, so an import can't lock out a user
+_INTERACTIVE_RESERVE = int(os.getenv("SCHEDULER_INTERACTIVE_RESERVE", "4"))
+_BACKGROUND = frozenset(
+    e.strip() for e in os.getenv(
+        "SCHEDULER_BACKGROUND_ENDPOINTS", "check_suggestions,summarize_incident,summarize_batch",
+    ).split(",") if e.strip()
+)
+MAX_RETRIES = int(os.getenv("ANTHROPIC_MAX_RETRIES", "3"))
+_WINDOW = 60.0
+
+INTERACTIVE, BACKGROUND = 0, 1
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+try:
+    _CONFIGURED_LIMITS: dict[str, dict] = json.loads(os.getenv("ANTHROPIC_RATE_LIMITS", "") or "{}")
+except ValueError as e:
+    print(f"[scheduler] Ignoring ANTHROPIC_RATE_LIMITS: {e}")
+    _CONFIGURED_LIMITS = {}
+
+stats = {"admitted": 0, "queued": 0, "rate_limited": 0, "retries": 0}
+
+
+class _Budget:
+    """Rolling 60 s request/token accounting for one model."""
+
+    def __init__(self, model: str):
+        limits = _CONFIGURED_LIMITS.get(model, {})
+        self.rpm = int(limits.get("rpm", 0))
+        self.tpm = int(limits.get("tpm", 0))
+        self.learn = not limits
+        self.calls: deque[list] = deque()  # [admitted_at, tokens charged]
+        self.tokens = 0
+        self.cooldown_until = 0.0
+
+    def _trim(self, now: float) -> None:
+        while self.calls and self.calls[0][0] <= now - _WINDOW:
+            self.tokens -= self.calls.popleft()[1]
+
+    def wait(self, now: float, tokens: int) -> float:
+        """Seconds until a call of this size could be admitted (0 = now)."""
+        if now < self.cooldown_until:
+            return self.cooldown_until - now
+        self._trim(now)
+        if not self.calls:
+            return 0.0
+        if self.rpm and len(self.calls) >= self.rpm:
+            return self.calls[0][0] + _WINDOW - now
+        if self.tpm and self.tokens + tokens > self.tpm:
+            return self.calls[0][0] + _WINDOW - now
+        return 0.0
+
+    def charge(self, now: float, tokens: int) -> list:
+        entry = [now, tokens]
+        self.calls.append(entry)
+        self.tokens += tokens
+        return entry
+
+    def settle(self, entry: list, tokens: int) -> None:
+        if self.calls and entry[0] >= self.calls[0][0]:
+            self.tokens += tokens - entry[1]
+            entry[1] = tokens
+
+    def observe_headers(self, headers) -> None:
+        if not headers:
+            return
+        if self.learn:
+            rpm = headers.get("anthropic-ratelimit-requests-limit")
+            tpm = headers.get("anthropic-ratelimit-tokens-limit")
+            if rpm and rpm.isdigit():
+                self.rpm = int(rpm)
+            if tpm and tpm.isdigit():
+                self.tpm = int(tpm)
+        # Out of something upstream: hold the model until the window resets
+        for kind in ("requests", "tokens"):
+            if headers.get(f"anthropic-ratelimit-{kind}-remaining") == "0":
+                reset = _seconds_until(headers.get(f"anthropic-ratelimit-{kind}-reset"))
+                if reset:
+                    self.cooldown_until = max(self.cooldown_until, time.monotonic() + reset)
+
+
+class Slot:
+    """An admitted call; report its usage and response headers before it's released."""
+
+    def __init__(self, model: str, priority: int, tokens: int):
+        self.model = model
+        self.priority = priority
+        self.tokens = tokens
+        self.entry: list | None = None
+        self.queued_at = time.monotonic()
+        self.future: asyncio.Future | None = None
+        self.cancelled = False
+
+    def usage(self, usage) -> None:
+        actual = (usage.input_tokens or 0) + (usage.output_tokens or 0) \
+            + (getattr(usage, "cache_creation_input_tokens", None) or 0)
+        _budget(self.model).settle(self.entry, actual)
+
+    def headers(self, headers) -> None:
+        _budget(self.model).observe_headers(headers)
+
+
+_budgets: dict[str, _Budget] = {}
+_waiters: list[tuple[int, int, Slot]] = []
+_seq = itertools.count()
+_in_flight = {INTERACTIVE: 0, BACKGROUND: 0}
+_timer: asyncio.TimerHandle | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _budget(model: str) -> _Budget:
+    if model not in _budgets:
+        _budgets[model] = _Budget(model)
+    return _budgets[model]
+
+
+def _seconds_until(stamp: str | None) -> float:
+    if not stamp:
+        return 0.0
+    try:
+        return max(0.0, datetime.fromisoformat(stamp.replace("Z", "+00:00")).timestamp() - time.time())
+    except ValueError:
+        return 0.0
+
+
+def _bind_loop() -> None:
+    # State belongs to one event loop; a new loop (tests, reloads) starts clean
+    global _loop, _timer
+    loop = asyncio.get_running_loop()
+    if loop is not _loop:
+        _loop = loop
+        _timer = None
+        _waiters.clear()
+        _in_flight.update({INTERACTIVE: 0, BACKGROUND: 0})
+
+
+def _priority() -> int:
+    return BACKGROUND if metrics.current_endpoint.get() in _BACKGROUND else INTERACTIVE
+
+
+def snapshot() -> dict:
+    """Queue depth, in-flight calls and per-model budget use, for GET /api/scheduler."""
+    depth = {name: 0 for name in _PRIORITY_NAMES.values()}
+    for _, _, slot in _waiters:
+        if not slot.cancelled:
+            depth[_PRIORITY_NAMES[slot.priority]] += 1
+    now = time.monotonic()
+    models = {}
+    for model, budget in _budgets.items():
+        budget._trim(now)
+        models[model] = {
+            "rpm": budget.rpm, "tpm": budget.tpm,
+            "requests_last_minute": len(budget.calls), "tokens_last_minute": budget.tokens,
+            "cooldown_s": round(max(0.0, budget.cooldown_until - now), 2),
+        }
+    return {
+        "queued": depth,
+        "in_flight": {_PRIORITY_NAMES[p]: n for p, n in _in_flight.items()},
+        "models": models,
+        "stats": stats,
+    }
+
+
+def _can_run(priority: int) -> bool:
+    total = _in_flight[INTERACTIVE] + _in_flight[BACKGROUND]
+    if priority == BACKGROUND:
+        return total < max(1, MAX_CONCURRENCY - _INTERACTIVE_RESERVE)
+    return total < MAX_CONCURRENCY
+
+
+def _admit(slot: Slot, now: float) -> None:
+    slot.entry = _budget(slot.model).charge(now, slot.tokens)
+    _in_flight[slot.priority] += 1
+    stats["admitted"] += 1
+    metrics.QUEUE_WAIT.labels(slot.model, _PRIORITY_NAMES[slot.priority]).observe(now - slot.queued_at)
+
+
+def _pump() -> None:
+    """Admit every waiter that can run now, in priority order, and re-arm the timer."""
+    global _timer
+    if _timer is not None:
+        _timer.cancel()
+        _timer = None
+    now = time.monotonic()
+    next_check = None
+    blocked: set[str] = set()
+    remaining = []
+    for item in sorted(_waiters):
+        slot = item[2]
+        if slot.cancelled:
+            continue
+        if slot.model not in blocked and _can_run(slot.priority):
+            wait = _budget(slot.model).wait(now, slot.tokens)
+            if wait <= 0:
+                _admit(slot, now)
+                slot.future.set_result(None)
+                continue
+            # Keep later waiters for this model behind it instead of letting them jump ahead
+            blocked.add(slot.model)
+            next_check = wait if next_check is None else min(next_check, wait)
+        remaining.append(item)
+    _waiters[:] = remaining
+    heapq.heapify(_waiters)
+
+    if next_check is not None:
+        _timer = asyncio.get_running_loop().call_later(next_check, _pump)
+    for priority, name in _PRIORITY_NAMES.items():
+        metrics.QUEUE_DEPTH.labels(name).set(sum(1 for _, _, s in _waiters if s.priority == priority))
+
+
+async def _acquire(model: str, tokens: int) -> Slot:
+    _bind_loop()
+    slot = Slot(model, _priority(), tokens)
+    now = time.monotonic()
+    if not _waiters and _can_run(slot.priority) and _budget(model).wait(now, tokens) <= 0:
+        _admit(slot, now)
+        return slot
+
+    stats["queued"] += 1
+    slot.future = asyncio.get_running_loop().create_future()
+    heapq.heappush(_waiters, (slot.priority, next(_seq), slot))
+    _pump()
+    try:
+        await slot.future
+    except asyncio.CancelledError:
+        slot.cancelled = True
+        if slot.future.done() and not slot.future.cancelled():
+            # Admitted in the same tick the caller went away: hand the slot back
+            _release(slot)
+        raise
+    return slot
+
+
+def _release(slot: Slot) -> None:
+    _in_flight[slot.priority] -= 1
+    if _waiters:
+        _pump()
+
+
+@asynccontextmanager
+async def slot(model: str, estimated_tokens: int):
+    """Wait for admission to call model; yields the Slot to report usage on."""
+    admitted = await _acquire(model, estimated_tokens)
+    try:
+        yield admitted
+    finally:
+        _release(admitted)
+
+
+def estimate_tokens(request: dict) -> int:
+    """Input estimate (~4 chars per token) plus the full output budget."""
+    size = len(json.dumps(request.get("system", ""), default=str)) + len(json.dumps(request.get("messages", []), default=str))
+    return size // 4 + int(request.get("max_tokens", 0))
+
+
+def retry_delay(error: Exception, attempt: int, model: str) -> float | None:
+    """Seconds to sleep before retrying a failed call, or None to give up.
+
+    429 and 529 (overloaded) pause every call to the model for the
+    retry-after period instead; the retry then just queues for a new slot,
+    so 0 is returned. Other 5xx and connection errors back off this call only.
+    """
+    if attempt >= MAX_RETRIES:
+        return None
+    backoff = random.uniform(0.5, 1.0) * 2 ** attempt
+    if isinstance(error, anthropic.APIConnectionError):
+        return backoff
+    if not isinstance(error, anthropic.APIStatusError) or error.status_code < 500 and error.status_code != 429:
+        return None
+
+    retry_after = error.response.headers.get("retry-after")
+    try:
+        delay = float(retry_after) if retry_after else backoff
+    except ValueError:
+        delay = backoff
+    stats["retries"] += 1
+    if error.status_code in (429, 529):
+        stats["rate_limited"] += 1
+        budget = _budget(model)
+        budget.cooldown_until = max(budget.cooldown_until, time.monotonic() + delay)
+        return 0.0
+    return delay
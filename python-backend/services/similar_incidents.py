@@ -0,0 +1,242 @@
+"""Per-user BM25 index over resolved incidents, for "find similar tasks".
+
+Each user gets an in-memory inverted index (term -> {incident id: BM25
+term weight}) over incident titles and descriptions, with stemmed words plus
+adjacent-word pairs so "blue screen" outranks a lone "screen". sync() diffs
+the caller's incident list against what is already indexed and only
+re-tokenizes added or edited incidents, so after the first call an update
+costs a dict walk rather than a rebuild. search() scores only the postings
+of the query's terms and returns the top k in milliseconds even at 100k
+incidents; an LLM, if used at all, only sees those k (ai_service.find_similar).
+
+BM25 rather than TF-IDF cosine because its document statistics (df, length)
+update in place; cosine weights would need renormalizing on every change.
+Indexes live per process and the least recently used ones are dropped past
+SIMILAR_MAX_USERS. ai_service.find_similar reloads a user's resolved
+incidents itself once their index is missing or older than
+SIMILAR_REFRESH_SECONDS (stale()), so a cold worker just rebuilds.
+"""
+import os
+import math
+import time
+import heapq
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from services.text import STOPWORDS, split_words, stem, surface_forms
+
+_MAX_USERS = int(os.getenv("SIMILAR_MAX_USERS", "100"))
+_REFRESH_SECONDS = float(os.getenv("SIMILAR_REFRESH_SECONDS", "60"))
+# Query terms found in more than this share of incidents carry almost no
+# signal but have the longest postings; skip them unless nothing else matches.
+_MAX_DF_RATIO = float(os.getenv("SIMILAR_MAX_DF_RATIO", "0.5"))
+_K1 = 1.2
+_B = 0.75
+_MAX_WEIGHT = round(100 * (_K1 + 1))
+
+stats = {"queries": 0, "docs_added": 0, "docs_updated": 0, "docs_removed": 0, "evicted": 0}
+
+# Incident text reuses a small vocabulary; stemming each word once saves most of a build
+_stem_word = lru_cache(maxsize=1 << 16)(stem)
+
+
+def _tokens(text: str) -> list[str]:
+    return [_stem_word(w) for w in split_words(text) if w not in STOPWORDS]
+
+
+def _pairs(words: list[str]) -> list[str]:
+    return [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _doc_terms(title: str, description: str) -> Counter:
+    title_words, description_words = _tokens(title), _tokens(description)
+    terms = Counter(title_words + description_words + _pairs(title_words) + _pairs(description_words))
+    # The title is the technician's own summary: its words count twice
+    terms.update(title_words)
+    return terms
+
+
+def _query_terms(text: str) -> Counter:
+    words = _tokens(text)
+    return Counter(words + _pairs(words))
+
+
+class _Index:
+    """One user's incidents. Callers hold .lock around every method.
+
+    Postings store each incident's BM25 term weight (everything but idf),
+    computed with the average incident length at the time it was indexed,
+    so a query is just idf * weight summed over the query terms' postings.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.docs: dict[str, tuple[tuple[str, str], dict]] = {}  # id -> (text key, meta)
+        self.postings: dict[str, dict[str, float]] = {}
+        self.total_length = 0
+        self.synced_at: float | None = None
+
+    def _add(self, doc_id: str, key: tuple[str, str], meta: dict, terms: Counter, avg_length: float) -> None:
+        norm = _K1 * (1 - _B + _B * sum(terms.values()) / avg_length)
+        postings = self.postings
+        for term, tf in terms.items():
+            posting = postings.get(term)
+            if posting is None:
+                posting = postings[term] = {}
+            # Weights are at most K1 + 1; in hundredths they are small ints,
+            # which Python shares, instead of a float object per posting
+            posting[doc_id] = round(100 * tf * (_K1 + 1) / (tf + norm))
+        self.docs[doc_id] = (key, meta)
+
+    def _remove(self, doc_id: str) -> None:
+        key, _ = self.docs.pop(doc_id)
+        terms = _doc_terms(*key)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= sum(terms.values())
+
+    def sync(self, incidents: list[dict], replace: bool = True) -> dict:
+        """Bring the index in line with incidents; with replace, ids not listed are dropped."""
+        updated = removed = 0
+        seen = set()
+        pending = []
+        for inc in incidents:
+            doc_id = str(inc.get("id") or inc.get("task_number"))
+            seen.add(doc_id)
+            key = ((inc.get("title") or "").strip(), (inc.get("description") or "").strip())
+            meta = {
+                "id": inc.get("id"),
+                "task_number": inc.get("task_number"),
+                "title": key[0] or key[1],
+                "reported_by": inc.get("reported_by"),
+                "priority": inc.get("priority"),
+            }
+            current = self.docs.get(doc_id)
+            if current is not None:
+                if current[0] == key:
+                    if current[1] != meta:
+                        self.docs[doc_id] = (key, meta)
+                    continue
+                self._remove(doc_id)
+                updated += 1
+            pending.append((doc_id, key, meta, _doc_terms(*key)))
+        if replace and len(self.docs) + len(pending) > len(seen):
+            for doc_id in [d for d in self.docs if d not in seen]:
+                self._remove(doc_id)
+                removed += 1
+
+        # Lengths of the whole batch go into the average before any weight is computed
+        self.total_length += sum(sum(terms.values()) for _, _, _, terms in pending)
+        avg_length = self.total_length / max(1, len(self.docs) + len(pending))
+        for doc_id, key, meta, terms in pending:
+            self._add(doc_id, key, meta, terms, avg_length)
+
+        added = len(pending) - updated
+        stats["docs_added"] += added
+        stats["docs_updated"] += updated
+        stats["docs_removed"] += removed
+        self.synced_at = time.monotonic()
+        return {"added": added, "updated": updated, "removed": removed, "indexed": len(self.docs)}
+
+    def search(self, text: str, k: int) -> list[dict]:
+        """Top k incidents for text as dicts of meta plus score and matched words (as the incident writes them)."""
+        n = len(self.docs)
+        query = _query_terms(text)
+        if not n or not query:
+            return []
+        usable = [t for t in query if t in self.postings]
+        common = {t for t in usable if len(self.postings[t]) > n * _MAX_DF_RATIO}
+        if len(common) < len(usable):
+            usable = [t for t in usable if t not in common]
+
+        # MaxScore: rarest terms first. Once the k-th best score beats what the
+        # remaining terms could add to an unseen incident, those terms only
+        # update candidates that can still make the top k.
+        terms = []
+        for term in usable:
+            df = len(self.postings[term])
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5)) * query[term] / 100
+            terms.append((idf, term))
+        terms.sort(reverse=True)
+        remaining = sum(idf for idf, _ in terms) * _MAX_WEIGHT
+
+        scores: dict[str, float] = {}
+        for idf, term in terms:
+            posting = self.postings[term]
+            threshold = heapq.nlargest(k, scores.values())[-1] if len(scores) >= k else 0.0
+            if threshold < remaining:
+                for doc_id, weight in posting.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * weight
+            else:
+                scores = {d: score for d, score in scores.items() if score + remaining >= threshold}
+                for doc_id in scores:
+                    weight = posting.get(doc_id)
+                    if weight:
+                        scores[doc_id] += idf * weight
+            remaining -= idf * _MAX_WEIGHT
+
+        results = []
+        for doc_id, score in heapq.nlargest(k, scores.items(), key=lambda item: item[1]):
+            key, meta = self.docs[doc_id]
+            doc = _doc_terms(*key)
+            forms = surface_forms(" ".join(key))
+            matched = [forms.get(t, t) for t in usable if t in doc and " " not in t]
+            results.append({**meta, "score": round(score, 3), "matched": matched})
+        return results
+
+
+_lock = threading.Lock()
+_indexes: OrderedDict[str, _Index] = OrderedDict()
+
+
+def _get_index(user_id: str) -> _Index:
+    with _lock:
+        index = _indexes.get(user_id)
+        if index is None:
+            index = _indexes[user_id] = _Index()
+            while len(_indexes) > _MAX_USERS:
+                _indexes.popitem(last=False)
+                stats["evicted"] += 1
+        else:
+            _indexes.move_to_end(user_id)
+        return index
+
+
+def sync(user_id: str, incidents: list[dict], replace: bool = True) -> dict:
+    """Upsert the user's incidents (and drop unlisted ones when replace); returns change counts."""
+    index = _get_index(user_id)
+    with index.lock:
+        return index.sync(incidents, replace)
+
+
+def search(user_id: str, text: str, k: int = 10) -> list[dict]:
+    """Top k of the user's indexed incidents for text, best first."""
+    stats["queries"] += 1
+    index = _get_index(user_id)
+    with index.lock:
+        return index.search(text, k)
+
+
+def size(user_id: str) -> int:
+    with _lock:
+        index = _indexes.get(user_id)
+    return len(index.docs) if index is not None else 0
+
+
+def stale(user_id: str) -> bool:
+    """True when the user's index was never synced or was synced over SIMILAR_REFRESH_SECONDS ago."""
+    with _lock:
+        index = _indexes.get(user_id)
+    if index is None or index.synced_at is None:
+        return True
+    return time.monotonic() - index.synced_at > _REFRESH_SECONDS
+
+
+def drop(user_id: str) -> None:
+    with _lock:
+        _indexes.pop(user_id, None)
@@ -0,0 +1,545 @@
+"""Validate and rewrite model-generated SQL before anything runs it.
+
+generate_sql and advise_plan hand back SQL that is executed as-is, so every
+query passes through check() first. It tokenizes the statement, tracks
+parenthesis scopes, and then:
+
+    - rejects anything but a single SELECT (or WITH ... SELECT), writes or
+      DDL in a WITH clause, TABLE, row locks, SELECT INTO and pg_* / dblink
+      functions
+    - only lets the statement read the tables the caller allows (plus its
+      own CTEs and set-returning functions such as jsonb_array_elements)
+    - requires every table reference to be filtered by user_id = '{user_id}'
+      as a plain AND condition of its WHERE (or an inner JOIN's ON), not
+      negated, compared or wrapped; a single-table query missing the filter
+      gets it added, anything else is rejected
+    - adds a LIMIT of SQL_MAX_ROWS when there is none and clamps larger ones
+    - flags patterns that scan every row of the user's data (jsonb element
+      scans with LIKE, leading-wildcard LIKE, ORDER BY random()); flagged
+      queries are capped at SQL_SCAN_MAX_ROWS instead
+
+This is a structural check over tokens, not a full SQL grammar; anything it
+can't place is rejected rather than guessed at.
+
+Literal values don't change a query's structure, so the analysis is cached
+per normalized shape (keywords lowercased, literals replaced by a marker for
+their kind: number, string, or string starting with %): a repeat of the same
+question with a different date or search term is tokenized and patched,
+never re-analysed.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "200"))
+SCAN_MAX_ROWS = int(os.getenv("SQL_SCAN_MAX_ROWS", "50"))
+_CACHE_SIZE = int(os.getenv("SQL_SHAPE_CACHE_SIZE", "512"))
+
+USER_PLACEHOLDER = "'{user_id}'"
+
+_TOKEN = re.compile(
+    r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<str>'(?:[^']|'')*')
+  | (?P<ident>"(?:[^"]|"")+")
+  | (?P<num>\d+(?:\.\d+)?(?:e[+-]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op>::|<>|!=|<=|>=|->>|->|\#>>|\#>|@>|<@|\|\||!~~\*|!~~|~~\*|~~|!~\*|~\*|[(),.;=<>+\-*/%\[\]~!@^&|?:])
+    """,
+    re.VERBOSE | re.DOTALL | re.IGNORECASE,
+)
+
+# Statements other than SELECT; only looked for where a statement can start
+_WRITE_WORDS = frozenset(
+    "insert update delete merge upsert drop alter create truncate grant revoke copy call do execute "
+    "vacuum analyze cluster reindex lock set reset listen notify unlisten prepare deallocate "
+    "refresh comment security import discard checkpoint load".split()
+)
+_FORBIDDEN_FUNCTIONS = frozenset(("dblink", "set_config", "query_to_xml", "lo_import", "lo_export"))
+# Set-returning functions that may appear in FROM without a user_id filter of their own
+_ROW_FUNCTIONS = frozenset((
+    "jsonb_array_elements", "jsonb_array_elements_text", "jsonb_each", "jsonb_each_text",
+    "json_array_elements", "json_array_elements_text", "json_each", "json_each_text",
+    "jsonb_to_recordset", "json_to_recordset", "unnest", "generate_series",
+))
+_CLAUSE_WORDS = frozenset(
+    "where group order limit offset having window fetch union intersect except on using join inner left "
+    "right full cross natural lateral for returning select from as and or not".split()
+)
+_SET_OPERATORS = frozenset(("union", "intersect", "except"))
+_TAIL_WORDS = ("group", "order", "limit", "offset", "having", "window", "fetch")
+
+stats = {"checked": 0, "shape_cache_hits": 0, "rejected": 0, "rewritten": 0, "flagged": 0}
+
+
+class UnsafeSqlError(ValueError):
+    """Generated SQL failed validation and must not be run."""
+
+
+class _Tok:
+    __slots__ = ("kind", "text", "low", "start", "end", "owner")
+
+    def __init__(self, kind: str, text: str, start: int, end: int):
+        self.kind = kind
+        self.text = text
+        self.low = text.lower() if kind == "word" else text
+        self.start = start
+        self.end = end
+        self.owner = -1  # index of the innermost enclosing "(" (-1 = top level)
+
+
+def _strip_fences(sql: str) -> str:
+    sql = sql.strip()
+    if sql.startswith("```"):
+        lines = sql.splitlines()
+        sql = "\n".join(lines[1:-1] if lines[-1].strip() == "```" else lines[1:])
+    return sql.strip()
+
+
+def _tokenize(sql: str) -> list[_Tok]:
+    tokens = []
+    pos = 0
+    while pos < len(sql):
+        m = _TOKEN.match(sql, pos)
+        if not m:
+            raise UnsafeSqlError(f"unexpected character {sql[pos]!r} at {pos}")
+        kind = m.lastgroup
+        if kind == "str" and tokens and tokens[-1].end == m.start() and tokens[-1].low in ("e", "u&"):
+            raise UnsafeSqlError("escape-string literals are not allowed")
+        if kind not in ("space", "comment"):
+            tokens.append(_Tok(kind, m.group(), m.start(), m.end()))
+        pos = m.end()
+    while tokens and tokens[-1].text == ";":
+        tokens.pop()
+    if any(t.text == ";" for t in tokens):
+        raise UnsafeSqlError("only a single statement is allowed")
+    if not tokens:
+        raise UnsafeSqlError("empty query")
+    return tokens
+
+
+def _shape(tokens: list[_Tok]) -> str:
+    """Keywords lowercased; literals as ?n, ?s, or ?% for a string with a leading wildcard."""
+    parts = []
+    for t in tokens:
+        if t.kind == "num":
+            parts.append("?n")
+        elif t.kind == "str" and t.text != USER_PLACEHOLDER:
+            parts.append("?%" if t.text.startswith("'%") else "?s")
+        else:
+            parts.append(t.low)
+    return " ".join(parts)
+
+
+class _Plan:
+    """What analysis decided for one query shape; apply() replays it on any query of that shape."""
+
+    def __init__(self):
+        self.error: str | None = None
+        self.flags: list[str] = []
+        self.rewrites: list[str] = []
+        self.edits: list[tuple[int, str, str]] = []  # (token index, "before" | "after" | "clamp" | "replace", text)
+        self.cap = MAX_ROWS
+
+    def apply(self, sql: str, tokens: list[_Tok]) -> tuple[str, bool]:
+        """The rewritten query, and whether a LIMIT had to be clamped to the cap."""
+        source = sql[:tokens[-1].end]
+        splices = []  # (start, end, text); inserts at one position keep edit order
+        clamped = False
+        for index, kind, text in self.edits:
+            t = tokens[index]
+            if kind == "before":
+                splices.append((t.start, t.start, text))
+            elif kind == "after":
+                splices.append((t.end, t.end, text))
+            elif kind == "replace":
+                splices.append((t.start, t.end, text))
+            elif kind == "clamp" and t.kind == "num" and float(t.text) > self.cap:
+                splices.append((t.start, t.end, str(self.cap)))
+                clamped = True
+        parts, pos = [], 0
+        for start, end, text in sorted(splices, key=lambda s: s[0]):
+            parts.append(source[pos:start])
+            parts.append(text)
+            pos = max(pos, end)
+        parts.append(source[pos:])
+        return "".join(parts), clamped
+
+
+class _Analysis:
+    def __init__(self, tokens: list[_Tok], tables: frozenset[str]):
+        self.tokens = tokens
+        self.tables = tables
+        self.plan = _Plan()
+        self.parent: dict[int, int] = {}  # "(" index -> enclosing "(" index
+        self.subquery: set[int] = set()  # "(" indexes that directly contain a SELECT
+        self.segment: list[int] = [0] * len(tokens)  # set-operation branch within its scope
+        self.ctes: set[str] = set()
+
+    # --- structure ---------------------------------------------------------
+
+    def _scopes(self) -> None:
+        stack = [-1]
+        segments = {-1: 0}
+        for i, t in enumerate(self.tokens):
+            t.owner = stack[-1]
+            if t.text == "(":
+                self.parent[i] = stack[-1]
+                stack.append(i)
+                segments[i] = 0
+            elif t.text == ")":
+                if len(stack) == 1:
+                    raise UnsafeSqlError("unbalanced parentheses")
+                stack.pop()
+                t.owner = stack[-1]
+            elif t.low in _SET_OPERATORS:
+                segments[stack[-1]] += 1
+            if t.low == "select" and t.owner != -1:
+                self.subquery.add(t.owner)
+            self.segment[i] = segments[t.owner]
+        if len(stack) != 1:
+            raise UnsafeSqlError("unbalanced parentheses")
+
+    def _scope_of(self, index: int) -> tuple[int, int]:
+        """The SELECT a token belongs to: (enclosing subquery paren, set-operation branch)."""
+        owner = self.tokens[index].owner
+        branch = self.segment[index]
+        while owner != -1 and owner not in self.subquery:
+            branch = self.segment[owner]
+            owner = self.parent[owner]
+        return owner, branch
+
+    # --- checks ------------------------------------------------------------
+
+    def _statement_kind(self) -> None:
+        tokens = self.tokens
+        first = tokens[0].low
+        if first not in ("select", "with", "("):
+            raise UnsafeSqlError(f"only SELECT queries are allowed, got {tokens[0].text.upper()}")
+        for i, t in enumerate(tokens):
+            if t.kind != "word" or (i > 0 and tokens[i - 1].text in (".", "::")):
+                continue
+            nxt = tokens[i + 1].text if i + 1 < len(tokens) else ""
+            if t.low in _WRITE_WORDS and self._statement_start(i):
+                raise UnsafeSqlError(f"{t.text.upper()} is not allowed in a read-only query")
+            if t.low == "into":
+                raise UnsafeSqlError("SELECT INTO is not allowed")
+            if t.low == "table":
+                # TABLE name reads a whole table with no WHERE to filter it
+                raise UnsafeSqlError("TABLE is not allowed")
+            if nxt == "(" and (t.low in _FORBIDDEN_FUNCTIONS or t.low.startswith(("pg_", "lo_"))):
+                raise UnsafeSqlError(f"function {t.text} is not allowed")
+            if t.low == "for" and nxt.lower() in ("update", "share", "no", "key"):
+                raise UnsafeSqlError("row locking is not allowed")
+        if first == "with":
+            i = 1
+            if tokens[i].low == "recursive":
+                i += 1
+            while True:
+                name = tokens[i]
+                if name.kind not in ("word", "ident"):
+                    raise UnsafeSqlError("malformed WITH clause")
+                self.ctes.add(name.low.strip('"'))
+                i += 1
+                if tokens[i].text == "(":
+                    i = self._close(i) + 1
+                if tokens[i].low != "as":
+                    raise UnsafeSqlError("malformed WITH clause")
+                i += 1
+                while tokens[i].low in ("not", "materialized"):
+                    i += 1
+                if tokens[i].text != "(":
+                    raise UnsafeSqlError("malformed WITH clause")
+                i = self._close(i) + 1
+                if i < len(tokens) and tokens[i].text == ",":
+                    i += 1
+                    continue
+                break
+            if i >= len(tokens) or tokens[i].low not in ("select", "("):
+                raise UnsafeSqlError("WITH must be followed by a SELECT")
+
+    def _statement_start(self, index: int) -> bool:
+        """True if a statement can start at index: the query start, or a "(" after AS, a set operator or "("."""
+        tokens = self.tokens
+        while index > 0 and tokens[index - 1].text == "(":
+            index -= 1
+            if index == 0 or tokens[index - 1].low in ("as", "materialized", *_SET_OPERATORS):
+                return True
+        return index == 0
+
+    def _close(self, open_index: int) -> int:
+        for j in range(open_index + 1, len(self.tokens)):
+            if self.tokens[j].text == ")" and self.tokens[j].owner == self.tokens[open_index].owner:
+                return j
+        raise UnsafeSqlError("unbalanced parentheses")
+
+    def _table_refs(self) -> list[dict]:
+        """Base-table references: FROM/JOIN targets and comma-separated FROM lists."""
+        tokens = self.tokens
+        refs = []
+        in_from: dict[tuple[int, int], bool] = {}
+        for i, t in enumerate(tokens):
+            scope_key = (t.owner, self.segment[i])
+            if t.low == "from" and (
+                (t.owner != -1 and t.owner not in self.subquery) or (i > 0 and tokens[i - 1].low == "distinct")
+            ):
+                continue  # EXTRACT(x FROM y), TRIM(... FROM ...), IS DISTINCT FROM
+            if t.low in ("from", "join"):
+                in_from[scope_key] = True
+            elif t.low in _CLAUSE_WORDS and t.low not in ("as", "lateral", "join"):
+                in_from[scope_key] = False
+                continue
+            elif not (t.text == "," and in_from.get(scope_key)):
+                continue
+            j = i + 1
+            while j < len(tokens) and tokens[j].low in ("lateral", "only"):
+                j += 1
+            if j >= len(tokens):
+                raise UnsafeSqlError(f"incomplete {t.text.upper()} clause")
+            target = tokens[j]
+            if target.text == "(":
+                if j not in self.subquery:
+                    raise UnsafeSqlError("parenthesized joins are not allowed")
+                continue  # subquery; its own SELECT is checked as a scope
+            if target.kind not in ("word", "ident"):
+                raise UnsafeSqlError(f"unexpected {target.text!r} after {t.text.upper()}")
+            name, schema, k = target.low.strip('"'), None, j + 1
+            if k < len(tokens) and tokens[k].text == ".":
+                schema, name, k = name, tokens[k + 1].low.strip('"'), k + 2
+            if k < len(tokens) and tokens[k].text == "(":
+                if schema or name not in _ROW_FUNCTIONS:
+                    raise UnsafeSqlError(f"function {name} is not allowed in FROM")
+                continue
+            if schema not in (None, "public") or (name not in self.tables and name not in self.ctes):
+                raise UnsafeSqlError(f"table {target.text if not schema else schema + '.' + name} is not allowed here")
+            if name in self.ctes and schema is None:
+                continue
+            if k < len(tokens) and tokens[k].low == "as":
+                k += 1
+            alias = name
+            if k < len(tokens) and tokens[k].kind in ("word", "ident") and tokens[k].low not in _CLAUSE_WORDS:
+                alias = tokens[k].low.strip('"')
+            refs.append({"name": name, "alias": alias, "index": j, "scope": self._scope_of(i)})
+        return refs
+
+    def _user_predicates(self) -> list[dict]:
+        """Every [alias.]user_id = '{user_id}' (either way round) that restricts its scope, with its alias."""
+        tokens = self.tokens
+        words = [t.low.strip('"') for t in tokens]
+        found = []
+        for i, t in enumerate(tokens[1:-1], start=1):
+            if t.text != "=":
+                continue
+            if tokens[i + 1].text == USER_PLACEHOLDER and words[i - 1] == "user_id":
+                qualified = i >= 3 and tokens[i - 2].text == "."
+                qualifier = words[i - 3] if qualified else None
+                start, end = (i - 3 if qualified else i - 1), i + 1
+            elif tokens[i - 1].text == USER_PLACEHOLDER and words[i + 1] == "user_id" and (
+                i + 2 >= len(tokens) or tokens[i + 2].text != "."
+            ):
+                qualifier, start, end = None, i - 1, i + 1
+            elif tokens[i - 1].text == USER_PLACEHOLDER and i + 3 < len(tokens) and tokens[i + 2].text == "." \
+                    and words[i + 3] == "user_id":
+                qualifier, start, end = words[i + 1], i - 1, i + 3
+            else:
+                continue
+            if self._is_conjunct(start, end):
+                found.append({"qualifier": qualifier, "scope": self._scope_of(i)})
+        return found
+
+    def _is_conjunct(self, start: int, end: int) -> bool:
+        """True if tokens[start:end + 1] is a whole top-level AND term of a WHERE or inner-join ON clause.
+
+        Anything else (NOT p, p IS NOT TRUE, p = false, (p) IS NULL, CASE ...
+        ELSE p END, p OR ...) can hold for other users' rows too.
+        """
+        tokens = self.tokens
+        level, branch = tokens[start].owner, self.segment[start]
+
+        def at_level(j):
+            return tokens[j].owner == level and self.segment[j] == branch
+
+        clause = next((j for j in range(start - 1, -1, -1)
+                       if at_level(j) and tokens[j].low in _CLAUSE_WORDS and tokens[j].low not in ("and", "not")),
+                      None)
+        if clause is None or tokens[clause].low not in ("where", "on"):
+            return False
+        if tokens[clause].low == "on":
+            join = next((j for j in range(clause - 1, -1, -1) if at_level(j) and tokens[j].low == "join"), None)
+            if join is None or any(tokens[j].low in ("left", "right", "full") for j in range(max(join - 2, 0), join)):
+                return False  # an outer join keeps rows the ON clause doesn't match
+
+        stop = self._close(level) if level != -1 else len(tokens)
+        clause_end = next((j for j in range(clause + 1, stop)
+                           if at_level(j) and (tokens[j].text == "," or tokens[j].low in _CLAUSE_WORDS)
+                           and tokens[j].low not in ("and", "or", "not")), stop)
+        separators = set()
+        in_between = False
+        for j in range(clause + 1, clause_end):
+            if not at_level(j):
+                continue
+            if tokens[j].low == "or":
+                return False
+            if tokens[j].low == "between":
+                in_between = True
+            elif tokens[j].low == "and":
+                if in_between:
+                    in_between = False  # BETWEEN x AND y
+                else:
+                    separators.add(j)
+        return (start - 1 == clause or start - 1 in separators) and (end + 1 == clause_end or end + 1 in separators)
+
+    def _enforce_user_filter(self) -> None:
+        refs = self._table_refs()
+        predicates = self._user_predicates()
+        missing = []
+        for scope in {r["scope"] for r in refs}:
+            in_scope = [r for r in refs if r["scope"] == scope]
+            preds = [p for p in predicates if p["scope"] == scope]
+            qualified = {p["qualifier"] for p in preds if p["qualifier"]}
+            unqualified = sum(1 for p in preds if not p["qualifier"])
+            for r in in_scope:
+                if r["alias"] in qualified or r["name"] in qualified:
+                    continue
+                if unqualified and len(in_scope) == 1:
+                    continue
+                missing.append(r)
+        if not missing:
+            return
+        set_operation = any(t.low in _SET_OPERATORS and t.owner == -1 for t in self.tokens)
+        if len(refs) == 1 and missing[0]["scope"] == (-1, 0) and not set_operation:
+            self._add_user_filter(missing[0])
+            return
+        raise UnsafeSqlError(
+            "missing user_id = '{user_id}' filter on " + ", ".join(sorted({r["name"] for r in missing}))
+        )
+
+    def _add_user_filter(self, ref: dict) -> None:
+        tokens = self.tokens
+        column = "user_id" if ref["alias"] == ref["name"] else f"{ref['alias']}.user_id"
+        predicate = f"{column} = {USER_PLACEHOLDER}"
+        top = [i for i, t in enumerate(tokens) if t.owner == -1]
+        where = next((i for i in top if tokens[i].low == "where"), None)
+        after = where if where is not None else ref["index"]
+        tail = next((i for i in top if i > after and tokens[i].low in _TAIL_WORDS), None)
+        if where is not None:
+            self.plan.edits.append((where, "after", f" {predicate} AND ("))
+            if tail is None:
+                self.plan.edits.append((len(tokens) - 1, "after", ")"))
+            else:
+                self.plan.edits.append((tail, "before", ") "))
+        elif tail is None:
+            self.plan.edits.append((len(tokens) - 1, "after", f" WHERE {predicate}"))
+        else:
+            self.plan.edits.append((tail, "before", f"WHERE {predicate} "))
+        self.plan.rewrites.append("added user_id filter")
+
+    def _flag_scans(self) -> None:
+        tokens = self.tokens
+        words = {t.low for t in tokens if t.kind == "word"}
+        likes = [i for i, t in enumerate(tokens) if t.low in ("like", "ilike", "~~", "~~*")]
+        if words & {"jsonb_array_elements", "jsonb_array_elements_text", "json_array_elements",
+                    "json_array_elements_text"} and (likes or "~*" in words):
+            self.plan.flags.append("jsonb_scan")
+        if any(i + 1 < len(tokens) and tokens[i + 1].kind == "str" and tokens[i + 1].text.startswith("'%")
+               for i in likes):
+            self.plan.flags.append("leading_wildcard")
+        for i, t in enumerate(tokens):
+            if t.low == "order" and i + 3 < len(tokens) and tokens[i + 2].low in ("random", "gen_random_uuid"):
+                self.plan.flags.append("order_by_random")
+        if "generate_series" in words:
+            self.plan.flags.append("generate_series")
+
+    def _enforce_limit(self) -> None:
+        tokens = self.tokens
+        if self.plan.flags:
+            self.plan.cap = min(MAX_ROWS, SCAN_MAX_ROWS)
+        top = [i for i, t in enumerate(tokens) if t.owner == -1]
+        limit = next((i for i in reversed(top) if tokens[i].low == "limit"), None)
+        fetch = next((i for i in reversed(top) if tokens[i].low == "fetch"), None)
+        if limit is not None:
+            value = tokens[limit + 1] if limit + 1 < len(tokens) else None
+            if value is None:
+                raise UnsafeSqlError("LIMIT without a value")
+            if value.kind == "num":
+                self.plan.edits.append((limit + 1, "clamp", ""))
+            elif value.kind == "str":
+                raise UnsafeSqlError("LIMIT must be a number")
+            else:
+                # LIMIT ALL / LIMIT (expression): replace with the cap
+                end = self._close(limit + 1) if value.text == "(" else limit + 1
+                if end != limit + 1:
+                    raise UnsafeSqlError("LIMIT must be a number")
+                self.plan.edits.append((limit + 1, "replace", str(self.plan.cap)))
+                self.plan.rewrites.append("capped LIMIT")
+            return
+        if fetch is not None:
+            count = next((i for i in range(fetch, len(tokens)) if tokens[i].kind == "num"), None)
+            if count is None:
+                raise UnsafeSqlError("FETCH without a row count")
+            self.plan.edits.append((count, "clamp", ""))
+            return
+        offset = next((i for i in top if tokens[i].low == "offset"), None)
+        if offset is None:
+            self.plan.edits.append((len(tokens) - 1, "after", f" LIMIT {self.plan.cap}"))
+        else:
+            self.plan.edits.append((offset, "before", f"LIMIT {self.plan.cap} "))
+        self.plan.rewrites.append("added LIMIT")
+
+    def run(self) -> _Plan:
+        try:
+            self._scopes()
+            self._statement_kind()
+            self._enforce_user_filter()
+            self._flag_scans()
+            self._enforce_limit()
+        except UnsafeSqlError as e:
+            self.plan.error = str(e)
+        except IndexError:
+            self.plan.error = "incomplete query"
+        return self.plan
+
+
+_lock = threading.Lock()
+_shapes: OrderedDict[tuple[str, frozenset[str]], _Plan] = OrderedDict()
+
+
+def check(sql: str, tables: set[str] | frozenset[str]) -> dict:
+    """Validate and rewrite a generated query; raises UnsafeSqlError if it can't be made safe.
+
+    Returns {"sql": the query to run, "flags": full-scan patterns found,
+    "rewrites": what was changed}. tables is what the query may read.
+    """
+    stats["checked"] += 1
+    # The prompts show the placeholder both bare and quoted; only the quoted form is checked for
+    sql = re.sub(r"(?<!')\{user_id\}(?!')", USER_PLACEHOLDER, _strip_fences(sql))
+    try:
+        tokens = _tokenize(sql)
+    except UnsafeSqlError:
+        stats["rejected"] += 1
+        raise
+    key = (_shape(tokens), frozenset(t.lower() for t in tables))
+    with _lock:
+        plan = _shapes.get(key)
+        if plan is not None:
+            _shapes.move_to_end(key)
+            stats["shape_cache_hits"] += 1
+    if plan is None:
+        plan = _Analysis(tokens, key[1]).run()
+        with _lock:
+            _shapes[key] = plan
+            while len(_shapes) > _CACHE_SIZE:
+                _shapes.popitem(last=False)
+
+    if plan.error:
+        stats["rejected"] += 1
+        raise UnsafeSqlError(plan.error)
+    rewritten, clamped = plan.apply(sql, tokens)
+    rewrites = plan.rewrites + (["capped LIMIT"] if clamped else [])
+    if rewrites:
+        stats["rewritten"] += 1
+    if plan.flags:
+        stats["flagged"] += 1
+    return {"sql": rewritten, "flags": list(plan.flags), "rewrites": rewrites}
@@ -0,0 +1,53 @@
+"""Word splitting and stemming shared by the local text matchers.
+
+problem_classifier (TF-IDF over problem types) and similar_incidents (BM25
+over resolved incidents) must tokenize identically, so both use these.
+"""
+import re
+
+STOPWORDS = frozenset(
+    "a an and are as at be been but by for from has have i in is it its of on or our "
+    "that the their them they this to was we were will with my me you your".split()
+)
+
+_WORD = re.compile(r"[a-z0-9]+", re.IGNORECASE)
+
+
+def _strip_apostrophes(text: str) -> str:
+    return text.replace("'", "").replace("’", "")
+
+
+def split_words(text: str) -> list[str]:
+    """Lowercased alphanumeric runs, apostrophes dropped ("don't" -> "dont")."""
+    return _WORD.findall(_strip_apostrophes(text).lower())
+
+
+def stem(word: str) -> str:
+    """Strip a trailing -ing, -es or -s; crude, but the same on both sides of a match."""
+    if len(word) > 4 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 3 and word.endswith("es"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def stemmed_terms(text: str) -> list[str]:
+    """split_words() without stopwords, stemmed."""
+    return [stem(w) for w in split_words(text) if w not in STOPWORDS]
+
+
+def surface_forms(text: str) -> dict[str, str]:
+    """Stem -> the first word in text that stems to it, as written.
+
+    Case is kept for acronyms and product names ("VPN", "PointClickCare") and
+    dropped for words that are only capitalized at the start of a sentence.
+    """
+    forms: dict[str, str] = {}
+    for word in _WORD.findall(_strip_apostrophes(text)):
+        lower = word.lower()
+        if lower in STOPWORDS:
+            continue
+        forms.setdefault(stem(lower), word if any(c.isupper() for c in word[1:]) else lower)
+    return forms
@@ -0,0 +1,234 @@
+"""Opt-in capture of API traffic to rotating JSONL, replayed by bench/replay.py.
+
+Set CAPTURE_DIR to turn it on. Every /api/ request then writes one line with
+the route, request body, response status and body, total time, time to first
+body byte, per-stage times (from metrics.span) and every upstream Messages
+API call made while serving it: the exact request sent, the reply text,
+token usage and latency.
+
+Email addresses anywhere in a line are replaced with
+user-<hash>@redacted.invalid, the same placeholder for the same address, so
+a replay still groups traffic by user without carrying anyone's address.
+CAPTURE_REDACT_SALT keys the hash. user_id values get the same treatment
+(user-<hash>). Values under secret-looking keys (access_token,
+authorization, apikey, anything containing "token" or "key" other than
+token counts) are replaced with "[redacted]" at any depth. Request headers
+are never recorded. Routes that verify an access token note the verified
+user (user()), so the record carries that user's user-<hash> in place of
+the token and a replay can still act as the same user.
+
+Each worker writes capture-<pid>.jsonl, rolled over to .1, .2, ... at
+CAPTURE_MAX_MB and keeping CAPTURE_KEEP old files. Lines are handed to a
+background thread, so a request never waits on the disk.
+"""
+import os
+import re
+import time
+import hashlib
+from contextvars import ContextVar
+
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "").strip()
+_MAX_BYTES = int(float(os.getenv("CAPTURE_MAX_MB", "50")) * 1024 * 1024)
+_KEEP = int(os.getenv("CAPTURE_KEEP", "10"))
+_SALT = os.getenv("CAPTURE_REDACT_SALT", "")
+# Longer request/response bodies (batch imports, long streams) are truncated
+_MAX_BODY = int(os.getenv("CAPTURE_MAX_BODY_KB", "256")) * 1024
+
+_EMAIL = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)+")
+_REDACTED_DOMAIN = "@redacted.invalid"
+_SECRET_KEY = re.compile(r"token|key|authorization|secret|password", re.IGNORECASE)
+# Token counts and timings (max_tokens, input_tokens, first_token_ms) are kept
+_COUNT_KEY = re.compile(r"tokens$|_ms$", re.IGNORECASE)
+_SECRET = "[redacted]"
+
+current: ContextVar[dict | None] = ContextVar("capture_record", default=None)
+
+_logger = None
+_listener = None
+
+stats = {"records": 0, "upstream_calls": 0, "truncated": 0}
+
+
+def _pseudonym(value: str) -> str:
+    return "user-" + hashlib.sha256((_SALT + value.lower()).encode()).hexdigest()[:12]
+
+
+def _redact_match(m: re.Match) -> str:
+    address = m.group()
+    if address.endswith(_REDACTED_DOMAIN):
+        return address
+    return _pseudonym(address) + _REDACTED_DOMAIN
+
+
+def redact(text: str) -> str:
+    """Replace every email address in text with its stable placeholder."""
+    return _EMAIL.sub(_redact_match, text)
+
+
+def _redact_field(key, value):
+    if not isinstance(key, str):
+        return redact_secrets(value)
+    # Numbers (the first_token stage time, counts) are never secrets
+    if _SECRET_KEY.search(key) and not _COUNT_KEY.search(key) and not isinstance(value, (int, float)):
+        return _SECRET
+    if key.lower() == "user_id" and isinstance(value, str) and value:
+        return _pseudonym(value)
+    return redact_secrets(value)
+
+
+def redact_secrets(value):
+    """value with secret-looking fields blanked and user_ids pseudonymized, at any depth."""
+    if isinstance(value, dict):
+        return {k: _redact_field(k, v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact_secrets(v) for v in value]
+    return value
+
+
+def start() -> None:
+    """Open this worker's capture file and start the writer thread (no-op unless CAPTURE_DIR is set)."""
+    global _logger, _listener
+    if not CAPTURE_DIR or _listener is not None:
+        return
+    import queue
+    import logging
+    from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+    os.makedirs(CAPTURE_DIR, exist_ok=True)
+    path = os.path.join(CAPTURE_DIR, f"capture-{os.getpid()}.jsonl")
+    handler = RotatingFileHandler(path, maxBytes=_MAX_BYTES, backupCount=_KEEP, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    lines: queue.SimpleQueue = queue.SimpleQueue()
+    _logger = logging.getLogger("bruce.capture")
+    _logger.propagate = False
+    _logger.setLevel(logging.INFO)
+    _logger.addHandler(QueueHandler(lines))
+    _listener = QueueListener(lines, handler)
+    _listener.start()
+    print(f"[traffic_capture] Capturing /api traffic to {path}")
+
+
+def shutdown() -> None:
+    """Write out queued lines and close the file."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def stage(name: str, seconds: float) -> None:
+    """Add a stage's time to the request being captured, if any."""
+    record = current.get()
+    if record is not None:
+        stages = record["stages"]
+        stages[name] = round(stages.get(name, 0.0) + seconds * 1000, 2)
+
+
+def user(user_id: str) -> None:
+    """Note the verified user of the request being captured, if any; pseudonymized on write."""
+    record = current.get()
+    if record is not None:
+        record["user_id"] = user_id
+
+
+def upstream(endpoint: str, request: dict, reply, usage, seconds: float, first_token: float | None = None) -> None:
+    """Record one Messages API call made for the request being captured, if any.
+
+    reply is the parsed Message, or the streamed text.
+    """
+    record = current.get()
+    if record is None:
+        return
+    stats["upstream_calls"] += 1
+    text = reply if isinstance(reply, str) else "".join(getattr(block, "text", "") for block in reply.content)
+    record["upstream"].append({
+        "endpoint": endpoint,
+        "request": request,
+        "text": text,
+        "usage": usage.model_dump(exclude_none=True) if hasattr(usage, "model_dump") else dict(usage or {}),
+        "latency_ms": round(seconds * 1000, 2),
+        "first_token_ms": round(first_token * 1000, 2) if first_token is not None else None,
+    })
+
+
+def _body(raw: bytes):
+    import json as _json
+
+    if len(raw) >= _MAX_BODY:
+        stats["truncated"] += 1
+    text = bytes(raw[:_MAX_BODY]).decode("utf-8", "replace")
+    try:
+        return _json.loads(text)
+    except ValueError:
+        return text
+
+
+def _write(record: dict) -> None:
+    import json as _json
+
+    if _logger is None:
+        return
+    stats["records"] += 1
+    _logger.info(redact(_json.dumps(redact_secrets(record), default=str, separators=(",", ":"))))
+
+
+class CaptureMiddleware:
+    """ASGI middleware recording each /api/ request while CAPTURE_DIR is set.
+
+    Plain ASGI like metrics.TimingMiddleware: bodies are copied as they pass,
+    streaming responses are not buffered, and the record is written once the
+    response has finished (or the client has gone).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if _logger is None or scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        record = {
+            "ts": time.time(),
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": None,
+            "stages": {},
+            "upstream": [],
+        }
+        request_body = bytearray()
+        response_body = bytearray()
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request" and len(request_body) < _MAX_BODY:
+                request_body.extend(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                record["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                if chunk and "first_byte_ms" not in record:
+                    record["first_byte_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                if len(response_body) < _MAX_BODY:
+                    response_body.extend(chunk)
+            await send(message)
+
+        token = current.set(record)
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except BaseException as e:
+            record["error"] = e.__class__.__name__
+            raise
+        finally:
+            current.reset(token)
+            record["route"] = getattr(scope.get("route"), "path", scope["path"])
+            record["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            record["request"] = _body(request_body)
+            record["response"] = _body(response_body)
+            _write(record)
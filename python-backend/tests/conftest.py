@@ -0,0 +1,82 @@
+import os
+import sys
+import asyncio
+
+import anthropic
+import httpx
+import pytest
+
+# Tests import the backend the way main.py does: `from services import ...`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubMessages:
+    """Stands in for client.messages: counts calls, optionally holds them on a gate or fails them."""
+
+    def __init__(self):
+        self.calls: list[dict] = []
+        self.reply = "stub reply"
+        self.stream_words = ["stub ", "streamed ", "reply"]
+        self.word_delay = 0.0
+        self.gate: asyncio.Event | None = None
+        self.error: Exception | None = None
+        self.cancelled = 0
+        self.with_raw_response = self
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        try:
+            if self.gate is not None:
+                await self.gate.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        message = anthropic.types.Message(
+            id="msg_stub", type="message", role="assistant", model=kwargs.get("model", ""),
+            content=[{"type": "text", "text": self.reply}], stop_reason="end_turn", stop_sequence=None,
+            usage={"input_tokens": 100, "output_tokens": 10},
+        )
+        return type("Raw", (), {"headers": httpx.Headers(), "parse": lambda _self: message})()
+
+    def stream(self, **kwargs):
+        self.calls.append(kwargs)
+        return _StubStream(self)
+
+
+class _StubStream:
+    def __init__(self, messages: StubMessages):
+        self.messages = messages
+        self.response = type("R", (), {"headers": httpx.Headers()})()
+        self.current_message_snapshot = type("S", (), {
+            "usage": anthropic.types.Usage(input_tokens=100, output_tokens=0),
+        })()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        try:
+            for word in self.messages.stream_words:
+                await asyncio.sleep(self.messages.word_delay)
+                self.current_message_snapshot.usage.output_tokens += 1
+                yield word
+        except (asyncio.CancelledError, GeneratorExit):
+            self.messages.cancelled += 1
+            raise
+
+
+@pytest.fixture
+def stub_client(monkeypatch):
+    """Replace the Anthropic client in ai_service; returns its StubMessages."""
+    from services import ai_service
+
+    messages = StubMessages()
+    client = type("Client", (), {"messages": messages})()
+    monkeypatch.setattr(ai_service, "get_client", lambda: client)
+    return messages
@@ -0,0 +1,30 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client():
+    # No lifespan: these checks must not depend on warm-up
+    return TestClient(main.app)
+
+
+def test_routing_update_needs_admin_token(client, monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+    assert client.put("/api/routing", json={}).status_code == 401
+    assert client.put("/api/routing", json={}, headers={"X-Admin-Token": "wrong"}).status_code == 401
+    assert client.put("/api/routing", json={}, headers={"X-Admin-Token": "s3cret"}).status_code == 200
+
+
+def test_admin_routes_are_off_without_admin_token(client, monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert client.put("/api/routing", json={}, headers={"X-Admin-Token": ""}).status_code == 403
+
+
+def test_prompt_reload_needs_admin_token(client, monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+    monkeypatch.setattr(main.prompt_loader, "reload", lambda: 7)
+    assert client.post("/api/prompts/reload").status_code == 401
+    response = client.post("/api/prompts/reload", headers={"X-Admin-Token": "s3cret"})
+    assert response.status_code == 200 and response.json() == {"version": 7}
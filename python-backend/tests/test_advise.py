@@ -0,0 +1,32 @@
+import json
+import asyncio
+
+from services import ai_service
+
+_PLAN_WITH_SQL = json.dumps({
+    "rephrasing": "You're asking which printers are out of warranty.",
+    "sql": "SELECT make, warranty_expires FROM assets WHERE user_id = '{user_id}'",
+    "lookup_description": "printer warranties",
+})
+
+
+def test_discarded_speculation_is_cancelled_and_billed_once(stub_client, monkeypatch):
+    """The plan wants a lookup, so the speculative no-lookup answer is dropped mid-stream."""
+    tracked = []
+    monkeypatch.setattr(ai_service, "_track_usage", lambda user_email, usage, model="": tracked.append(usage))
+    stub_client.reply = _PLAN_WITH_SQL
+    stub_client.word_delay = 0.05
+    stub_client.stream_words = ["speculative "] * 20
+    wasted = ai_service.stats["speculation_wasted_output_tokens"]
+
+    async def run_query(sql):
+        return [{"make": "HP", "warranty_expires": "2024-01-01"}]
+
+    result = asyncio.run(ai_service.advise("Which printers are out of warranty?", [], run_query, speculative=True))
+    assert result["supporting_data"] == [{"make": "HP", "warranty_expires": "2024-01-01"}]
+    assert stub_client.cancelled == 1
+    # Plan, speculation (partial) and answer: each call's usage is tracked exactly once
+    assert len(stub_client.calls) == 3 and len(tracked) == 3
+    speculation_usage = [u for u in tracked if u.output_tokens < 10]
+    assert len(speculation_usage) == 1
+    assert ai_service.stats["speculation_wasted_output_tokens"] == wasted + speculation_usage[0].output_tokens
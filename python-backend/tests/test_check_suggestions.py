@@ -0,0 +1,27 @@
+import json
+import asyncio
+
+from services import ai_service, response_cache
+
+
+def _task(n: int, note: str) -> dict:
+    return {"task_number": n, "title": f"Task {n}", "date_completed": "2026-01-10", "note": note}
+
+
+def test_notes_without_cues_skip_the_model_call(stub_client):
+    tasks = [_task(1, "Replaced the toner."), _task(2, "User was happy"), _task(3, None)]
+    assert asyncio.run(ai_service.check_suggestions(tasks)) == []
+    assert stub_client.calls == []
+
+
+def test_only_cued_notes_reach_the_model_once(stub_client):
+    response_cache.clear()
+    stub_client.reply = json.dumps([
+        {"task_number": 4, "title": "Check UPS battery", "reason": "Six months since replacement", "due_date": "2026-07-10"},
+    ])
+    tasks = [_task(4, "Replaced UPS battery, check again in 6 months"), _task(5, "Replaced the toner.")]
+    asyncio.run(ai_service.check_suggestions(tasks))
+    asyncio.run(ai_service.check_suggestions(tasks))
+    assert len(stub_client.calls) == 1
+    prompt = stub_client.calls[0]["messages"][0]["content"]
+    assert "Task #4" in prompt and "Task #5" not in prompt
@@ -0,0 +1,72 @@
+import json
+import asyncio
+
+import main
+
+_BODY = json.dumps({"prompt": "How do I map a network drive?"}).encode()
+
+
+async def _call(path: str, disconnect_after: float | None = None) -> list[dict]:
+    """Send one request straight through the ASGI app; returns the messages it sent back."""
+    scope = {
+        "type": "http", "method": "POST", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(_BODY)).encode())],
+        "http_version": "1.1", "scheme": "http", "server": ("test", 80), "client": ("test", 1234),
+        "root_path": "", "app": main.app,
+    }
+    sent = []
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": _BODY, "more_body": False}
+        if disconnect_after is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await main.app(scope, receive, send)
+    return sent
+
+
+def test_request_over_its_deadline_gets_504_and_cancels_upstream(stub_client, monkeypatch):
+    monkeypatch.setenv("AI_DEADLINE_ASK", "0.05")
+
+    async def run():
+        stub_client.gate = asyncio.Event()  # never set: the model never answers
+        return await _call("/api/ask")
+
+    sent = asyncio.run(run())
+    assert sent[0]["type"] == "http.response.start" and sent[0]["status"] == 504
+    assert "longer than 0.05s" in json.loads(sent[1]["body"])["detail"]
+    assert stub_client.cancelled == 1
+
+
+def test_stream_past_its_deadline_ends_with_an_error_event(stub_client, monkeypatch):
+    monkeypatch.setenv("AI_DEADLINE_ASK_STREAM", "0.1")
+    stub_client.word_delay = 0.04
+    stub_client.stream_words = ["word "] * 50
+
+    sent = asyncio.run(_call("/api/ask/stream"))
+    assert sent[0]["status"] == 200
+    body = b"".join(m.get("body", b"") for m in sent[1:])
+    assert b"event: token" in body and body.rstrip().splitlines()[-2] == b"event: error"
+    assert stub_client.cancelled == 1
+
+
+def test_client_disconnect_cancels_the_upstream_call(stub_client, monkeypatch):
+    monkeypatch.setenv("AI_DEADLINE_ASK", "30")
+
+    async def run():
+        stub_client.gate = asyncio.Event()
+        return await _call("/api/ask", disconnect_after=0.05)
+
+    sent = asyncio.run(run())
+    # Nobody is left to read a response
+    assert sent == []
+    assert len(stub_client.calls) == 1 and stub_client.cancelled == 1
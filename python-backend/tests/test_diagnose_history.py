@@ -0,0 +1,39 @@
+import asyncio
+
+from services import ai_service, response_cache, scheduler
+
+
+def _conversation(turns: int) -> list[dict]:
+    return [
+        {"role": "user" if i % 2 == 0 else "ai", "content": f"turn {i}: " + "the Oakdale wifi drops again " * 20}
+        for i in range(turns)
+    ]
+
+
+def _input_tokens(conversation: list[dict]) -> int:
+    summary, recent = asyncio.run(ai_service._compact_history("intermittent_network_slowness", conversation))
+    system, messages = ai_service._diagnosis_request(
+        "intermittent_network_slowness", None, "Slow after 2pm", None, recent, summary,
+    )
+    return scheduler.estimate_tokens({"system": system, "messages": messages})
+
+
+def test_compaction_keeps_the_latest_turns_verbatim(stub_client):
+    response_cache.clear()
+    conversation = _conversation(23)
+    summary, recent = asyncio.run(ai_service._compact_history("intermittent_network_slowness", conversation))
+    assert summary == "stub reply"
+    assert recent == conversation[-len(recent):]
+    assert ai_service._KEEP_TURNS <= len(recent) < ai_service._KEEP_TURNS + ai_service._FOLD_STEP
+    # The verbatim tail starts on the same speaker as the full history
+    assert recent[0]["role"] == conversation[0]["role"]
+
+
+def test_compacted_prompt_stays_bounded_as_the_conversation_grows(stub_client):
+    response_cache.clear()
+    one_window = _input_tokens(_conversation(ai_service._KEEP_TURNS + ai_service._FOLD_STEP - 1))
+    uncompacted = scheduler.estimate_tokens({"messages": _conversation(60)})
+    for turns in (20, 40, 60):
+        # Never more than the longest verbatim tail plus the summary, however long the session
+        assert _input_tokens(_conversation(turns)) <= one_window + 100
+    assert _input_tokens(_conversation(60)) < uncompacted / 4
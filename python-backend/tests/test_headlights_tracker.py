@@ -0,0 +1,101 @@
+import pytest
+
+from services import headlights_tracker, postgrest
+
+
+@pytest.fixture
+def rpc(monkeypatch):
+    """Record bruce_increment_usage calls; set rpc.fail to make the next ones raise."""
+    calls = []
+
+    def request(method, path, **kwargs):
+        if rpc.fail:
+            raise postgrest.PostgrestError(503, "unavailable")
+        calls.append(kwargs["json"]["deltas"])
+
+    monkeypatch.setattr(postgrest, "configured", lambda: True)
+    monkeypatch.setattr(postgrest, "request", request)
+    monkeypatch.setattr(headlights_tracker, "_rpc_available", True)
+    monkeypatch.setattr(headlights_tracker, "_FLUSH_INTERVAL", 3600)
+    rpc.fail = False
+    rpc.calls = calls
+    yield rpc
+    headlights_tracker.shutdown()
+
+
+def _totals(calls):
+    return {d["email"]: (d["input_tokens"], d["sessions"]) for deltas in calls for d in deltas}
+
+
+def test_failed_flush_is_merged_into_the_next_one(rpc):
+    headlights_tracker.track_tokens("a@x.org", 100, 10)
+    headlights_tracker.track_activity("a@x.org", sessions=1)
+    rpc.fail = True
+    headlights_tracker.flush()
+    assert rpc.calls == []
+
+    rpc.fail = False
+    headlights_tracker.track_tokens("a@x.org", 5, 1)
+    headlights_tracker.track_activity("b@x.org", sessions=1)
+    headlights_tracker.flush()
+    assert _totals(rpc.calls) == {"a@x.org": (105, 1), "b@x.org": (0, 1)}
+
+    # Written once, not again
+    headlights_tracker.flush()
+    assert len(rpc.calls) == 1
+
+
+def test_carried_over_users_are_capped_and_counted(rpc, monkeypatch):
+    monkeypatch.setattr(headlights_tracker, "_MAX_PENDING_USERS", 2)
+    lost = headlights_tracker.stats["deltas_lost"]
+    rpc.fail = True
+    for user in ("a", "b", "c"):
+        headlights_tracker.track_activity(f"{user}@x.org", sessions=1)
+    headlights_tracker.flush()
+    assert headlights_tracker.stats["deltas_lost"] == lost + 1
+
+    rpc.fail = False
+    headlights_tracker.flush()
+    assert set(_totals(rpc.calls)) == {"a@x.org", "b@x.org"}
+
+
+def test_unwritten_deltas_at_shutdown_are_counted(rpc):
+    lost = headlights_tracker.stats["deltas_lost"]
+    rpc.fail = True
+    headlights_tracker.track_activity("a@x.org", clicks=1)
+    headlights_tracker.shutdown()
+    assert headlights_tracker.stats["deltas_lost"] == lost + 1
+
+
+def test_per_user_fallback_keeps_deltas_whose_write_failed(monkeypatch):
+    """RPC not installed: a failed per-user write stays pending; written users aren't resent."""
+    writes = []
+    failing = {"b@x.org"}
+
+    def request(method, path, **kwargs):
+        if path.startswith("rpc/"):
+            raise postgrest.PostgrestError(404, "function not found")
+        if method == "GET":
+            return type("R", (), {"json": lambda self: []})()
+        email = kwargs["json"]["email"]
+        if email in failing:
+            raise postgrest.PostgrestError(503, "unavailable")
+        writes.append((kwargs["json"]["id"], email, kwargs["json"]["sessions"]))
+
+    monkeypatch.setattr(postgrest, "configured", lambda: True)
+    monkeypatch.setattr(postgrest, "request", request)
+    monkeypatch.setattr(headlights_tracker, "_rpc_available", True)
+    monkeypatch.setattr(headlights_tracker, "_FLUSH_INTERVAL", 3600)
+    try:
+        for user in ("a", "b", "c"):
+            headlights_tracker.track_activity(f"{user}@x.org", sessions=1)
+        headlights_tracker.flush()
+        assert [w[1] for w in writes] == ["a@x.org"]
+
+        failing.clear()
+        headlights_tracker.flush()
+        assert sorted(w[1:] for w in writes) == [("a@x.org", 1), ("b@x.org", 1), ("c@x.org", 1)]
+        # New users inserted in the same second still get distinct ids
+        assert len({w[0] for w in writes}) == 3
+    finally:
+        headlights_tracker.shutdown()
@@ -0,0 +1,69 @@
+import re
+import json
+import asyncio
+
+import pytest
+
+from services import ai_service, onboarding_extractor
+
+# (task details, information, what the old all-fields model call returned)
+_CASES = [
+    ("Onboard new hire", "Jane Smith is starting as a CNA at Holden on 2027-03-02.", {
+        "firstName": "Jane", "lastName": "Smith", "role": "clinical_floor", "site": "holden",
+        "startDate": "2027-03-02", "nextAssetNumber": "", "computerName": "", "notes": "",
+    }),
+    ("Onboard new hire", "Jane Smith is starting as a CNA at Holden on 2027-03-02. "
+                         "She needs a badge for the locked med room and speaks Portuguese.", {
+        "firstName": "Jane", "lastName": "Smith", "role": "clinical_floor", "site": "holden",
+        "startDate": "2027-03-02", "nextAssetNumber": "", "computerName": "",
+        "notes": "Needs a badge for the locked med room; speaks Portuguese.",
+    }),
+    ("New hire: Marco Rossi", "Role: maintenance tech. Site: Oakdale. Starts 2027-01-11. "
+                              "Asset tag 40217. Computer name ORSNC-MNT-02. Bring his own phone for MFA.", {
+        "firstName": "Marco", "lastName": "Rossi", "role": "maintenance", "site": "oakdale",
+        "startDate": "2027-01-11", "nextAssetNumber": "40217", "computerName": "ORSNC-MNT-02",
+        "notes": "Will use his own phone for MFA.",
+    }),
+    ("Onboarding", "Someone is joining the business office next month, details to follow from HR.", {
+        "firstName": "", "lastName": "", "role": "business_office", "site": "business",
+        "startDate": "", "nextAssetNumber": "", "computerName": "", "notes": "Details to follow from HR.",
+    }),
+]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """Stand-in for the model: answers each asked field with the old full-extraction value."""
+    calls = []
+
+    async def create_cached(endpoint, user_email="", **kwargs):
+        asked = re.findall(r"^- (\w+):", kwargs["system"].split("Already known")[0], re.MULTILINE)
+        calls.append(asked)
+        return json.dumps({field: model.answer[field] for field in asked})
+
+    monkeypatch.setattr(ai_service, "_create_cached", create_cached)
+    monkeypatch.setattr(ai_service.headlights_tracker, "track_activity", lambda *a, **k: None)
+    model.calls = calls
+    return model
+
+
+@pytest.mark.parametrize("task_details, information, old", _CASES)
+def test_matches_old_model_only_extraction(model, task_details, information, old):
+    model.answer = old
+    result = asyncio.run(ai_service._extract_onboarding(task_details, information))
+    assert result["structured_data"] == old
+    assert list(result["structured_data"]) == [*onboarding_extractor.FIELDS, "notes"]
+
+
+def test_fully_resolved_text_without_extra_detail_makes_no_model_call(model):
+    model.answer = _CASES[0][2]
+    result = asyncio.run(ai_service._extract_onboarding(_CASES[0][0], _CASES[0][1]))
+    assert model.calls == []
+    assert set(result["field_sources"].values()) == {"local"}
+
+
+def test_notes_are_asked_for_even_when_every_field_resolved(model):
+    model.answer = _CASES[1][2]
+    result = asyncio.run(ai_service._extract_onboarding(_CASES[1][0], _CASES[1][1]))
+    assert model.calls == [["notes"]]
+    assert result["structured_data"]["notes"] == _CASES[1][2]["notes"]
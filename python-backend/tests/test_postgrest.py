@@ -0,0 +1,66 @@
+import httpx
+import pytest
+
+from services import postgrest
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """A PostgREST stand-in answering with server.status; counts requests that reach it."""
+    def handler(request):
+        server.calls += 1
+        return httpx.Response(server.status, json=[])
+
+    server.calls = 0
+    server.status = 500
+    monkeypatch.setenv("HEADLIGHTS_SUPABASE_URL", "https://headlights.test")
+    monkeypatch.setenv("HEADLIGHTS_SUPABASE_KEY", "key")
+    monkeypatch.setattr(postgrest, "_client_kwargs", lambda url, key: {
+        "base_url": f"{url}/rest/v1/", "transport": httpx.MockTransport(handler),
+    })
+    monkeypatch.setattr(postgrest, "_RETRIES", 0)
+    monkeypatch.setattr(postgrest, "_BREAKER_THRESHOLD", 3)
+    monkeypatch.setattr(postgrest, "_failures", 0)
+    monkeypatch.setattr(postgrest, "_open_until", 0.0)
+    monkeypatch.setattr(postgrest, "_probing", False)
+    yield server
+    postgrest.close()
+
+
+def _fail_times(n):
+    for _ in range(n):
+        with pytest.raises(postgrest.PostgrestError):
+            postgrest.request("GET", "user_accounts")
+
+
+def _cooldown_over():
+    postgrest._open_until = 0.0
+
+
+def test_breaker_opens_after_repeated_failures_and_rejects_calls(server):
+    _fail_times(3)
+    assert server.calls == 3
+    with pytest.raises(postgrest.CircuitOpenError):
+        postgrest.request("GET", "user_accounts")
+    # Rejected without reaching the server
+    assert server.calls == 3
+
+
+def test_a_trial_call_goes_through_after_the_cooldown(server):
+    _fail_times(3)
+    _cooldown_over()
+    server.status = 200
+    assert postgrest.request("GET", "user_accounts").json() == []
+    assert server.calls == 4
+    # The trial succeeded, so the breaker is closed again
+    postgrest.request("GET", "user_accounts")
+    assert server.calls == 5
+
+
+def test_a_failed_trial_reopens_the_breaker(server):
+    _fail_times(3)
+    _cooldown_over()
+    _fail_times(1)
+    with pytest.raises(postgrest.CircuitOpenError):
+        postgrest.request("GET", "user_accounts")
+    assert server.calls == 4
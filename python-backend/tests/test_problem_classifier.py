@@ -0,0 +1,29 @@
+import asyncio
+
+from services import ai_service, problem_classifier
+
+
+def test_warm_up_builds_the_index_without_counting_a_classification(monkeypatch):
+    monkeypatch.setattr(ai_service, "get_client", lambda: None)
+    monkeypatch.setattr(ai_service, "_WARMUP_CONNECT", False)
+    problem_classifier._build_index.cache_clear()
+    before = dict(problem_classifier.stats)
+
+    asyncio.run(ai_service.warm_up())
+
+    assert problem_classifier.stats == before
+    assert problem_classifier._build_index.cache_info().currsize == 1
+
+
+def test_classify_after_warm_up_reuses_the_index(monkeypatch):
+    labels = {"backup_reliability": "Backup Reliability", "onboarding": "Onboarding"}
+    types = [f"{k}: {v}" for k, v in labels.items()]
+    problem_classifier._build_index.cache_clear()
+    problem_classifier.prepare(types, labels)
+    calls = problem_classifier.stats["calls"]
+
+    best, _, _ = problem_classifier.classify("the nightly veeam backup job failed again", types, labels)
+
+    assert best == "backup_reliability"
+    assert problem_classifier.stats["calls"] == calls + 1
+    assert problem_classifier._build_index.cache_info().hits >= 1
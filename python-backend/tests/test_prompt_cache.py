@@ -0,0 +1,50 @@
+import asyncio
+
+from services import ai_service, model_router
+
+
+def _breakpoints(system) -> list[bool]:
+    return ["cache_control" in block for block in system]
+
+
+def _capture_plan(monkeypatch) -> list[dict]:
+    seen = []
+
+    async def create(user_email="", **kwargs):
+        seen.append(kwargs)
+        return type("M", (), {"content": [type("B", (), {"text": '{"rephrasing": "r", "sql": null}'})()]})()
+
+    monkeypatch.setattr(ai_service, "_create", create)
+    return seen
+
+
+def test_short_prefixes_get_no_breakpoint(monkeypatch):
+    """Both prefixes are under every model's cache minimum, so cache_control would be ignored upstream."""
+    seen = _capture_plan(monkeypatch)
+    asyncio.run(ai_service.advise_plan("What should I do first?", []))
+    assert _breakpoints(seen[0]["system"]) == [False, False]
+
+    sql_calls = []
+
+    async def create_cached(endpoint, user_email="", **kwargs):
+        sql_calls.append(kwargs)
+        return "SELECT title FROM tasks WHERE user_id = '{user_id}' LIMIT 10"
+
+    monkeypatch.setattr(ai_service, "_create_cached", create_cached)
+    asyncio.run(ai_service.generate_sql("open high priority tasks", "tasks"))
+    assert _breakpoints(sql_calls[0]["system"]) == [False]
+
+
+def test_prefix_over_the_model_minimum_gets_a_breakpoint(monkeypatch):
+    seen = _capture_plan(monkeypatch)
+    monkeypatch.setattr(ai_service, "_ADVISE_PLAN_PREFIX", ai_service._ADVISE_PLAN_PREFIX + " stable catalog" * 800)
+    asyncio.run(ai_service.advise_plan("What should I do first?", []))
+    assert seen[0]["model"] == model_router.SONNET
+    # Breakpoint after the stable prefix only; tasks and date stay uncached
+    assert _breakpoints(seen[0]["system"]) == [True, False]
+
+
+def test_haiku_needs_a_longer_prefix():
+    prefix = "stable catalog " * 800  # ~1.6k tokens: enough for Sonnet, not for Haiku 4.5
+    assert _breakpoints(ai_service._cached_system(prefix, model=model_router.SONNET)) == [True]
+    assert _breakpoints(ai_service._cached_system(prefix, model=model_router.HAIKU)) == [False]
@@ -0,0 +1,15 @@
+from services import prompt_loader
+
+
+def test_suggestion_cues_prompt_builds_on_the_editable_prompt(monkeypatch):
+    monkeypatch.setattr(prompt_loader, "_loaded", True)
+    monkeypatch.setattr(prompt_loader, "_prompts", {"p-bruce-suggestions": "Operator wording: only count warranty notes."})
+    prompt = prompt_loader.get_suggestion_cues_prompt()
+    assert prompt.startswith("Operator wording: only count warranty notes.")
+    assert '"due_date": "YYYY-MM-DD"' in prompt
+
+
+def test_suggestion_cues_prompt_defaults_to_the_suggestions_default(monkeypatch):
+    monkeypatch.setattr(prompt_loader, "_loaded", True)
+    monkeypatch.setattr(prompt_loader, "_prompts", {})
+    assert prompt_loader.get_suggestion_cues_prompt().startswith(prompt_loader._DEFAULT_SUGGESTIONS)
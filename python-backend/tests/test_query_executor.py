@@ -0,0 +1,58 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from services import query_executor
+
+
+def _executor(handler):
+    executor = query_executor.SupabaseRpcExecutor("https://bruce.supabase.test", "anon-key")
+    executor._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return executor
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        query_executor.QueryExecutor()
+
+
+def test_user_id_comes_from_verified_token():
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.path, request.headers["authorization"], request.headers["apikey"]))
+        return httpx.Response(200, json={"id": "uid-123", "email": "jo@example.com"})
+
+    executor = _executor(handler)
+    assert asyncio.run(executor.authenticate("jwt-abc")) == "uid-123"
+    assert seen == [("/auth/v1/user", "Bearer jwt-abc", "anon-key")]
+    # Second check for the same token is served from the cache
+    assert asyncio.run(executor.authenticate("jwt-abc")) == "uid-123"
+    assert len(seen) == 1
+
+
+@pytest.mark.parametrize("token, status", [("", None), ("expired", 401)])
+def test_missing_or_rejected_token_raises(token, status):
+    executor = _executor(lambda request: httpx.Response(status, json={"msg": "invalid JWT"}))
+    with pytest.raises(query_executor.AuthError):
+        asyncio.run(executor.authenticate(token))
+
+
+def test_execute_never_falls_back_to_anon_key():
+    executor = _executor(lambda request: pytest.fail("no request without a token"))
+    with pytest.raises(query_executor.AuthError):
+        asyncio.run(executor.execute("SELECT 1", "uid-123", ""))
+
+
+def test_advise_without_token_is_401_before_any_model_call(monkeypatch):
+    query_executor.set_executor(_executor(lambda request: httpx.Response(401)))
+    monkeypatch.setattr(main.ai_service, "advise", lambda *a, **k: pytest.fail("model called"))
+    try:
+        client = TestClient(main.app)
+        assert client.post("/api/advise", json={"question": "q", "user_id": "someone-else"}).status_code == 401
+        assert client.post("/api/advise", json={"question": "q", "access_token": "bad"}).status_code == 401
+    finally:
+        query_executor.set_executor(None)
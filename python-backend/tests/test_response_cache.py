@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+import pytest
+
+from services import response_cache
+
+
+@pytest.fixture
+def disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "_DISK_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(response_cache, "_db", None)
+    monkeypatch.setenv("AI_CACHE_TTL_TEST", "60")
+    response_cache._memory.clear()
+    yield
+    response_cache.shutdown()
+    response_cache._memory.clear()
+    if response_cache._db is not None:
+        response_cache._db.close()
+
+
+def test_disk_tier_serves_entries_evicted_from_memory(disk):
+    response_cache.put("test", "k1", "cached text")
+    response_cache.flush()
+    response_cache._memory.clear()
+    assert asyncio.run(response_cache.get("test", "k1")) == "cached text"
+    assert response_cache.stats["test"]["disk_hits"] >= 1
+    # Promoted back into memory
+    assert "k1" in response_cache._memory
+
+
+def test_sqlite_never_runs_on_the_event_loop_thread(disk, monkeypatch):
+    threads = []
+    disk_get, write = response_cache._disk_get, response_cache._write
+
+    def record_get(key):
+        threads.append(("read", threading.current_thread().name))
+        return disk_get(key)
+
+    def record_write(db, batch):
+        threads.append(("write", threading.current_thread().name))
+        return write(db, batch)
+
+    monkeypatch.setattr(response_cache, "_disk_get", record_get)
+    monkeypatch.setattr(response_cache, "_write", record_write)
+
+    async def run():
+        response_cache.put("test", "k2", "v")
+        assert await response_cache.get("test", "missing") is None
+        return threading.current_thread().name
+
+    loop_thread = asyncio.run(run())
+    response_cache.flush()
+    assert ("write", "response-cache-writer") in threads
+    assert [kind for kind, name in threads if name == loop_thread] == []
+
+
+def test_clear_reaches_the_disk_tier(disk):
+    response_cache.put("test", "k3", "v")
+    response_cache.clear()
+    response_cache.flush()
+    assert asyncio.run(response_cache.get("test", "k3")) is None
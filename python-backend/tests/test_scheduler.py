@@ -0,0 +1,94 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import anthropic
+import httpx
+import pytest
+
+from services import scheduler
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(scheduler, "_CONFIGURED_LIMITS", {"m": {"rpm": 3, "tpm": 1000}})
+    monkeypatch.setattr(scheduler, "_budgets", {})
+    return scheduler._budget("m")
+
+
+def test_charge_is_corrected_to_reported_usage(limits):
+    entry = limits.charge(100.0, 900)
+    assert limits.tokens == 900
+    limits.settle(entry, 250)
+    assert limits.tokens == 250 and entry[1] == 250
+
+
+def test_window_expiry_returns_tokens_and_requests(limits):
+    limits.charge(100.0, 600)
+    limits.charge(110.0, 300)
+    assert limits.wait(120.0, 200) > 0
+    assert limits.wait(160.5, 200) == 0.0  # the 600-token call has left the window
+    assert limits.tokens == 300 and len(limits.calls) == 1
+
+
+def test_settling_an_expired_call_does_not_touch_the_window(limits):
+    old = limits.charge(100.0, 600)
+    limits.charge(150.0, 100)
+    limits.wait(161.0, 0)
+    limits.settle(old, 50)
+    assert limits.tokens == 100
+
+
+def test_token_and_request_limits_hold_until_the_oldest_call_expires(limits):
+    limits.charge(100.0, 800)
+    assert limits.wait(101.0, 300) == pytest.approx(59.0)
+    assert limits.wait(101.0, 200) == 0.0
+    limits.charge(101.0, 10)
+    limits.charge(102.0, 10)
+    assert limits.wait(103.0, 1) == pytest.approx(57.0)  # rpm 3 reached
+
+
+def test_first_call_is_admitted_even_if_larger_than_the_budget(limits):
+    assert limits.wait(100.0, 5000) == 0.0
+
+
+def test_slot_usage_counts_cache_writes(limits):
+    slot = scheduler.Slot("m", scheduler.INTERACTIVE, 900)
+    slot.entry = limits.charge(time.monotonic(), 900)
+    slot.usage(SimpleNamespace(input_tokens=100, output_tokens=40, cache_creation_input_tokens=60))
+    assert limits.tokens == 200
+
+
+def test_queued_call_is_admitted_when_the_window_frees(limits, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: clock[0])
+
+    async def run():
+        async with scheduler.slot("m", 900) as first:
+            first.usage(SimpleNamespace(input_tokens=700, output_tokens=200))
+        waiter = asyncio.ensure_future(scheduler._acquire("m", 500))
+        await asyncio.sleep(0)
+        assert not waiter.done()  # 900 + 500 > tpm
+        clock[0] += scheduler._WINDOW
+        scheduler._pump()
+        slot = await asyncio.wait_for(waiter, 1)
+        scheduler._release(slot)
+        return slot
+
+    slot = asyncio.run(run())
+    assert limits.tokens == 500 and slot.entry[1] == 500
+    assert scheduler._in_flight[scheduler.INTERACTIVE] == 0
+
+
+def test_estimate_includes_the_output_budget():
+    request = {"system": "x" * 400, "messages": [{"role": "user", "content": "y" * 400}], "max_tokens": 1024}
+    assert scheduler.estimate_tokens(request) == (len('"' + "x" * 400 + '"')
+                                                  + len('[{"role": "user", "content": "' + "y" * 400 + '"}]')) // 4 + 1024
+
+
+def test_rate_limit_pauses_the_whole_model(limits):
+    response = httpx.Response(429, headers={"retry-after": "7"}, request=httpx.Request("POST", "https://api.test"))
+    error = anthropic.RateLimitError("rate limited", response=response, body=None)
+    assert scheduler.retry_delay(error, 0, "m") == 0.0
+    assert limits.wait(time.monotonic(), 1) == pytest.approx(7.0, abs=0.5)
+    assert scheduler.retry_delay(error, scheduler.MAX_RETRIES, "m") is None
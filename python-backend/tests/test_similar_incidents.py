@@ -0,0 +1,76 @@
+from services import ai_service, similar_incidents
+
+_INCIDENTS = [
+    {"id": "i1", "task_number": 1, "title": "Printers jamming at the Holden nurses station",
+     "description": "Replaced rollers; VPN users printing remotely were also affected."},
+    {"id": "i2", "task_number": 2, "title": "Password reset for new CNA", "description": "Reset via AD."},
+    {"id": "i3", "task_number": 3, "title": "Backup job failed", "description": "Veeam retention full."},
+]
+
+
+def test_matched_words_are_shown_as_the_incident_wrote_them():
+    similar_incidents.sync("user-surface", _INCIDENTS)
+    best = similar_incidents.search("user-surface", "printer keeps jamming for a vpn user", 1)[0]
+    assert best["task_number"] == 1
+    # Stems are "printer", "jamm", "vpn", "user"; sentence-start capitals are dropped, acronyms kept
+    assert sorted(best["matched"]) == ["VPN", "jamming", "printers", "users"]
+    assert "jamm," not in ai_service._local_similarity(best)
+
+
+def test_search_ranks_by_shared_terms():
+    similar_incidents.sync("user-rank", _INCIDENTS)
+    results = similar_incidents.search("user-rank", "veeam backup failing", 3)
+    assert results[0]["task_number"] == 3
+
+
+def _resolved_db(path):
+    import sqlite3
+
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE incidents (id TEXT, user_id TEXT, title TEXT, description TEXT, task_number INT, "
+        "reported_by TEXT, priority TEXT, status TEXT, created_at TEXT)"
+    )
+    for user, inc in [("user-a", _INCIDENTS[0]), ("user-a", _INCIDENTS[2]), ("user-b", _INCIDENTS[1])]:
+        conn.execute(
+            "INSERT INTO incidents VALUES (?, ?, ?, ?, ?, NULL, NULL, 'resolved', '2026-01-01')",
+            (inc["id"], user, inc["title"], inc["description"], inc["task_number"]),
+        )
+    conn.commit()
+    conn.close()
+
+
+def test_similar_route_searches_only_the_verified_callers_index(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+    from services import query_executor
+
+    _resolved_db(tmp_path / "bruce.db")
+    executor = query_executor.SqliteExecutor(str(tmp_path / "bruce.db"))
+    queries = []
+    real_execute = executor.execute
+
+    async def execute(sql, user_id, access_token=""):
+        queries.append(user_id)
+        return await real_execute(sql, user_id, access_token)
+
+    monkeypatch.setattr(executor, "execute", execute)
+    query_executor.set_executor(executor)
+    similar_incidents.drop("user-a")
+    try:
+        client = TestClient(main.app)
+        body = {"task_name": "password reset", "rerank": False}
+        # A body user_id is ignored; without a token there is no index to pick
+        assert client.post("/api/similar", json={**body, "user_id": "user-b"}).status_code == 401
+
+        first = client.post("/api/similar", json={**body, "access_token": "user-a"}).json()
+        assert first["indexed"] == 2
+        assert [r["task_number"] for r in first["results"]] == []  # user-b's reset is not visible
+        second = client.post("/api/similar", json={**body, "task_name": "backup failed", "access_token": "user-a"})
+        assert [r["task_number"] for r in second.json()["results"]] == [3]
+        # The backend loaded user-a's resolved incidents itself, once, while the index was fresh
+        assert queries == ["user-a"]
+    finally:
+        query_executor.set_executor(None)
+        similar_incidents.drop("user-a")
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from services import ai_service
+
+_REQUEST = {"model": "claude-sonnet-4-6", "max_tokens": 64, "messages": [{"role": "user", "content": "map a drive"}]}
+
+
+def test_identical_concurrent_requests_share_one_upstream_call(stub_client):
+    async def run():
+        stub_client.gate = asyncio.Event()
+        waiters = [asyncio.create_task(ai_service._create(**_REQUEST)) for _ in range(3)]
+        await asyncio.sleep(0)
+        stub_client.gate.set()
+        return await asyncio.gather(*waiters)
+
+    coalesced = ai_service.stats["coalesced_calls"]
+    replies = asyncio.run(run())
+    assert len(stub_client.calls) == 1
+    assert {r.content[0].text for r in replies} == {"stub reply"}
+    assert ai_service.stats["coalesced_calls"] == coalesced + 2
+    assert ai_service._inflight == {}
+
+
+def test_cancelling_one_waiter_leaves_the_shared_call_running(stub_client):
+    async def run():
+        stub_client.gate = asyncio.Event()
+        first = asyncio.create_task(ai_service._create(**_REQUEST))
+        second = asyncio.create_task(ai_service._create(**_REQUEST))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        stub_client.gate.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    reply = asyncio.run(run())
+    assert reply.content[0].text == "stub reply"
+    assert len(stub_client.calls) == 1 and stub_client.cancelled == 0
+
+
+def test_the_shared_call_is_cancelled_once_every_waiter_is_gone(stub_client):
+    async def run():
+        stub_client.gate = asyncio.Event()
+        waiters = [asyncio.create_task(ai_service._create(**_REQUEST)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for w in waiters:
+            w.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert stub_client.cancelled == 1
+
+
+def test_a_failure_reaches_every_waiter(stub_client):
+    async def run():
+        stub_client.gate = asyncio.Event()
+        stub_client.error = ValueError("upstream broke")
+        waiters = [asyncio.create_task(ai_service._create(**_REQUEST)) for _ in range(3)]
+        await asyncio.sleep(0)
+        stub_client.gate.set()
+        return await asyncio.gather(*waiters, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert len(stub_client.calls) == 1
+    assert [type(r) for r in results] == [ValueError] * 3
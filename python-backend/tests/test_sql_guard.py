@@ -0,0 +1,125 @@
+import pytest
+
+from services import sql_guard
+
+ASSETS = {"assets"}
+BOTH = {"incidents", "assets"}
+UID = "'{user_id}'"
+
+
+def _check(sql, tables=ASSETS):
+    return sql_guard.check(sql, tables)
+
+
+def _filtered(result, column="user_id"):
+    """True if the rewritten query starts its WHERE with the added user_id filter."""
+    return "added user_id filter" in result["rewrites"] and f"WHERE {column} = {UID} AND (" in result["sql"]
+
+
+def test_accepts_filtered_query_unchanged():
+    sql = f"SELECT name FROM assets WHERE user_id = {UID} AND name = 'Printer' LIMIT 20"
+    assert _check(sql) == {"sql": sql, "flags": [], "rewrites": []}
+
+
+def test_adds_missing_filter_and_limit():
+    result = _check("SELECT name FROM assets WHERE name = 'Printer' ORDER BY name")
+    assert result["sql"] == f"SELECT name FROM assets WHERE user_id = {UID} AND ( name = 'Printer' ) ORDER BY name LIMIT 200"
+
+
+@pytest.mark.parametrize("sql", [
+    f"SELECT * FROM assets WHERE user_id = {UID} UNION ALL TABLE assets",
+    f"SELECT * FROM assets WHERE user_id = {UID} UNION ALL (TABLE assets)",
+    f"SELECT * FROM assets WHERE user_id = {UID}; DELETE FROM assets",
+    f"UPDATE assets SET name = 'x' WHERE user_id = {UID}",
+    "WITH gone AS (DELETE FROM assets RETURNING *) SELECT * FROM gone",
+    f"SELECT * INTO stolen FROM assets WHERE user_id = {UID}",
+    f"SELECT pg_sleep(30) FROM assets WHERE user_id = {UID}",
+    "SELECT * FROM auth.users",
+    f"SELECT * FROM tasks WHERE user_id = {UID}",
+    f"SELECT * FROM assets WHERE user_id = {UID} FOR UPDATE",
+])
+def test_rejects_unsafe_statements(sql):
+    with pytest.raises(sql_guard.UnsafeSqlError):
+        _check(sql)
+
+
+@pytest.mark.parametrize("where", [
+    f"NOT (user_id = {UID})",
+    f"user_id = {UID} IS NOT TRUE",
+    f"user_id = {UID} = false",
+    f"(user_id = {UID}) IS NULL",
+    f"CASE WHEN true THEN true ELSE user_id = {UID} END",
+    f"user_id = {UID} OR true",
+    f"true OR user_id = {UID}",
+    f"name BETWEEN 'a' AND user_id = {UID}",
+])
+def test_filter_that_does_not_restrict_rows_is_not_trusted(where):
+    # A single table gets the real filter put in front; nothing else can bypass it
+    assert _filtered(_check(f"SELECT * FROM assets WHERE {where}"))
+
+
+@pytest.mark.parametrize("where", [
+    f"NOT (a.user_id = {UID}) AND i.user_id = {UID}",
+    f"a.user_id = {UID} IS NOT TRUE AND i.user_id = {UID}",
+    f"a.user_id = {UID} = false AND i.user_id = {UID}",
+    f"(a.user_id = {UID}) IS NULL AND i.user_id = {UID}",
+    f"CASE WHEN true THEN true ELSE a.user_id = {UID} END AND i.user_id = {UID}",
+    f"a.user_id = {UID} AND i.user_id = {UID} OR true",
+])
+def test_join_with_non_restricting_filter_is_rejected(where):
+    with pytest.raises(sql_guard.UnsafeSqlError, match="missing user_id"):
+        _check(f"SELECT * FROM assets a JOIN incidents i ON i.asset_id = a.id WHERE {where}", BOTH)
+
+
+def test_inner_join_on_filter_counts_but_outer_join_does_not():
+    inner = f"SELECT * FROM assets a JOIN incidents i ON i.user_id = {UID} WHERE a.user_id = {UID} LIMIT 5"
+    assert _check(inner, BOTH)["sql"] == inner
+    with pytest.raises(sql_guard.UnsafeSqlError):
+        _check(f"SELECT * FROM assets a RIGHT JOIN incidents i ON i.user_id = {UID} WHERE a.user_id = {UID}", BOTH)
+
+
+def test_parenthesized_join_is_rejected():
+    with pytest.raises(sql_guard.UnsafeSqlError):
+        _check(f"SELECT a.* FROM (assets a JOIN incidents i ON true) WHERE i.user_id = {UID}", BOTH)
+
+
+def test_between_and_is_not_a_separator():
+    sql = f"SELECT * FROM assets WHERE user_id = {UID} AND name BETWEEN 'a' AND 'm' LIMIT 5"
+    assert _check(sql)["rewrites"] == []
+
+
+def test_columns_named_like_keywords_are_readable():
+    sql = f"SELECT comment, set FROM assets WHERE user_id = {UID} AND comment IS NOT NULL LIMIT 5"
+    assert _check(sql)["sql"] == sql
+
+
+@pytest.mark.parametrize("limit", ["'100000'", "'5'"])
+def test_string_limit_is_rejected(limit):
+    with pytest.raises(sql_guard.UnsafeSqlError, match="LIMIT must be a number"):
+        _check(f"SELECT * FROM assets WHERE user_id = {UID} LIMIT {limit}")
+
+
+def test_limit_is_clamped_and_limit_all_replaced():
+    assert _check(f"SELECT * FROM assets WHERE user_id = {UID} LIMIT 5000")["sql"].endswith("LIMIT 200")
+    assert _check(f"SELECT * FROM assets WHERE user_id = {UID} LIMIT ALL")["sql"].endswith("LIMIT 200")
+
+
+def test_shape_cache_keeps_literal_kind():
+    sql_guard._shapes.clear()
+    base = f"SELECT * FROM assets WHERE user_id = {UID}"
+    assert _check(f"{base} LIMIT 10")["sql"].endswith("LIMIT 10")
+    with pytest.raises(sql_guard.UnsafeSqlError):
+        _check(f"{base} LIMIT '5'")
+
+    assert _check(f"{base} AND name ILIKE 'abc%'")["flags"] == []
+    assert _check(f"{base} AND name ILIKE '%abc'")["flags"] == ["leading_wildcard"]
+    assert _check(f"{base} AND name ILIKE 'xyz%'")["flags"] == []
+
+
+def test_repeat_shape_is_served_from_cache():
+    sql_guard._shapes.clear()
+    hits = sql_guard.stats["shape_cache_hits"]
+    _check(f"SELECT * FROM assets WHERE user_id = {UID} AND name = 'a'")
+    result = _check(f"SELECT * FROM assets WHERE user_id = {UID} AND name = 'b'")
+    assert sql_guard.stats["shape_cache_hits"] == hits + 1
+    assert result["sql"] == f"SELECT * FROM assets WHERE user_id = {UID} AND name = 'b' LIMIT 200"
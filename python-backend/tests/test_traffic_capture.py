@@ -0,0 +1,87 @@
+import json
+
+from services import traffic_capture
+
+
+class _Lines:
+    def __init__(self):
+        self.lines = []
+
+    def info(self, line):
+        self.lines.append(line)
+
+
+def _captured(record, monkeypatch):
+    logger = _Lines()
+    monkeypatch.setattr(traffic_capture, "_logger", logger)
+    traffic_capture._write(record)
+    return json.loads(logger.lines[0])
+
+
+def test_secret_fields_are_redacted_at_any_depth(monkeypatch):
+    record = {
+        "path": "/api/advise",
+        "request": {
+            "question": "printer jams",
+            "access_token": "eyJhbGciOiJIUzI1NiJ9.payload.sig",
+            "nested": [{"Authorization": "Bearer abc", "apikey": "anon", "refresh_token": "r", "api_key": "k"}],
+        },
+        "upstream": [{"usage": {"input_tokens": 12, "output_tokens": 3}, "first_token_ms": 40.0,
+                      "request": {"max_tokens": 512}}],
+        "stages": {"first_token": 180.5, "parse": 0.4},
+    }
+    line = _captured(record, monkeypatch)
+    assert line["request"]["question"] == "printer jams"
+    assert line["request"]["access_token"] == "[redacted]"
+    assert set(line["request"]["nested"][0].values()) == {"[redacted]"}
+    assert line["upstream"][0]["usage"] == {"input_tokens": 12, "output_tokens": 3}
+    assert line["upstream"][0]["first_token_ms"] == 40.0
+    assert line["upstream"][0]["request"]["max_tokens"] == 512
+    assert line["stages"] == {"first_token": 180.5, "parse": 0.4}
+    assert "eyJhbGci" not in json.dumps(line)
+
+
+def test_user_ids_and_emails_are_pseudonymized_stably(monkeypatch):
+    record = {"request": {"user_id": "5f0c-uuid", "email": "Jo@Example.com", "text": "cc jo@example.com"}}
+    line = _captured(record, monkeypatch)
+    assert line["request"]["user_id"].startswith("user-") and "5f0c" not in line["request"]["user_id"]
+    assert line["request"]["email"] == line["request"]["text"].split()[-1]
+    assert line["request"]["email"].endswith("@redacted.invalid")
+    assert _captured(record, monkeypatch) == line
+
+
+def test_replay_acts_as_the_captured_user(monkeypatch, tmp_path):
+    """The token is redacted, but the verified user is kept and replay sends it to the stand-in executor."""
+    import asyncio
+
+    from fastapi.testclient import TestClient
+
+    import main
+    from bench import replay
+    from services import ai_service, query_executor
+
+    logger = _Lines()
+    monkeypatch.setattr(traffic_capture, "_logger", logger)
+    replay._stand_in_db(str(tmp_path / "lookups.db"))
+    executor = query_executor.SqliteExecutor(str(tmp_path / "lookups.db"))
+    query_executor.set_executor(executor)
+
+    async def advise(question, tasks, run_query, user_email="", speculative=None):
+        return {"rows": await run_query(ai_service._RESOLVED_INCIDENTS_SQL)}
+
+    monkeypatch.setattr(main.ai_service, "advise", advise)
+    try:
+        client = TestClient(main.app)
+        assert client.post("/api/advise", json={"question": "q", "access_token": "uid-1"}).status_code == 200
+        record = json.loads(logger.lines[0])
+        assert record["request"]["access_token"] == "[redacted]"
+        assert record["user_id"] == traffic_capture._pseudonym("uid-1")
+
+        auth = replay.Counter()
+        body = replay._request_body(record, auth)
+        assert body["access_token"] == record["user_id"] and auth == {"mapped": 1}
+        assert asyncio.run(executor.authenticate(body["access_token"])) == record["user_id"]
+        # Lookups against the empty stand-in run and find nothing instead of failing
+        assert client.post("/api/advise", json=body).json() == {"rows": []}
+    finally:
+        query_executor.set_executor(None)
@@ -30,53 +30,31 @@ export async function POST(request: NextRequest) {
   const backendUrl = process.env.PYTHON_BACKEND_URL || 'http://localhost:8000';
   const taskContext = inProgressTasks ?? [];
 
-  // ── Pass 1: plan — get rephrasing + optional SQL ──────────────────────────
-  let plan: { rephrasing: string; sql: string | null; lookup_description: string | null };
-  try {
-    const res = await fetch(`${backendUrl}/api/advise/plan`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({
-        question: question.trim(),
-        in_progress_tasks: taskContext,
-        user_email: user.email ?? '',
-      }),
-    });
-    if (!res.ok) throw new Error('Backend unavailable');
-    plan = await res.json();
-  } catch {
-    return NextResponse.json(
-      { error: 'AI advisor requires the Python backend to be running.' },
-      { status: 503 }
-    );
-  }
-
-  // ── Run SQL if the AI requested additional data ───────────────────────────
-  let sqlResults: Record<string, unknown>[] = [];
-  const rawSql = plan.sql ?? null;
-  if (rawSql) {
-    const safeSql = rawSql.replace(/\{user_id\}/g, user.id).replace(/;+$/, '');
-    const { data } = await supabase.rpc('execute_select_query', { query_sql: safeSql });
-    sqlResults = Array.isArray(data) ? data : (data ? [data] : []);
-  }
+  // Plan, SQL lookup and answer all run in one backend call. The backend verifies
+  // our access token with Supabase Auth and takes the user id from it.
+  const { data: { session } } = await supabase.auth.getSession();
 
-  // ── Pass 2: answer — using in-progress tasks + SQL results ────────────────
-  let answer: string;
+  let result: {
+    rephrasing: string;
+    lookup_description: string | null;
+    sql: string | null;
+    supporting_data: Record<string, unknown>[];
+    answer: string;
+  };
   try {
-    const res = await fetch(`${backendUrl}/api/advise/answer`, {
+    const res = await fetch(`${backendUrl}/api/advise`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
         question: question.trim(),
         in_progress_tasks: taskContext,
-        lookup_description: plan.lookup_description ?? null,
-        sql_results: sqlResults,
+        access_token: session?.access_token ?? '',
         user_email: user.email ?? '',
       }),
     });
+    if (res.status === 401) return NextResponse.json({ error: 'Unauthorized' }, { status: 401 });
     if (!res.ok) throw new Error('Backend unavailable');
-    const data = await res.json();
-    answer = data.answer;
+    result = await res.json();
   } catch {
     return NextResponse.json(
       { error: 'AI advisor requires the Python backend to be running.' },
@@ -85,10 +63,10 @@ export async function POST(request: NextRequest) {
   }
 
   return NextResponse.json({
-    rephrasing:        plan.rephrasing,
-    lookupDescription: plan.lookup_description ?? null,
-    sql:               rawSql,
-    supportingData:    sqlResults,
-    answer,
+    rephrasing:        result.rephrasing,
+    lookupDescription: result.lookup_description ?? null,
+    sql:               result.sql ?? null,
+    supportingData:    result.supporting_data ?? [],
+    answer:            result.answer,
   });
 }
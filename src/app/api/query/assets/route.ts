@@ -27,6 +27,10 @@ export async function POST(request: NextRequest) {
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ question: question.trim(), target: 'assets', user_email: user.email ?? '' }),
     });
+    if (res.status === 422) {
+      const { detail } = await res.json();
+      return NextResponse.json({ error: detail }, { status: 422 });
+    }
     if (!res.ok) throw new Error('Backend unavailable');
     const json = await res.json();
     generatedSql = json.sql;
@@ -19,63 +19,41 @@ export async function POST(request: NextRequest) {
   const { taskName, elaboration } = await request.json();
   if (!taskName?.trim()) return NextResponse.json({ error: 'Task name required' }, { status: 400 });
 
-  // Get all resolved tasks
-  const { data: resolved } = await supabase
-    .from('incidents')
-    .select('id, title, description, task_number, reported_by, priority')
-    .eq('user_id', user.id)
-    .eq('status', 'resolved')
-    .order('created_at', { ascending: false });
-
-  if (!resolved || resolved.length === 0) {
-    return NextResponse.json({ results: [], message: 'No resolved tasks to compare against yet.' });
-  }
-
-  const taskList = resolved
-    .map(t => `#${t.task_number}: "${t.title || t.description}"${t.reported_by ? ` (customer: ${t.reported_by})` : ''}`)
-    .join('\n');
-
-  const prompt = `An IT technician wants to find past tasks similar to this one:
-Task: "${taskName}"${elaboration ? `\nAdditional context: "${elaboration}"` : ''}
-
-Past resolved tasks:
-${taskList}
-
-For each past task with a meaningful similarity or an interesting contrast worth noting, return a JSON array:
-[{"task_number": 3, "similarity": "One or two sentences describing how it is similar and/or dissimilar."}]
-
-Only include tasks with genuine relevance. If none qualify, return [].
-Respond with only the JSON array, no other text.`;
+  // The backend verifies our access token with Supabase Auth, takes the user id
+  // from it and searches its own index of that user's resolved tasks (reloading
+  // them itself when stale), so nothing but the new task goes over the wire.
+  const { data: { session } } = await supabase.auth.getSession();
 
   try {
     const backendUrl = process.env.PYTHON_BACKEND_URL || 'http://localhost:8000';
-    const res = await fetch(`${backendUrl}/api/ask`, {
+    const res = await fetch(`${backendUrl}/api/similar`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
-        prompt,
-        system: 'You are a helpful IT assistant. Respond only with the requested JSON array.',
+        task_name: taskName,
+        elaboration: elaboration || null,
+        access_token: session?.access_token ?? '',
+        top_k: 8,
+        rerank: true,
         user_email: user.email ?? '',
       }),
     });
 
+    if (res.status === 401) return NextResponse.json({ error: 'Unauthorized' }, { status: 401 });
     if (!res.ok) throw new Error('Backend unavailable');
-    const { text } = await res.json();
-
-    const parsed = JSON.parse(text.trim());
-    const results = parsed
-      .map((item: { task_number: number; similarity: string }) => {
-        const task = resolved.find(t => t.task_number === item.task_number);
-        return task ? {
-          id:          task.id,
-          task_number: task.task_number,
-          title:       task.title || task.description,
-          similarity:  item.similarity,
-        } : null;
-      })
-      .filter(Boolean);
-
-    return NextResponse.json({ results });
+    const { results, indexed } = await res.json();
+    if (!indexed) {
+      return NextResponse.json({ results: [], message: 'No resolved tasks to compare against yet.' });
+    }
+
+    return NextResponse.json({
+      results: results.map((r: { id: string; task_number: number; title: string; similarity: string }) => ({
+        id:          r.id,
+        task_number: r.task_number,
+        title:       r.title,
+        similarity:  r.similarity,
+      })),
+    });
   } catch {
     return NextResponse.json(
       { error: 'AI search requires the Python backend to be running.' },
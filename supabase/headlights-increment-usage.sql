@@ -0,0 +1,51 @@
+-- Run this in the Headlights Supabase SQL Editor (not the Bruce project).
+--
+-- Atomic, batched usage increments for python-backend/services/headlights_tracker.py.
+-- The tracker sums per-user deltas in memory and posts them here in one call:
+--   POST /rest/v1/rpc/bruce_increment_usage  {"deltas": [{"email": ..., "clicks": 1, ...}, ...]}
+-- Each row is updated with x = x + delta, so concurrent workers never lose counts.
+-- Until this function exists the tracker falls back to per-user read-modify-write.
+
+-- Prompt-cache token counters (cache reads/writes are billed apart from input_tokens)
+alter table user_accounts add column if not exists cache_read_tokens  bigint default 0;
+alter table user_accounts add column if not exists cache_write_tokens bigint default 0;
+
+create or replace function bruce_increment_usage(deltas jsonb)
+returns void
+language plpgsql
+as $$
+declare
+  d jsonb;
+begin
+  for d in select * from jsonb_array_elements(deltas) loop
+    update user_accounts set
+      input_tokens  = coalesce(input_tokens, 0)  + coalesce((d->>'input_tokens')::bigint, 0),
+      output_tokens = coalesce(output_tokens, 0) + coalesce((d->>'output_tokens')::bigint, 0),
+      cache_read_tokens  = coalesce(cache_read_tokens, 0)  + coalesce((d->>'cache_read_tokens')::bigint, 0),
+      cache_write_tokens = coalesce(cache_write_tokens, 0) + coalesce((d->>'cache_write_tokens')::bigint, 0),
+      sessions      = coalesce(sessions, 0)      + coalesce((d->>'sessions')::bigint, 0),
+      uploads       = coalesce(uploads, 0)       + coalesce((d->>'uploads')::bigint, 0),
+      clicks        = coalesce(clicks, 0)        + coalesce((d->>'clicks')::bigint, 0)
+    where app_id = 'bruce' and email = d->>'email';
+
+    if not found then
+      insert into user_accounts
+        (id, app_id, email, sessions, uploads, clicks, credits, revenue, cost,
+         input_tokens, output_tokens, cache_read_tokens, cache_write_tokens)
+      values (
+        'br-' || floor(extract(epoch from now()))::bigint || '-' || substr(md5(d->>'email'), 1, 6),
+        'bruce',
+        d->>'email',
+        coalesce((d->>'sessions')::bigint, 0),
+        coalesce((d->>'uploads')::bigint, 0),
+        coalesce((d->>'clicks')::bigint, 0),
+        0, 0, 0,
+        coalesce((d->>'input_tokens')::bigint, 0),
+        coalesce((d->>'output_tokens')::bigint, 0),
+        coalesce((d->>'cache_read_tokens')::bigint, 0),
+        coalesce((d->>'cache_write_tokens')::bigint, 0)
+      );
+    end if;
+  end loop;
+end;
+$$;